@@ -0,0 +1,169 @@
+"""Microbenchmarks for the local (non-LLM) hot paths at several input sizes.
+
+    python benchmarks/bench_hot_paths.py --json results.json
+    python benchmarks/bench_hot_paths.py --compare results.json --only try_parse_json
+
+Covers segmentation (``split_dialog``, ``chunk_split``), ``try_parse_json`` on large,
+fenced, malformed and truncated replies, ``_normalize_codebook_payload``,
+``saturation``, the deductive pre-pass over a 200-entry codebook, pydantic
+validation of ``OpenCodingItem`` lists and ``emit_html``.
+Inputs come from ``synthetic.py`` and are identical between runs. Each case is timed
+``--repeat`` times and the best and median times are kept. ``--compare`` prints the
+ratio against an earlier results file and exits with status 1 when a case got slower
+than ``--threshold``.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from gtflow.models.schemas import Codebook, OpenCodingItem  # noqa: E402
+from gtflow.pipeline.codebook_builder import _normalize_codebook_payload  # noqa: E402
+from gtflow.pipeline.deductive_coder import deductive_pass  # noqa: E402
+from gtflow.pipeline.gioia_view import to_gioia  # noqa: E402
+from gtflow.pipeline.report_html import emit_html  # noqa: E402
+from gtflow.pipeline.saturation import saturation  # noqa: E402
+from gtflow.utils.json_utils import try_parse_json  # noqa: E402
+from gtflow.utils.text_utils import chunk_split, split_dialog  # noqa: E402
+
+SIZES = (100, 1_000, 10_000)
+_ITEMS = TypeAdapter(List[OpenCodingItem])
+
+
+def _parse_or_fail(reply: str) -> None:
+    try:
+        try_parse_json(reply)
+    except ValueError:
+        pass  # truncated replies are expected to fail; the benchmark times the failure
+
+
+def _deductive_pass(size: int) -> Callable[[], Any]:
+    segments = [{"seg_id": str(i), "text": text} for i, (_, text) in enumerate(split_dialog(synthetic.transcript(size), 800))]
+    codebook = Codebook.model_validate(_normalize_codebook_payload(synthetic.codebook_payload(200)))
+    return lambda: deductive_pass(segments, codebook)
+
+
+def _emit_html(size: int) -> Callable[[], Any]:
+    items = synthetic.open_coding_items(size)
+    codebook = Codebook.model_validate(_normalize_codebook_payload(synthetic.codebook_payload(max(8, size // 10))))
+    triples = synthetic.axial_triples(size)
+    stats = {"segments": size, "open_codes": size * 2, "codebook_entries": len(codebook.entries), "triples": size}
+    out_path = os.path.join(tempfile.mkdtemp(prefix="gtflow_bench_"), "report.html")
+    return lambda: emit_html(out_path, stats, to_gioia(codebook), triples, items, codebook)
+
+
+# case name -> (unit of the size, setup(size) returning the callable to time)
+CASES: Dict[str, Tuple[str, Callable[[int], Callable[[], Any]]]] = {
+    "split_dialog": ("turns", lambda n: (lambda text=synthetic.transcript(n): split_dialog(text, 800))),
+    "split_dialog_tokens": ("turns", lambda n: (lambda text=synthetic.transcript(n): split_dialog(text, 800, 300))),
+    "chunk_split_mixed": ("kchars", lambda n: (lambda text=synthetic.synthetic_text(n * 1000, "mixed"): chunk_split(text, 800))),
+    "try_parse_json_clean": ("items", lambda n: (lambda reply=synthetic.llm_reply(synthetic.open_coding_items(n)): try_parse_json(reply))),
+    "try_parse_json_fenced": ("items", lambda n: (lambda reply=synthetic.llm_reply(synthetic.open_coding_items(n), "fenced"): try_parse_json(reply))),
+    "try_parse_json_repaired": ("items", lambda n: (lambda reply=synthetic.llm_reply(synthetic.open_coding_items(n), "trailing_commas"): try_parse_json(reply))),
+    "try_parse_json_truncated": ("items", lambda n: (lambda reply=synthetic.llm_reply(synthetic.open_coding_items(n), "truncated"): _parse_or_fail(reply))),
+    "normalize_codebook_payload": ("entries", lambda n: (lambda payload=synthetic.codebook_payload(n): _normalize_codebook_payload(payload))),
+    "normalize_codebook_reply": ("entries", lambda n: (lambda reply=synthetic.llm_reply(synthetic.codebook_payload(n), "fenced"): _normalize_codebook_payload(reply))),
+    "saturation": ("items", lambda n: (lambda items=synthetic.open_coding_items(n): saturation(items))),
+    "validate_open_coding_items": ("items", lambda n: (lambda items=synthetic.open_coding_items(n): _ITEMS.validate_python(items))),
+    "deductive_pass": ("turns", _deductive_pass),
+    "emit_html": ("items", _emit_html),
+}
+
+
+def time_case(fn: Callable[[], Any], repeat: int) -> List[float]:
+    fn()  # warm-up: compiled regexes, pydantic validators, template caches
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _git_revision() -> str:
+    try:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=root, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def run(names: List[str], sizes: List[int], repeat: int) -> Dict[str, Any]:
+    results = []
+    for name in names:
+        unit, setup = CASES[name]
+        for size in sizes:
+            times = time_case(setup(size), repeat)
+            best = min(times)
+            results.append(
+                {
+                    "case": name,
+                    "size": size,
+                    "unit": unit,
+                    "best_sec": round(best, 6),
+                    "median_sec": round(statistics.median(times), 6),
+                    "us_per_unit": round(best / size * 1e6, 3),
+                }
+            )
+            print(f"{name:>28}  {size:>7} {unit:<7}  best {best * 1000:10.3f} ms  median {statistics.median(times) * 1000:10.3f} ms")
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> int:
+    """Print best-time ratios against ``baseline``; returns the number of regressions."""
+    before = {(r["case"], r["size"]): r["best_sec"] for r in baseline["results"]}
+    regressions = 0
+    print(f"\nagainst {baseline.get('revision', '?')} ({baseline.get('created', '?')}), slower than x{threshold} flagged:")
+    for row in current["results"]:
+        old = before.get((row["case"], row["size"]))
+        if not old:
+            continue
+        ratio = row["best_sec"] / old
+        flag = "  REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{row['case']:>28}  {row['size']:>7}  x{ratio:6.2f}{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma-separated input sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", action="append", choices=sorted(CASES), help="Run only this case (repeatable)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    current = run(args.only or list(CASES), [int(s) for s in args.sizes.split(",")], args.repeat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Throughput and cut quality of the segmenter on large synthetic transcripts.
+
+    python benchmarks/bench_segmentation.py --size-mb 5 --max-chars 800
+
+Reports, per language mix and length measure, the time spent in ``chunk_split``,
+the throughput, and the share of chunks that end on a sentence boundary.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gtflow.utils.text_utils import chunk_split  # noqa: E402
+from synthetic import synthetic_text  # noqa: E402
+
+
+def run(size_mb: float, max_chars: int, max_tokens: int) -> list:
+    results = []
+    for mix in ("en", "zh", "mixed"):
+        text = synthetic_text(int(size_mb * 1_000_000), mix)
+        for label, tokens in (("chars", None), ("tokens", max_tokens)):
+            start = time.perf_counter()
+            chunks = chunk_split(text, max_chars, tokens)
+            elapsed = time.perf_counter() - start
+            on_boundary = sum(1 for c in chunks if c.rstrip("\"'”’").endswith((".", "?", "!", ";", "。", "？", "！", "；", "…")))
+            results.append(
+                {
+                    "mix": mix,
+                    "measure": label,
+                    "chars": len(text),
+                    "chunks": len(chunks),
+                    "seconds": round(elapsed, 3),
+                    "mb_per_sec": round(len(text) / 1_000_000 / elapsed, 2),
+                    "sentence_end_share": round(on_boundary / len(chunks), 3),
+                    "avg_chunk_chars": round(sum(map(len, chunks)) / len(chunks), 1),
+                }
+            )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=5.0)
+    parser.add_argument("--max-chars", type=int, default=800)
+    parser.add_argument("--max-tokens", type=int, default=300)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+    results = run(args.size_mb, args.max_chars, args.max_tokens)
+    header = list(results[0])
+    print("  ".join(f"{h:>18}" for h in header))
+    for row in results:
+        print("  ".join(f"{row[h]!s:>18}" for h in header))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Deterministic synthetic corpora for the benchmarks.
+
+Everything is generated from a seed, so two runs (and two versions of gtflow) see
+exactly the same inputs. Sizes are counts of segments/items/entries, except for
+``synthetic_text`` which takes a character count.
+"""
+from __future__ import annotations
+
+import json
+import random
+import re
+from typing import Any, Dict, List
+
+_LATIN = "we had some trouble with deadlines but the team adapted quickly after the manager stepped in".split()
+_CJK = "我们 遇到 一些 困难 但是 团队 很快 适应 了 项目 经理 介入 之后 情况 好转".split()
+_LATIN_END = [".", "?", "!", ";", "...", '."']
+_CJK_END = ["。", "？", "！", "；", "……", "。”"]
+_SPEAKERS = ["Interviewer", "P1", "P2", "受访者", "访谈者"]
+_CODE_WORDS = "workload deadline support trust conflict autonomy feedback learning burnout recognition".split()
+_CODE_WORDS_ZH = "工作压力 时间紧迫 领导支持 信任 冲突 自主 反馈 学习 倦怠 认可".split()
+
+
+def synthetic_text(chars: int, mix: str, seed: int = 7) -> str:
+    """Run-on prose of about ``chars`` characters; ``mix`` is ``en``, ``zh`` or ``mixed``."""
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < chars:
+        cjk = mix == "zh" or (mix == "mixed" and rng.random() < 0.5)
+        words, ends, sep = (_CJK, _CJK_END, "") if cjk else (_LATIN, _LATIN_END, " ")
+        sentence = sep.join(rng.choice(words) for _ in range(rng.randint(4, 30)))
+        if rng.random() < 0.3:
+            sentence += ("，" if cjk else ", ") + sep.join(rng.choice(words) for _ in range(rng.randint(3, 12)))
+        sentence += rng.choice(ends) + ("" if cjk else " ")
+        parts.append(sentence)
+        size += len(sentence)
+    return "".join(parts)
+
+
+def transcript(turns: int, seed: int = 7) -> str:
+    """An interview transcript of ``Speaker: text`` turns; some turns wrap onto
+    continuation lines and a few are long enough to be chunked."""
+    rng = random.Random(seed)
+    lines: List[str] = []
+    for i in range(turns):
+        speaker = _SPEAKERS[0] if i % 2 == 0 else rng.choice(_SPEAKERS[1:])
+        length = rng.choice([40, 120, 300, 1500]) if i % 2 else rng.choice([30, 80])
+        body = synthetic_text(length, rng.choice(["en", "zh", "mixed"]), seed=seed * 1000 + i)
+        if rng.random() < 0.2:
+            cut = len(body) // 2
+            body = body[:cut] + "\n" + body[cut:]
+        lines.append(f"{speaker}: {body}")
+    return "\n".join(lines)
+
+
+def code_vocabulary(size: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    words = _CODE_WORDS + _CODE_WORDS_ZH
+    return [f"{rng.choice(words)}_{rng.choice(words)}_{i}" for i in range(size)]
+
+
+def open_coding_items(count: int, vocabulary: int = 0, seed: int = 7) -> List[Dict[str, Any]]:
+    """``count`` OpenCodingItem dicts. Codes are drawn from a vocabulary of
+    ``vocabulary`` codes (default ``count // 4``) with a skew towards early codes, so
+    the new-code rate falls the way it does in real runs."""
+    rng = random.Random(seed)
+    codes = code_vocabulary(vocabulary or max(8, count // 4), seed)
+    items = []
+    for i in range(count):
+        n_codes = rng.randint(1, 4)
+        picked = [codes[min(len(codes) - 1, int(rng.paretovariate(1.2)) - 1 + rng.randint(0, i // 8))] for _ in range(n_codes)]
+        items.append(
+            {
+                "seg_id": f"{i + 1:04d}",
+                "in_vivo_phrases": [synthetic_text(20, "mixed", seed + i)[:30] for _ in range(rng.randint(0, 2))],
+                "initial_codes": [
+                    {"code": code, "definition": f"Participant talks about {code}.", "evidence_span": synthetic_text(40, "en", seed + i)[:60]}
+                    for code in picked
+                ],
+                "quick_memo": synthetic_text(60, "mixed", seed + i)[:80] if rng.random() < 0.5 else None,
+            }
+        )
+    return items
+
+
+def llm_reply(payload: Any, style: str = "clean", seed: int = 7) -> str:
+    """Render ``payload`` the way models actually answer.
+
+    ``clean``: plain JSON; ``fenced``: in a ```json fence after some prose;
+    ``trailing_commas``: fenced, with trailing commas and raw newlines inside strings
+    (the repair path of ``try_parse_json``); ``truncated``: cut off mid-document.
+    """
+    text = json.dumps(payload, ensure_ascii=False, indent=1)
+    if style == "clean":
+        return text
+    if style == "fenced":
+        return "Here is the coding result you asked for.\n```json\n" + text + "\n```\nLet me know if anything is unclear."
+    if style == "trailing_commas":
+        broken = re.sub(r"(\n\s*[}\]])", r",\1", text).replace(". ", ".\n ", 50)
+        return "```json\n" + broken + "\n```"
+    if style == "truncated":
+        rng = random.Random(seed)
+        return text[: int(len(text) * rng.uniform(0.6, 0.95))]
+    raise ValueError(f"unknown reply style: {style}")
+
+
+def codebook_payload(entries: int, seed: int = 7) -> Dict[str, Any]:
+    """A codebook reply with the key variants models produce (``name``/``label`` for
+    ``code``, ``synonyms`` for ``aliases``, themes as a list of objects, ...)."""
+    codes = code_vocabulary(entries, seed)
+    rows = []
+    for i, code in enumerate(codes):
+        key = ("code", "name", "label")[i % 3]
+        rows.append(
+            {
+                key: code,
+                ("definition" if i % 2 else "description"): f"Statements about {code}.",
+                ("include" if i % 2 else "should_include"): [f"mentions {code}"],
+                "exclude": f"unrelated to {code}",
+                ("positive_examples" if i % 4 else "examples"): [synthetic_text(50, "mixed", seed + i)[:70]],
+                "near_miss": [],
+                ("aliases" if i % 2 else "synonyms"): [f"{code}_alt", None, 3] if i % 5 == 0 else [f"{code}_alt"],
+            }
+        )
+    themes = max(1, entries // 6)
+    return {
+        "codebook": rows,
+        "second_order_themes": [
+            {"theme": f"theme_{t}", "codes": [c for j, c in enumerate(codes) if j % themes == t]} for t in range(themes)
+        ],
+        "aggregate_dimensions": {f"dimension_{d}": [f"theme_{t}" for t in range(themes) if t % 3 == d] for d in range(3)},
+    }
+
+
+def axial_triples(count: int, seed: int = 7) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    codes = code_vocabulary(max(8, count // 5), seed)
+    return [
+        {
+            "condition": rng.choice(codes),
+            "action": rng.choice(codes),
+            "result": rng.choice(codes),
+            "theme": f"theme_{rng.randint(0, 9)}",
+            "evidence": [f"{rng.randint(1, 9999):04d}"],
+        }
+        for _ in range(count)
+    ]
@@ -0,0 +1,186 @@
+from __future__ import annotations
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from .config import BudgetConfig, BudgetLimits
+from .providers.base import LLMProvider
+from .rate_limiter import TokenBucket
+from .utils.text_utils import estimate_message_tokens
+
+def _zero() -> Dict[str, float]:
+    return {"input_tokens": 0, "output_tokens": 0, "estimated_cost": 0.0}
+
+def _plus(*spends: Dict[str, float]) -> Dict[str, float]:
+    return {k: sum(s[k] for s in spends) for k in ("input_tokens", "output_tokens", "estimated_cost")}
+
+class BudgetExceeded(RuntimeError):
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"Budget exceeded in {stage}: {reason}")
+        self.stage = stage
+        self.reason = reason
+
+class BudgetGovernor:
+    """Tracks spend against BudgetConfig while a run is in progress.
+
+    Every governed request is checked before it is sent: past `slowdown_at` of the
+    tightest limit requests are throttled to `slowdown_rps`; at 100% `BudgetExceeded`
+    is raised so the stage can stop at a batch boundary. Each request also reserves
+    its worst case (estimated input plus `max_tokens`) until it completes; a request
+    whose reservation would cross a limit waits for the requests in flight to settle,
+    so concurrent calls overshoot a limit by at most one request. `should_skip` lets the
+    runner drop optional stages once `skip_optional_at` is reached. Everything the
+    governor did is listed in `summary()["events"]`.
+    """
+    def __init__(self, conf: BudgetConfig):
+        self.conf = conf
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._stage_start: Dict[str, float] = {}
+        self._settled = threading.Condition(self._lock)
+        self._spend: Dict[str, Dict[str, float]] = {}
+        self._total = _zero()
+        self._reserved: Dict[str, Dict[str, float]] = {}
+        self._reserved_total = _zero()
+        self._in_flight = 0
+        self._throttle = TokenBucket(conf.slowdown_rps)
+        self._throttled: set = set()
+        self.events: List[Dict[str, Any]] = []
+
+    @property
+    def enabled(self) -> bool:
+        limits = [self.conf] + list(self.conf.stages.values())
+        return any(l.max_tokens or l.max_cost or l.max_wall_sec for l in limits)
+
+    def wrap(self, provider: LLMProvider, stage: str) -> "GovernedProvider":
+        return GovernedProvider(provider, self, stage)
+
+    def begin_stage(self, stage: str):
+        with self._lock:
+            self._stage_start.setdefault(stage, time.monotonic())
+
+    @staticmethod
+    def _fraction(limits: BudgetLimits, spend: Dict[str, float], elapsed: float) -> float:
+        fractions = [0.0]
+        if limits.max_tokens:
+            fractions.append((spend["input_tokens"] + spend["output_tokens"]) / limits.max_tokens)
+        if limits.max_cost:
+            fractions.append(spend["estimated_cost"] / limits.max_cost)
+        if limits.max_wall_sec:
+            fractions.append(elapsed / limits.max_wall_sec)
+        return max(fractions)
+
+    def _used(self, stage: Optional[str], reserve: Optional[Dict[str, float]] = None) -> float:
+        # caller holds the lock; with `reserve`, the in-flight reservations plus it count as spent
+        now = time.monotonic()
+        total = self._total if reserve is None else _plus(self._total, self._reserved_total, reserve)
+        used = self._fraction(self.conf, total, now - self._start)
+        if stage and stage in self.conf.stages:
+            spend = self._spend.get(stage, _zero())
+            if reserve is not None:
+                spend = _plus(spend, self._reserved.get(stage, _zero()), reserve)
+            elapsed = now - self._stage_start.get(stage, now)
+            used = max(used, self._fraction(self.conf.stages[stage], spend, elapsed))
+        return used
+
+    def fraction(self, stage: Optional[str] = None) -> float:
+        """Share of the tightest applicable limit used so far (run-wide and, if given, stage)."""
+        with self._lock:
+            return self._used(stage)
+
+    def before_call(self, stage: str, reserve: Optional[Dict[str, float]] = None):
+        """Admit one request of `stage`, holding `reserve` (its worst-case spend) until
+        `record` or `release` settles it."""
+        self.begin_stage(stage)
+        reserve = reserve or _zero()
+        with self._settled:
+            while True:
+                used = self._used(stage)
+                if used >= 1.0:
+                    raise BudgetExceeded(stage, f"{used:.0%} of budget used")
+                if not self._in_flight or self._used(stage, reserve) <= 1.0:
+                    break
+                self._settled.wait()
+            self._in_flight += 1
+            reserved = self._reserved.setdefault(stage, _zero())
+            for target in (reserved, self._reserved_total):
+                for k, v in reserve.items():
+                    target[k] += v
+        if used >= self.conf.slowdown_at:
+            with self._lock:
+                first = stage not in self._throttled
+                self._throttled.add(stage)
+            if first:
+                self.note(stage, "throttled", f"{used:.0%} of budget used; limiting to {self.conf.slowdown_rps} req/s")
+            self._throttle.acquire()
+
+    def release(self, stage: str, reserve: Optional[Dict[str, float]] = None):
+        """Drop the reservation of a request admitted by `before_call`."""
+        with self._settled:
+            self._in_flight -= 1
+            for target in (self._reserved.setdefault(stage, _zero()), self._reserved_total):
+                for k, v in (reserve or {}).items():
+                    target[k] -= v
+            self._settled.notify_all()
+
+    def record(self, stage: str, input_tokens: int, output_tokens: int, cost: float, reserve: Optional[Dict[str, float]] = None):
+        with self._lock:
+            spend = self._spend.setdefault(stage, _zero())
+            for target in (spend, self._total):
+                target["input_tokens"] += input_tokens
+                target["output_tokens"] += output_tokens
+                target["estimated_cost"] += cost
+        self.release(stage, reserve)
+
+    def should_skip(self, stage: str) -> bool:
+        if stage not in self.conf.optional_stages:
+            return False
+        used = self.fraction()
+        if used >= self.conf.skip_optional_at:
+            self.note(stage, "skipped", f"optional stage skipped at {used:.0%} of budget")
+            return True
+        return False
+
+    def note(self, stage: str, action: str, detail: str, **extra):
+        event = {"stage": stage, "action": action, "detail": detail, "elapsed_sec": round(time.monotonic() - self._start, 1)}
+        event.update(extra)
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            spend = {k: dict(v, estimated_cost=round(v["estimated_cost"], 6)) for k, v in self._spend.items()}
+            total = dict(self._total, estimated_cost=round(self._total["estimated_cost"], 6))
+            events = list(self.events)
+        return {
+            "limits": self.conf.model_dump(),
+            "spend": total,
+            "stage_spend": spend,
+            "elapsed_sec": round(time.monotonic() - self._start, 1),
+            "events": events,
+        }
+
+class GovernedProvider(LLMProvider):
+    """Provider wrapper that reports every call of one stage to a BudgetGovernor."""
+    def __init__(self, inner: LLMProvider, governor: BudgetGovernor, stage: str):
+        super().__init__(inner.conf)
+        self.inner = inner
+        self.governor = governor
+        self.stage = stage
+
+    def _reservation(self, messages: List[Dict[str, str]], kwargs: Dict[str, Any]) -> Dict[str, float]:
+        input_tokens = estimate_message_tokens(messages)
+        output_tokens = int(kwargs.get("max_tokens") or self.conf.max_tokens or 0)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "estimated_cost": self.estimate_cost(input_tokens, output_tokens)}
+
+    def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        reserve = self._reservation(messages, kwargs)
+        self.governor.before_call(self.stage, reserve)
+        try:
+            text, usage = self.inner.generate_with_usage(messages, response_format=response_format, **kwargs)
+        except BaseException:
+            self.governor.release(self.stage, reserve)
+            raise
+        self.governor.record(self.stage, usage.input_tokens, usage.output_tokens, usage.cost, reserve)
+        self._update_usage(usage.input_tokens, usage.output_tokens, cost=usage.cost, scoped=False)
+        return text
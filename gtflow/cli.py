@@ -1,54 +1,85 @@
 
 from __future__ import annotations
-import json, os, pathlib, asyncio, time
+import hashlib, json, os, pathlib, asyncio, time
+from contextlib import contextmanager, nullcontext
 import typer, yaml
 from rich.table import Table
 from .config import AppConfig
 from .logging import console
-from .utils.file_io import read_text, write_json, write_text, ensure_dir, write_csv, read_json
-from .providers.base import make_provider
-from .pipeline.segmenter import segment_dialog, segment_paragraph, segment_line
+from .utils.file_io import read_text, write_json, ensure_dir, write_csv, read_json, exists, remove
+from .providers.base import make_stage_providers
+from .providers.hedge import hedge_providers, hedging_summary
+from .pipeline.segmenter import segment_text
 from .pipeline.open_coder import run_open_coding
-from .pipeline.codebook_builder import build_codebook
-from .pipeline.axial_coder import build_axial
-from .pipeline.selective_coder import build_theory
+from .pipeline.segment_dedup import fan_out, plan_dedup
+from .pipeline.codebook_builder import merge_codebook
 from .pipeline.gioia_view import to_gioia
-from .pipeline.negatives_scanner import scan_negatives
-from .pipeline.saturation import saturation
-from .pipeline.report_html import emit_html
-from .models.schemas import Segment
-from .cost import UsageAccumulator, estimate_cost
+from .pipeline.report_html import write_report
+from .pipeline.segment_index import load_or_build_index
+from .pipeline.deductive_coder import deductive_pass
+from .pipeline.stages import PipelineContext, run_pipeline
+from .cost import UsageAccumulator, estimate_cost, usage_scope
+from .rate_limiter import TokenBucket
+from .budget import BudgetGovernor
+from .profiling import Profiler
 
 app = typer.Typer(help="GTFlow grounded theory pipeline")
 
-def _load_config(config_path: str | None) -> AppConfig:
+def _read_config_data(config_path: str | None) -> dict:
     if config_path and os.path.exists(config_path):
         if config_path.endswith(".json"):
-            data = json.loads(read_text(config_path))
-        else:
-            data = yaml.safe_load(read_text(config_path))
-        return AppConfig.model_validate(data)
-    return AppConfig()
+            return json.loads(read_text(config_path))
+        return yaml.safe_load(read_text(config_path)) or {}
+    return {}
+
+def _load_config(config_path: str | None) -> AppConfig:
+    return AppConfig.model_validate(_read_config_data(config_path))
 
 def _stage_header(name: str):
     console.rule(f"[info]{name}[/info]")
 
+@contextmanager
+def _profiling(enabled: bool, out_dir: str, command: str, by_stage: bool = False):
+    """`--profile`: yield a Profiler (None when disabled). The whole block is profiled
+    as one stage named `command` unless `by_stage`, where the caller opens the stages.
+    On exit the profile files go to `<out_dir>/profile/<command>` and a summary table
+    is printed."""
+    if not enabled:
+        yield None
+        return
+    profiler = Profiler()
+    try:
+        with nullcontext() if by_stage else profiler.stage(command):
+            yield profiler
+    finally:
+        if profiler.stages:
+            path = profiler.write(os.path.join(out_dir, "profile", command))
+            table = Table(title="Profile by Stage")
+            for col in ("Stage", "Wall (s)", "Provider wait (s)", "Local (s)", "CPU (s)", "Calls", "Peak MB", "Top function"):
+                table.add_column(col)
+            for name, p in profiler.summary().items():
+                top = p["top_functions"][0] if p["top_functions"] else None
+                table.add_row(
+                    name, str(p["wall_sec"]), str(p["provider_wait_sec"]), str(p["local_sec"]), str(p["cpu_sec"]),
+                    str(p["provider_calls"]), str(p["peak_mb"]), top["function"].rsplit("/", 1)[-1] if top else "",
+                )
+            console.print(table)
+            console.print(f"[ok] Profile written to {path}")
+
 @app.command()
 def segment(
     input_path: str = typer.Option(..., "-i", help="Input text file"),
     out_dir: str = typer.Option("output", "-o", help="Output directory"),
     strategy: str = typer.Option("dialog", help="dialog|paragraph|line"),
-    max_segment_chars: int = typer.Option(800, help="Maximum characters per segment")
+    max_segment_chars: int = typer.Option(800, help="Maximum characters per segment"),
+    max_segment_tokens: int = typer.Option(None, help="Maximum estimated tokens per segment"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile to <out_dir>/profile"),
 ):
     ensure_dir(out_dir)
-    text = read_text(input_path)
-    if strategy == "dialog":
-        segs = segment_dialog(text, max_segment_chars)
-    elif strategy == "paragraph":
-        segs = segment_paragraph(text, max_segment_chars)
-    else:
-        segs = segment_line(text, max_segment_chars)
-    write_json(os.path.join(out_dir, "segments.json"), [s.model_dump() for s in segs])
+    with _profiling(profile, out_dir, "segment"):
+        text = read_text(input_path)
+        segs = segment_text(text, strategy, max_segment_chars, max_segment_tokens)
+        write_json(os.path.join(out_dir, "segments.json"), [s.model_dump() for s in segs])
     console.print(f"[ok] Segmented {len(segs)} segments -> {out_dir}/segments.json")
 
 @app.command()
@@ -56,142 +87,97 @@ def run_all(
     input_path: str = typer.Option(..., "-i"),
     config_path: str = typer.Option(..., "-c"),
     out_dir: str = typer.Option("output", "-o"),
-    force: bool = typer.Option(False, "--force/--no-force")
+    force: bool = typer.Option(False, "--force/--no-force"),
+    queue_path: str = typer.Option(None, "--queue", help="Open-code through a SQLite work queue served by `gtflow worker`"),
+    profile: bool = typer.Option(False, "--profile", help="Profile each stage (CPU, memory, provider wait) into <out_dir>/profile"),
 ):
+    with _profiling(profile, out_dir, "run_all", by_stage=True) as profiler:
+        _run_all(input_path, config_path, out_dir, force, queue_path, profiler)
+
+def _document(path: str, text: str, seg_ids: list[str]) -> dict:
+    """A documents.json entry: the file, its content hash and its seg_id range."""
+    return {
+        "path": path, "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+        "seg_ids": [seg_ids[0], seg_ids[-1]] if seg_ids else [], "added_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def _run_all(input_path: str | None, config_path: str, out_dir: str, force: bool, queue_path: str | None, profiler: Profiler | None):
+    # input_path is None when the segments are already on disk (`add`)
     conf = _load_config(config_path)
     conf.output.out_dir = out_dir
+    if queue_path:
+        conf.run.queue_path = queue_path
     ensure_dir(out_dir)
 
-    run_meta = {"stages": {}, "totals": {}}
-    price_in = conf.provider.price_input_per_1k
-    price_out = conf.provider.price_output_per_1k
+    # providers (one per stage; identical configs share an instance)
+    providers = make_stage_providers(conf)
+    unique_providers = list({id(p): p for p in providers.values()}.values())
+    for p in unique_providers:
+        p.reset_usage_totals()
 
-    # 1) Segment
-    _stage_header("Segment")
-    seg_json = os.path.join(out_dir, "segments.json")
-    if not os.path.exists(seg_json) or force:
-        text = read_text(input_path)
-        strat = conf.run.segmentation_strategy
-        if strat == "dialog":
-            segs = segment_dialog(text, conf.run.max_segment_chars)
-        elif strat == "paragraph":
-            segs = segment_paragraph(text, conf.run.max_segment_chars)
-        else:
-            segs = segment_line(text, conf.run.max_segment_chars)
-        write_json(seg_json, [s.model_dump() for s in segs])
-    else:
-        segs = [Segment.model_validate(x) for x in read_json(seg_json)]
-    console.print(f"[ok] segments: {len(segs)}")
-
-    # provider
-    provider = make_provider(conf.provider)
-    provider.reset_usage_totals()
-
-    # helper for per-stage usage delta
-    def usage_delta(before):
-        after = provider.total_usage()
-        return {
-            "input_tokens": after["input_tokens"] - before["input_tokens"],
-            "output_tokens": after["output_tokens"] - before["output_tokens"],
-            "total_tokens": after["total_tokens"] - before["total_tokens"],
-            "estimated_cost": round((after["input_tokens"] - before["input_tokens"]) / 1000.0 * price_in + (after["output_tokens"] - before["output_tokens"]) / 1000.0 * price_out, 6)
-        }
+    def usage_total():
+        tot = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "estimated_cost": 0.0}
+        for p in unique_providers:
+            for k, v in p.total_usage().items():
+                tot[k] += v
+        tot["estimated_cost"] = round(tot["estimated_cost"], 6)
+        return tot
 
-    # 2) Open coding
-    _stage_header("Open Coding")
-    open_json = os.path.join(out_dir, "open_codes.json")
-    if not os.path.exists(open_json) or force:
-        seg_dicts = [s.model_dump() for s in segs]
-        before = provider.total_usage()
-        items = run_open_coding(provider, seg_dicts, batch_size=conf.run.batch_size, max_retries=conf.run.retry_max)
-        write_json(open_json, [x.model_dump() for x in items])
-        run_meta["stages"]["open_coding"] = usage_delta(before)
-
-    # 3) Codebook
-    _stage_header("Codebook")
-    codebook_json = os.path.join(out_dir, "codebook.json")
-    if not os.path.exists(codebook_json) or force:
-        from .models.schemas import OpenCodingItem
-        items = [OpenCodingItem.model_validate(x) for x in read_json(open_json)]
-        before = provider.total_usage()
-        codebook = build_codebook(provider, items)
-        write_json(codebook_json, codebook.model_dump())
-        run_meta["stages"]["codebook"] = usage_delta(before)
-
-    # 4) Axial triples
-    _stage_header("Axial Coding")
-    triples_json = os.path.join(out_dir, "axial_triples.json")
-    if not os.path.exists(triples_json) or force:
-        from .models.schemas import Codebook
-        codebook = Codebook.model_validate(read_json(codebook_json))
-        before = provider.total_usage()
-        triples = build_axial(provider, codebook)
-        write_json(triples_json, [t.model_dump() for t in triples])
-        run_meta["stages"]["axial"] = usage_delta(before)
-
-    # 5) Theory
-    _stage_header("Selective Coding / Theory")
-    theory_json = os.path.join(out_dir, "theory.json")
-    if not os.path.exists(theory_json) or force:
-        from .models.schemas import AxialTriple
-        triples = [AxialTriple.model_validate(x) for x in read_json(triples_json)]
-        before = provider.total_usage()
-        theory = build_theory(provider, triples)
-        write_json(theory_json, theory.model_dump())
-        write_text(os.path.join(out_dir,"theory.md"), f"# Core Category\n\n{theory.core_category}\n\n## Storyline\n\n{theory.storyline}\n")
-        run_meta["stages"]["theory"] = usage_delta(before)
-
-    # 6) Gioia
-    _stage_header("Gioia View")
-    gioia_json = os.path.join(out_dir, "gioia.json")
-    if not os.path.exists(gioia_json) or force:
-        from .models.schemas import Codebook
-        codebook = Codebook.model_validate(read_json(codebook_json))
-        gioia = to_gioia(codebook)
-        write_json(gioia_json, gioia)
-
-    # 7) Negatives
-    _stage_header("Negative Cases")
-    negatives_json = os.path.join(out_dir, "negatives.json")
-    if not os.path.exists(negatives_json) or force:
-        tho = read_json(theory_json)
-        before = provider.total_usage()
-        seg_dicts = [s.model_dump() for s in segs]
-        negs = scan_negatives(provider, seg_dicts, tho.get("storyline",""))
-        write_json(negatives_json, negs)
-        run_meta["stages"]["negatives"] = usage_delta(before)
-
-    # 8) Saturation
-    _stage_header("Saturation")
-    saturation_json = os.path.join(out_dir, "saturation.json")
-    if not os.path.exists(saturation_json) or force:
-        oc = read_json(open_json)
-        sat = saturation(oc)
-        write_json(saturation_json, sat)
-
-    # 9) HTML Report
-    _stage_header("HTML Report")
-    html_path = os.path.join(out_dir, "report.html")
-    from .models.schemas import Codebook, AxialTriple, OpenCodingItem
-    codebook = Codebook.model_validate(read_json(codebook_json))
-    triples = [AxialTriple.model_validate(x) for x in read_json(triples_json)]
-    open_items = [OpenCodingItem.model_validate(x) for x in read_json(open_json)]
-    stats = {
-        "segments": len(segs),
-        "open_codes": sum(len(i.initial_codes) for i in open_items),
-        "codebook_entries": len(codebook.entries),
-        "triples": len(triples),
-    }
-    emit_html(html_path, stats, read_json(gioia_json), [t.model_dump() for t in triples], open_items, codebook)
+    # budget governor wraps the stage providers when any limit is configured
+    governor = BudgetGovernor(conf.budget)
+    if governor.enabled:
+        providers = {k: governor.wrap(p, "open_coding" if k == "open_coding_strong" else k) for k, p in providers.items()}
+    # hedging sits outside the governor, so duplicate requests count against the budget too
+    providers = hedge_providers(providers, conf.run)
+    if profiler:
+        providers = {k: profiler.wrap(p) for k, p in providers.items()}
+
+    ctx = PipelineContext(
+        conf, providers, out_dir, input_text=lambda: read_text(input_path), force=force, governor=governor,
+        log=console.print, run_meta={"stages": {}, "totals": {}}, profiler=profiler,
+    )
+    if conf.run.queue_path:
+        ctx.open_code = lambda segs, stats: _open_code_via_queue(conf, out_dir, segs, force, stats)
+
+    # stages run as a dependency graph (see pipeline/stages.py); independent ones overlap
+    segmented = []
+    def on_event(stage, status):
+        if status == "running":
+            _stage_header(stage.title or stage.name)
+        elif status == "done" and stage.name == "segment":
+            segmented.append(stage.name)
+        elif status == "cached":
+            console.print(f"[ok] {stage.title or stage.name}: reusing existing artifacts")
+        elif status == "blocked" and stage.name == "report":
+            console.print("[warn]Report skipped: upstream artifacts are missing.[/warn]")
+
+    artifacts = run_pipeline(ctx, on_event=on_event)
+    if segmented:
+        # segments were (re)built from the input: it is the run's only document, so `add` skips it
+        seg_ids = [s["seg_id"] for s in artifacts["segments"]]
+        write_json(os.path.join(out_dir, "documents.json"), [_document(input_path, read_text(input_path), seg_ids)], compression=conf.output.compression)
+    run_meta = ctx.run_meta
+    schedule = run_meta["schedule"]
+    console.print(
+        f"[info]Stages took {schedule['wall_sec']}s ({schedule['serial_sec']}s one after another); "
+        f"critical path: {' -> '.join(schedule['critical_path'])}[/info]"
+    )
 
     # totals
-    totals = provider.total_usage()
-    run_meta["totals"] = {
-        "input_tokens": totals["input_tokens"],
-        "output_tokens": totals["output_tokens"],
-        "total_tokens": totals["total_tokens"],
-        "estimated_cost": round(totals["input_tokens"]/1000.0*price_in + totals["output_tokens"]/1000.0*price_out, 6)
-    }
+    run_meta["totals"] = usage_total()
+    for k, v in ctx.remote_usage.items():
+        if k in run_meta["totals"]:
+            run_meta["totals"][k] += v
+    run_meta["totals"]["estimated_cost"] = round(run_meta["totals"]["estimated_cost"], 6)
+    run_meta["models"] = {stage: getattr(p.conf, "model", None) for stage, p in providers.items()}
+    members = [row for p in unique_providers if hasattr(p, "member_usage") for row in p.member_usage()]
+    if members:
+        run_meta["providers"] = members
+    if governor.enabled:
+        run_meta["budget"] = governor.summary()
+    hedging = hedging_summary(providers)
+    if hedging:
+        run_meta["hedging"] = hedging
     write_json(os.path.join(out_dir, "run_meta.json"), run_meta)
 
     console.print(f"[ok] Done. See {out_dir}")
@@ -207,20 +193,324 @@ def run_all(
     table.add_row("ALL", str(run_meta["totals"]["input_tokens"]), str(run_meta["totals"]["output_tokens"]), str(run_meta["totals"]["total_tokens"]), str(run_meta["totals"]["estimated_cost"]))
     console.print(table)
 
+# Artifacts derived from the codebook; `add` removes them so run_all regenerates them.
+_DOWNSTREAM = ("gioia.json", "axial_triples.json", "theory.json", "theory.md", "theory_groups.json", "negatives.json")
+
 @app.command()
-def html_report(out_dir: str = typer.Option("output", "-o")):
-    codebook = read_json(os.path.join(out_dir, "codebook.json"))
-    triples = read_json(os.path.join(out_dir, "axial_triples.json"))
-    open_items = read_json(os.path.join(out_dir, "open_codes.json"))
-    segs = read_json(os.path.join(out_dir, "segments.json"))
-    from .pipeline.report_html import emit_html
-    stats = {
-        "segments": len(segs),
-        "open_codes": sum(len(i.get("initial_codes",[])) for i in open_items),
-        "codebook_entries": len(codebook.get("entries",[])),
-        "triples": len(triples),
-    }
-    from .pipeline.gioia_view import to_gioia
-    from .models.schemas import Codebook
-    emit_html(os.path.join(out_dir,"report.html"), stats, to_gioia(Codebook.model_validate(codebook)), triples, open_items, Codebook.model_validate(codebook))
-    console.print(f"[ok] Wrote {out_dir}/report.html")
+def add(
+    input_paths: list[str] = typer.Option(..., "-i", help="New document(s); repeat -i for several"),
+    config_path: str = typer.Option(..., "-c"),
+    out_dir: str = typer.Option("output", "-o"),
+    force: bool = typer.Option(False, "--force/--no-force", help="Add documents even if they were added before"),
+    profile: bool = typer.Option(False, "--profile", help="Profile each step (CPU, memory, provider wait) into <out_dir>/profile"),
+):
+    """Add documents to an existing run: code only the new segments, delta-merge the
+    codebook, and rerun downstream stages only if the codebook changed."""
+    with _profiling(profile, out_dir, "add", by_stage=True) as profiler:
+        _add(input_paths, config_path, out_dir, force, profiler)
+
+def _add(input_paths: list[str], config_path: str, out_dir: str, force: bool, profiler: Profiler | None):
+    from .models.schemas import Codebook, OpenCodingItem
+    conf = _load_config(config_path)
+    conf.output.out_dir = out_dir
+    paths = {name: os.path.join(out_dir, name) for name in ("segments.json", "open_codes.json", "codebook.json", "documents.json", "run_meta.json")}
+    missing = [name for name in ("segments.json", "open_codes.json", "codebook.json") if not exists(paths[name])]
+    if missing:
+        console.print(f"[warn]{out_dir} has no {', '.join(missing)}; run `gtflow run-all` first.[/warn]")
+        raise typer.Exit(1)
+
+    step = profiler.stage if profiler else (lambda name: nullcontext())
+    _stage_header("Segment new documents")
+    with step("add_segment"):
+        seg_dicts = read_json(paths["segments.json"])
+        documents = read_json(paths["documents.json"]) if exists(paths["documents.json"]) else []
+        seen = {d["sha1"] for d in documents}
+        next_id = max((int(s["seg_id"]) for s in seg_dicts if str(s["seg_id"]).isdigit()), default=0) + 1
+        new_segs, added_docs = [], []
+        for path in input_paths:
+            text = read_text(path)
+            doc = _document(path, text, [])
+            if doc["sha1"] in seen and not force:
+                console.print(f"[info]{path} was already added; skipped.[/info]")
+                continue
+            segs = segment_text(text, conf.run.segmentation_strategy, conf.run.max_segment_chars, conf.run.max_segment_tokens)
+            for seg in segs:
+                seg.seg_id = f"{next_id:04d}"
+                seg.meta["doc"] = os.path.basename(path)
+                next_id += 1
+            new_segs.extend(seg.model_dump() for seg in segs)
+            seen.add(doc["sha1"])
+            added_docs.append(_document(path, text, [seg.seg_id for seg in segs]))
+            console.print(f"[ok] {path}: {len(segs)} segments")
+    if not new_segs:
+        console.print("[ok] Nothing new to add.")
+        return
+
+    providers = hedge_providers(make_stage_providers(conf), conf.run)
+    if profiler:
+        providers = {k: profiler.wrap(p) for k, p in providers.items()}
+    addition = {"documents": added_docs, "segments": len(new_segs), "stages": {}}
+
+    codebook = Codebook.model_validate(read_json(paths["codebook.json"]))
+    _stage_header("Open Coding (new segments)")
+    with step("add_open_coding"):
+        existing_items = [OpenCodingItem.model_validate(x) for x in read_json(paths["open_codes.json"])]
+        new_ids = {s["seg_id"] for s in new_segs}
+        # dedupe against the whole corpus, so repeats of earlier text reuse its codes
+        dedup = plan_dedup(seg_dicts + new_segs, conf.run.dedupe_segments, conf.run.trivial_segment_max_chars, conf.run.trivial_segment_patterns)
+        to_code = [s for s in dedup.unique if s["seg_id"] in new_ids]
+        deductive_items = []
+        deductive = conf.open_coding_deductive
+        if deductive.enabled:
+            seed = Codebook.model_validate(read_json(deductive.codebook)) if deductive.codebook else codebook
+            deductive_items, to_code, addition["deductive"] = deductive_pass(
+                to_code, seed, deductive.min_confidence, deductive.min_phrase_chars, deductive.use_examples,
+            )
+            console.print(f"[info]Deductive pre-pass coded {len(deductive_items)} new segments locally.[/info]")
+        console.print(f"[info]Coding {len(to_code)} of {len(new_segs)} new segments.[/info]")
+        with usage_scope("open_coding") as used:
+            coded = run_open_coding(
+                providers["open_coding"], to_code, batch_size=conf.run.batch_size, max_retries=conf.run.retry_max,
+                workers=conf.run.concurrent_workers, rate_limiter=TokenBucket(conf.run.rate_limit_rps),
+                fallback_provider=providers.get("open_coding_strong"),
+                min_codes_per_segment=conf.open_coding_cascade.min_codes_per_segment,
+                output_format=conf.run.open_coding_format,
+            )
+        new_items = [x for x in fan_out(coded + deductive_items + existing_items, dedup, new_segs) if x.seg_id in new_ids]
+        addition["stages"]["open_coding"] = used.to_dict()
+        write_json(paths["segments.json"], seg_dicts + new_segs, compression=conf.output.compression)
+        write_json(paths["open_codes.json"], [x.model_dump() for x in existing_items + new_items], compression=conf.output.compression)
+        write_json(paths["documents.json"], documents + added_docs, compression=conf.output.compression)
+
+    _stage_header("Codebook delta-merge")
+    with step("add_codebook_merge"), usage_scope("codebook_merge") as used:
+        merged, changed = merge_codebook(providers["codebook"], codebook, new_items)
+    addition["stages"]["codebook_merge"] = used.to_dict()
+    addition["codebook_changed"] = changed
+    addition["codebook_entries"] = [len(codebook.entries), len(merged.entries)]
+    hedging = hedging_summary(providers)
+    if hedging:
+        addition["hedging"] = hedging
+    stale = ["saturation.json"]
+    if changed:
+        write_json(paths["codebook.json"], merged.model_dump(), compression=conf.output.compression)
+        stale.extend(_DOWNSTREAM)
+        console.print(f"[ok] Codebook updated: {len(codebook.entries)} -> {len(merged.entries)} entries; rerunning downstream stages.")
+    else:
+        console.print("[ok] Codebook unchanged; downstream stages kept.")
+    for name in stale:
+        remove(os.path.join(out_dir, name))
+
+    # run_all resumes from the artifacts on disk (segments of every document included)
+    # and regenerates what was removed
+    previous = read_json(paths["run_meta.json"]) if exists(paths["run_meta.json"]) else {"stages": {}, "totals": {}}
+    _run_all(None, config_path, out_dir, False, None, profiler)
+    downstream = read_json(paths["run_meta.json"])
+    addition["stages"].update({f"downstream_{k}": v for k, v in downstream.get("stages", {}).items()})
+    totals = dict(previous.get("totals") or {})
+    for usage in addition["stages"].values():
+        for k in ("input_tokens", "output_tokens", "total_tokens", "estimated_cost"):
+            totals[k] = round(totals.get(k, 0) + usage.get(k, 0), 6)
+    previous["totals"] = totals
+    previous.setdefault("additions", []).append(addition)
+    write_json(paths["run_meta.json"], previous)
+    console.print(f"[ok] Added {len(new_segs)} segments from {len(added_docs)} document(s) to {out_dir}")
+
+def _open_code_via_queue(conf: AppConfig, out_dir: str, seg_dicts, force: bool, stats: dict):
+    """Enqueue the open-coding batches of this run and wait for workers to drain them."""
+    import hashlib
+    from .models.schemas import OpenCodingItem
+    from .work_queue import WorkQueue, collect_open_coding
+    queue = WorkQueue(conf.run.queue_path)
+    key = json.dumps([os.path.abspath(out_dir), conf.run.batch_size, seg_dicts], ensure_ascii=False)
+    run_id = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    if force:
+        queue.reset(run_id, "open_coding")
+    bs = max(1, conf.run.batch_size)
+    added = queue.enqueue(run_id, "open_coding", [seg_dicts[i:i + bs] for i in range(0, len(seg_dicts), bs)])
+    console.print(f"[info]Queued {added} open-coding batches for run {run_id} in {conf.run.queue_path}.[/info]")
+    console.print(f"[info]Start workers with: gtflow worker --queue {conf.run.queue_path} -c <config.yaml>[/info]")
+    counts = queue.wait_drained(
+        run_id, "open_coding", poll_sec=conf.run.queue_poll_sec,
+        on_progress=lambda c: console.print(f"[info]queue: {c['done']} done, {c['leased']} running, {c['pending']} pending, {c['failed']} failed[/info]"),
+    )
+    merged = collect_open_coding(queue, run_id)
+    stats.update({k: merged[k] for k in ("usage", "workers", "errors", "batches", "escalated_batches")})
+    stats.update({"path": conf.run.queue_path, "run_id": run_id, "jobs": counts})
+    if merged["skipped_seg_ids"]:
+        stats["skipped_seg_ids"] = merged["skipped_seg_ids"]
+    return [OpenCodingItem.model_validate(x) for x in merged["items"]]
+
+@app.command()
+def worker(
+    queue_path: str = typer.Option(..., "--queue", help="SQLite queue file shared with the coordinator"),
+    config_path: str = typer.Option(None, "-c", help="Provider settings used by this worker"),
+    run_id: str = typer.Option(None, "--run-id", help="Only serve this run"),
+    idle_exit_sec: float = typer.Option(None, "--idle-exit", help="Exit after this many seconds without work (default: run forever)"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile to profile/worker-<id> next to the queue file"),
+):
+    """Claim open-coding batches from a work queue, code them and write the results back."""
+    from .work_queue import WorkQueue, default_worker_id, run_worker
+    conf = _load_config(config_path)
+    worker_id = default_worker_id()
+    with _profiling(profile, os.path.dirname(os.path.abspath(queue_path)), f"worker-{worker_id}") as profiler:
+        providers = hedge_providers(make_stage_providers(conf), conf.run)
+        if profiler:
+            providers = {k: profiler.wrap(p) for k, p in providers.items()}
+        stats = run_worker(
+            WorkQueue(queue_path), conf, worker_id=worker_id, run_id=run_id, idle_exit_sec=idle_exit_sec,
+            poll_sec=conf.run.queue_poll_sec, log=lambda msg: console.print(f"[info]{msg}[/info]"), providers=providers,
+        )
+    console.print(f"[ok] Worker finished: {stats['done']} jobs done, {stats['failed']} failed attempts")
+
+@app.command()
+def plan(
+    input_path: str = typer.Option(..., "-i"),
+    config_path: str = typer.Option(None, "-c"),
+    out_dir: str = typer.Option(None, "-o", help="Write plan.json here (optional)"),
+    output_tokens_per_segment: int = typer.Option(150, help="Projected open-coding output tokens per segment"),
+    codes_per_segment: float = typer.Option(2.0, help="Projected initial codes per segment"),
+    base_latency_sec: float = typer.Option(2.0, help="Fixed latency per request"),
+    output_tokens_per_sec: float = typer.Option(50.0, help="Model generation speed"),
+    escalation_rate: float = typer.Option(0.1, help="Share of batches escalated when the cascade is on"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile to <out_dir or .>/profile"),
+):
+    """Estimate requests, tokens, cost and wall time per stage without calling any provider."""
+    from .planner import plan_run
+    conf = _load_config(config_path)
+    with _profiling(profile, out_dir or ".", "plan"):
+        text = read_text(input_path)
+        segs = segment_text(text, conf.run.segmentation_strategy, conf.run.max_segment_chars, conf.run.max_segment_tokens)
+        result = plan_run(
+            conf, segs,
+            output_tokens_per_segment=output_tokens_per_segment,
+            codes_per_segment=codes_per_segment,
+            base_latency_sec=base_latency_sec,
+            output_tokens_per_sec=output_tokens_per_sec,
+            escalation_rate=escalation_rate,
+        )
+    if out_dir:
+        ensure_dir(out_dir)
+        write_json(os.path.join(out_dir, "plan.json"), result)
+    d = result["dedup"]
+    to_code = result["deductive"]["segments"] - result["deductive"]["coded"] if result["deductive"] else d["unique_segments"]
+    table = Table(title=f"Run Plan ({result['segments']} segments, {to_code} to open-code)")
+    for col in ("Stage", "Model", "Requests", "Input", "Output", "Est. Cost ($)", "Est. Wall (s)"):
+        table.add_column(col)
+    for p in result["stages"]:
+        table.add_row(p["stage"] + (" (max)" if p["upper_bound"] else ""), p["model"], str(p["requests"]), str(p["input_tokens"]), str(p["output_tokens"]), str(p["estimated_cost"]), str(p["wall_sec"]))
+    t = result["totals"]
+    table.add_row("ALL (max)" if t["upper_bound"] else "ALL", "", str(t["requests"]), str(t["input_tokens"]), str(t["output_tokens"]), str(t["estimated_cost"]), str(t["wall_sec"]))
+    console.print(table)
+    for w in result["warnings"]:
+        console.print(f"[warn]{w}[/warn]")
+
+@app.command()
+def tune(
+    input_path: str = typer.Option(..., "-i", help="Input text file to sample segments from"),
+    config_path: str = typer.Option(..., "-c"),
+    write_path: str = typer.Option(None, "-w", "--write", help="Tuned config to write (default: <config>.tuned.yaml)"),
+    sample: int = typer.Option(40, help="Segments open-coded by each probe"),
+    strategy: str = typer.Option("adaptive", help="adaptive | grid"),
+    batch_sizes: str = typer.Option("5,10,15,20", help="Candidate run.batch_size values"),
+    workers: str = typer.Option("2,4,8,12", help="Candidate run.concurrent_workers values"),
+    max_tokens: str = typer.Option("512,1024,2048,4096", help="Candidate open-coding max_tokens values"),
+    min_success: float = typer.Option(0.95, help="Required parse rate and segment coverage"),
+    report_path: str = typer.Option(None, "--report", help="Write every probe to this JSON file"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile next to the tuned config"),
+):
+    """Probe batch size, concurrency and max_tokens for open coding against the configured
+    endpoint and write the fastest reliable settings to a config file."""
+    from .tuner import tune as run_tune
+    data = _read_config_data(config_path)
+    conf = AppConfig.model_validate(data)
+    write_path = write_path or f"{os.path.splitext(config_path)[0]}.tuned.yaml"
+    table = Table(title="Tuning Probes")
+    for col in ("batch", "workers", "max_tokens", "parsed", "coverage", "failed", "seg/s", "$/segment", "p95 (s)"):
+        table.add_column(col)
+
+    def show(p):
+        d = p.to_dict()
+        console.print(
+            f"[info]batch_size={d['batch_size']} workers={d['workers']} max_tokens={d['max_tokens']}: "
+            f"{d['segments_per_sec']} seg/s, parsed {d['parse_rate']:.0%}[/info]"
+        )
+        table.add_row(*(str(d[k]) for k in ("batch_size", "workers", "max_tokens", "parse_rate", "coverage", "failed_requests", "segments_per_sec", "cost_per_segment", "latency_p95_sec")))
+
+    with _profiling(profile, os.path.dirname(write_path) or ".", "tune"):
+        segs = segment_text(read_text(input_path), conf.run.segmentation_strategy, conf.run.max_segment_chars, conf.run.max_segment_tokens)
+        result = run_tune(
+            conf, segs, sample_size=sample, strategy=strategy,
+            batch_sizes=[int(x) for x in batch_sizes.split(",")],
+            workers=[int(x) for x in workers.split(",")],
+            max_tokens=[int(x) for x in max_tokens.split(",")],
+            min_success=min_success, on_probe=show,
+        )
+    console.print(table)
+    rec = result["recommended"]
+    run = data.setdefault("run", {}) or {}
+    data["run"] = run
+    run["batch_size"] = rec["batch_size"]
+    run["concurrent_workers"] = rec["concurrent_workers"]
+    stages = data.setdefault("stages", {}) or {}
+    data["stages"] = stages
+    stages["open_coding"] = dict(stages.get("open_coding") or {}, max_tokens=rec["max_tokens"])
+    ensure_dir(os.path.dirname(write_path) or ".")
+    with open(write_path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, allow_unicode=True, sort_keys=False)
+    if report_path:
+        write_json(report_path, result)
+    if not result["feasible"]:
+        console.print(f"[warn]No probe reached {min_success:.0%} parse rate and coverage; the most reliable one was written.[/warn]")
+    console.print(
+        f"[ok] batch_size={rec['batch_size']}, concurrent_workers={rec['concurrent_workers']}, open-coding max_tokens={rec['max_tokens']} "
+        f"({result['best']['segments_per_sec']} seg/s; probes cost ${result['probe_cost']}) -> {write_path}"
+    )
+
+@app.command()
+def search(
+    query: str = typer.Argument(..., help="Text to search for"),
+    out_dir: str = typer.Option("output", "-o"),
+    k: int = typer.Option(10, "-k", help="Number of segments to return"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile to <out_dir>/profile"),
+):
+    """BM25 search over the segments of a run directory."""
+    with _profiling(profile, out_dir, "search"):
+        segs = read_json(os.path.join(out_dir, "segments.json"))
+        index = load_or_build_index(out_dir, segs)
+        hits = index.query(query, k)
+    by_id = {str(s["seg_id"]): s for s in segs}
+    table = Table(title=f"Top {k} segments for: {query}")
+    for col in ("seg_id", "score", "speaker", "text"):
+        table.add_column(col)
+    for seg_id, score in hits:
+        s = by_id[seg_id]
+        table.add_row(seg_id, str(score), s.get("speaker") or "", s["text"][:160])
+    console.print(table)
+
+@app.command()
+def html_report(
+    out_dir: str = typer.Option("output", "-o"),
+    mode: str = typer.Option("auto", help="single | sharded | auto (sharded for large runs)"),
+    page_size: int = typer.Option(200, help="Rows per page/data chunk in the sharded report"),
+    max_graph_edges: int = typer.Option(60, help="Edges drawn in the aggregated graph of the sharded report"),
+    profile: bool = typer.Option(False, "--profile", help="Write a CPU/memory profile to <out_dir>/profile"),
+):
+    with _profiling(profile, out_dir, "html_report"):
+        codebook = read_json(os.path.join(out_dir, "codebook.json"))
+        triples = read_json(os.path.join(out_dir, "axial_triples.json"))
+        open_items = read_json(os.path.join(out_dir, "open_codes.json"))
+        segs = read_json(os.path.join(out_dir, "segments.json"))
+        stats = {
+            "segments": len(segs),
+            "open_codes": sum(len(i.get("initial_codes",[])) for i in open_items),
+            "codebook_entries": len(codebook.get("entries",[])),
+            "triples": len(triples),
+        }
+        from .models.schemas import Codebook
+        codebook = Codebook.model_validate(codebook)
+        used = write_report(
+            os.path.join(out_dir,"report.html"), stats, to_gioia(codebook), triples, open_items, codebook,
+            segments=segs, mode=mode, page_size=page_size, max_graph_edges=max_graph_edges,
+        )
+    console.print(f"[ok] Wrote {out_dir}/report.html ({used})")
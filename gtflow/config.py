@@ -1,10 +1,10 @@
 
 from __future__ import annotations
 from pydantic import BaseModel, Field
-from typing import Dict, Optional, Literal
+from typing import Dict, List, Optional, Literal, Union
 
 class ProviderConfig(BaseModel):
-    name: Literal["openai_compatible","openai","azure_openai","anthropic","ollama"] = "openai_compatible"
+    name: Literal["openai_compatible","openai","azure_openai","anthropic","ollama","mock"] = "openai_compatible"
     model: str = "gpt-4o-mini"
     api_key: Optional[str] = None
     # OpenAI-compatible options
@@ -16,30 +16,187 @@ class ProviderConfig(BaseModel):
     endpoint: Optional[str] = None
     api_version: Optional[str] = "2024-02-15-preview"
     deployment: Optional[str] = None
+    # Azure OpenAI HTTP transport: keep-alive connections pooled per provider
+    # (None sizes the pool to run.concurrent_workers)
+    http_pool_size: Optional[int] = None
+    http_keep_alive: bool = True
     # Behavior
     temperature: float = 0.2
     max_tokens: int = 1024
     structured: bool = True
     json_mode_fallback: bool = True
+    # Send strict JSON Schemas (response_format type json_schema) for stages that have
+    # one; requires schema-constrained decoding (OpenAI structured outputs, recent
+    # Azure api-versions). Falls back to JSON mode when rejected and json_mode_fallback.
+    json_schema: bool = False
     # price for estimation ($ per 1k tokens)
     price_input_per_1k: float = 0.002
     price_output_per_1k: float = 0.006
+    # Mock provider (name: mock, no network): fixed latency plus output tokens at
+    # mock_tokens_per_sec; calls beyond mock_max_concurrency in flight, and a
+    # mock_failure_rate share of calls, fail like a busy gateway.
+    mock_latency_sec: float = 0.05
+    mock_tokens_per_sec: float = 400.0
+    mock_max_concurrency: Optional[int] = None
+    mock_failure_rate: float = 0.0
+    # Pool membership (only used when `provider` is a list)
+    weight: float = 1.0
+    rpm: Optional[int] = None
+    tpm: Optional[int] = None
 
 class RunConfig(BaseModel):
     segmentation_strategy: Literal["dialog","paragraph","line"] = "dialog"
     max_segment_chars: int = 800
+    # Optional token cap per segment (local estimate: 1 per CJK char, 1 per 4 others)
+    max_segment_tokens: Optional[int] = None
     concurrent_workers: int = 6
     rate_limit_rps: float = 2.0
     retry_max: int = 3
     timeout_sec: int = 60
+    # Pipeline stages run as a dependency graph; independent ones (e.g. saturation
+    # next to the codebook) overlap, up to this many at a time (1 = one by one).
+    max_parallel_stages: int = 4
     batch_size: int = 10
+    # Open-coding reply layout: "compact" asks for one-letter keys, expanded locally
+    # into OpenCodingItem (fewer output tokens); "verbose" uses the full field names.
+    open_coding_format: Literal["compact","verbose"] = "verbose"
+    # Open-code each distinct (normalized) segment text once and copy the result to
+    # its repeats. Segments whose normalized text is at most trivial_segment_max_chars
+    # long or fully matches one of trivial_segment_patterns are not coded at all.
+    dedupe_segments: bool = False
+    trivial_segment_max_chars: int = 0
+    trivial_segment_patterns: List[str] = Field(default_factory=list)
+    # Provider pool health: members failing this many times in a row are
+    # taken out of rotation for pool_cooldown_sec seconds.
+    pool_failure_threshold: int = 3
+    pool_cooldown_sec: float = 30.0
+    # Hedged requests: once hedge_min_samples calls have finished, a call still running
+    # after the hedge_percentile latency of recent calls (at least hedge_min_delay_sec)
+    # is sent again and the first reply wins. Duplicates are capped at hedge_budget
+    # times the calls made (None disables hedging).
+    hedge_percentile: Optional[float] = None
+    hedge_budget: float = 0.05
+    hedge_min_samples: int = 20
+    hedge_min_delay_sec: float = 1.0
+    # Axial coding: one request over the codebook, or one per second-order theme
+    # carrying a sample of the segments coded under it.
+    axial_mode: Literal["single","per_theme"] = "single"
+    axial_max_codes_per_group: int = 15
+    axial_max_segments_per_group: int = 12
+    # Selective coding: one prompt over the first 40 triples, or a map-reduce over
+    # groups of selective_group_size triples.
+    selective_mode: Literal["single","hierarchical"] = "single"
+    selective_group_size: int = 40
+    # Segment index (BM25) lookups: evidence seg_ids for triples whose evidence is
+    # missing or unknown (0 disables), and the number of candidate segments sent to
+    # the negative-case scan (None sends an overview of every segment).
+    axial_evidence_top_k: int = 3
+    negatives_top_k: Optional[int] = None
+    # Axial triples whose shingle Jaccard similarity reaches this threshold are merged
+    # as paraphrased duplicates, unioning their evidence (None disables).
+    triple_dedup_threshold: Optional[float] = None
+    # Work-queue mode: run_all enqueues open-coding batches into this SQLite file and
+    # waits for `gtflow worker` processes to drain it. A job whose worker stops
+    # heartbeating is re-claimable after queue_lease_sec.
+    queue_path: Optional[str] = None
+    queue_lease_sec: float = 300.0
+    queue_max_attempts: int = 3
+    queue_poll_sec: float = 2.0
 
 class OutputConfig(BaseModel):
     out_dir: str = "output"
     save_graphviz: bool = True
     log_file: str = "analysis.log"
+    # "sharded" writes report.html as a small index plus report_data/ chunks with
+    # client-side paging and search; "auto" picks it for large runs.
+    report_mode: Literal["auto","single","sharded"] = "auto"
+    report_page_size: int = 200
+    report_graph_max_edges: int = 60
+    # Write the JSON artifacts of a run as .json.gz or .json.zst (zstd needs the
+    # zstandard package). Readers accept either, whatever this is set to.
+    compression: Optional[Literal["gzip","zstd"]] = None
+
+StageName = Literal["open_coding","codebook","axial","theory","negatives"]
+
+class StageConfig(BaseModel):
+    """Per-stage override of the top-level provider; unset fields inherit."""
+    provider: Optional[Union[ProviderConfig, List[ProviderConfig]]] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+
+class CascadeConfig(BaseModel):
+    """Cheap-first open coding: batches escalate to `strong` when the stage model's
+    output fails validation or the local quality check."""
+    enabled: bool = False
+    strong: StageConfig = StageConfig()
+    min_codes_per_segment: int = 1
+
+class DeductiveConfig(BaseModel):
+    """Deductive pre-pass for open coding: segments whose codebook matches (code names,
+    aliases, include phrases, positive examples) all reach `min_confidence` are coded
+    locally; ambiguous and unmatched segments still go to the LLM. `gtflow add` uses
+    the run's codebook.json; `run-all` needs `codebook` (e.g. from an earlier wave)."""
+    enabled: bool = False
+    codebook: Optional[str] = None
+    min_confidence: float = 0.6
+    min_phrase_chars: int = 2
+    use_examples: bool = True
+
+class EarlyStopConfig(BaseModel):
+    """Saturation-driven open coding: segments are coded in `order` and the new-code
+    rate is checked as batches complete. Once it stayed at or below `threshold` for
+    `patience` batches (after `min_segments` coded), the rest is skipped ("stop") or
+    only every `sample_every`-th batch is coded ("sample")."""
+    enabled: bool = False
+    order: Literal["sequential","stratified","random"] = "stratified"
+    after_saturation: Literal["stop","sample"] = "sample"
+    window: int = 20
+    threshold: float = 0.05
+    patience: int = 3
+    min_segments: int = 50
+    sample_every: int = 5
+    seed: int = 0
+
+class BudgetLimits(BaseModel):
+    max_tokens: Optional[int] = None
+    max_cost: Optional[float] = None
+    max_wall_sec: Optional[float] = None
+
+class BudgetConfig(BudgetLimits):
+    """Run-wide limits (inherited fields) plus optional per-stage limits."""
+    stages: Dict[StageName, BudgetLimits] = Field(default_factory=dict)
+    # fractions of the tightest limit at which the governor reacts
+    slowdown_at: float = 0.8
+    slowdown_rps: float = 0.5
+    skip_optional_at: float = 0.9
+    optional_stages: List[StageName] = Field(default_factory=lambda: ["negatives"])
 
 class AppConfig(BaseModel):
-    provider: ProviderConfig = ProviderConfig()
+    provider: Union[ProviderConfig, List[ProviderConfig]] = ProviderConfig()
     run: RunConfig = RunConfig()
     output: OutputConfig = OutputConfig()
+    stages: Dict[StageName, StageConfig] = Field(default_factory=dict)
+    open_coding_cascade: CascadeConfig = CascadeConfig()
+    open_coding_early_stop: EarlyStopConfig = EarlyStopConfig()
+    open_coding_deductive: DeductiveConfig = DeductiveConfig()
+    budget: BudgetConfig = BudgetConfig()
+
+    def provider_configs(self) -> List[ProviderConfig]:
+        if isinstance(self.provider, list):
+            return list(self.provider)
+        return [self.provider]
+
+    def resolve_provider(self, override: Optional[StageConfig]) -> Union[ProviderConfig, List[ProviderConfig]]:
+        if override is None:
+            return self.provider
+        base = override.provider if override.provider is not None else self.provider
+        update = {k: v for k, v in (("model", override.model), ("temperature", override.temperature), ("max_tokens", override.max_tokens)) if v is not None}
+        if not update:
+            return base
+        if isinstance(base, list):
+            return [c.model_copy(update=update) for c in base]
+        return base.model_copy(update=update)
+
+    def stage_provider(self, stage: str) -> Union[ProviderConfig, List[ProviderConfig]]:
+        return self.resolve_provider(self.stages.get(stage))
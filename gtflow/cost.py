@@ -1,6 +1,9 @@
-
 from __future__ import annotations
+import contextvars
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
 
 @dataclass
 class Usage:
@@ -31,3 +34,68 @@ class UsageAccumulator:
             "total_tokens": u.total_tokens,
             "estimated_cost": round(estimate_cost(u, price_in, price_out), 6)
         }
+
+class UsageScope:
+    """Usage of everything that ran inside one `usage_scope` block (a stage, a batch,
+    a single call). Safe to add to from several threads at once."""
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, input_tokens: int, output_tokens: int, cost: float):
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cost += cost
+            self.requests += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "total_tokens": self.input_tokens + self.output_tokens,
+                "estimated_cost": round(self.cost, 6),
+            }
+
+# Scopes open in the current context, outermost first. asyncio tasks inherit a copy
+# of the context; executor threads need `in_context`.
+_SCOPES: contextvars.ContextVar[Tuple[UsageScope, ...]] = contextvars.ContextVar("gtflow_usage_scopes", default=())
+
+@contextmanager
+def usage_scope(name: str = "") -> Iterator[UsageScope]:
+    """Collect the usage of every provider call made in this block, including calls
+    made from tasks and (via `in_context`) threads it starts. Scopes nest: a call is
+    counted in every enclosing scope, so stage and batch totals stay consistent."""
+    scope = UsageScope(name)
+    token = _SCOPES.set(_SCOPES.get() + (scope,))
+    try:
+        yield scope
+    finally:
+        _SCOPES.reset(token)
+
+def record_usage(input_tokens: int, output_tokens: int, cost: float):
+    """Add one provider call to every scope open in the current context."""
+    for scope in _SCOPES.get():
+        scope.add(input_tokens, output_tokens, cost)
+
+def in_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Bind `fn` to the caller's context so the usage it causes on executor threads
+    reaches the caller's scopes. Each call runs in its own copy, so the wrapper
+    can be used from several threads at once."""
+    ctx = contextvars.copy_context()
+    def run(*args, **kwargs):
+        return ctx.copy().run(_call, fn, args, kwargs)
+    return run
+
+# Set while a stage is profiled (see profiling.py): calls made through `in_context`
+# run via this hook so the work done on executor threads is profiled too.
+_THREAD_HOOK: contextvars.ContextVar[Optional[Callable[..., Any]]] = contextvars.ContextVar("gtflow_thread_hook", default=None)
+
+def _call(fn: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+    hook = _THREAD_HOOK.get()
+    return hook(fn, *args, **kwargs) if hook else fn(*args, **kwargs)
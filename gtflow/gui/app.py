@@ -7,18 +7,11 @@ import zipfile
 
 import streamlit as st
 
-from gtflow.config import AppConfig, ProviderConfig
-from gtflow.models.schemas import AxialTriple, Codebook, OpenCodingItem, Segment
-from gtflow.pipeline.axial_coder import build_axial
-from gtflow.pipeline.codebook_builder import build_codebook
-from gtflow.pipeline.gioia_view import to_gioia
-from gtflow.pipeline.negatives_scanner import scan_negatives
-from gtflow.pipeline.open_coder import run_open_coding
-from gtflow.pipeline.report_html import emit_html
-from gtflow.pipeline.saturation import saturation
-from gtflow.pipeline.segmenter import segment_dialog, segment_line, segment_paragraph
-from gtflow.pipeline.selective_coder import build_theory
-from gtflow.providers.base import make_provider
+from gtflow.config import AppConfig, ProviderConfig, StageConfig
+from gtflow.models.schemas import Segment
+from gtflow.pipeline.stages import PipelineContext, pipeline_stages, run_pipeline
+from gtflow.providers.base import make_stage_providers
+from gtflow.providers.hedge import hedge_providers, hedging_summary
 from gtflow.utils.file_io import ensure_dir, write_json
 
 
@@ -38,6 +31,23 @@ def _usage_box(title: str, usage: dict) -> None:
     cols[3].metric(f"{title} - est. cost ($)", usage.get("estimated_cost", 0))
 
 
+def _segment_search() -> None:
+    index = st.session_state.get("segment_index")
+    if index is None:
+        return
+    st.header("Search Segments")
+    query = st.text_input("BM25 search over the segments of the last run")
+    if not query:
+        return
+    by_id = st.session_state["segments_by_id"]
+    st.dataframe(
+        [
+            {"seg_id": seg_id, "score": score, "text": by_id[seg_id]["text"][:240]}
+            for seg_id, score in index.query(query, 20)
+        ]
+    )
+
+
 def main():
     st.set_page_config(page_title="GTFlow", layout="wide")
     st.title("GTFlow Dashboard")
@@ -100,6 +110,22 @@ def main():
         else:
             api_key = st.text_input("api_key", type="password", value=conf_provider.api_key or "")
 
+        st.header("Open Coding Model")
+        oc_stage = st.session_state["conf"].stages.get("open_coding")
+        oc_model = st.text_input(
+            "open coding model (blank = main model)",
+            value=(oc_stage.model if oc_stage and oc_stage.model else ""),
+        )
+        cascade = st.checkbox(
+            "Escalate low-quality batches to the main model",
+            value=st.session_state["conf"].open_coding_cascade.enabled,
+            disabled=not oc_model,
+        )
+        early_stop = st.checkbox(
+            "Stop open coding at saturation (sample the rest)",
+            value=st.session_state["conf"].open_coding_early_stop.enabled,
+        )
+
         st.header("Run Parameters")
         seg_strategy = st.selectbox(
             "Segmentation strategy",
@@ -122,6 +148,16 @@ def main():
             value=st.session_state["conf"].run.batch_size,
             step=1,
         )
+        axial_mode = st.selectbox(
+            "Axial coding mode",
+            ["single", "per_theme"],
+            index=["single", "per_theme"].index(st.session_state["conf"].run.axial_mode),
+        )
+        selective_mode = st.selectbox(
+            "Selective coding mode",
+            ["single", "hierarchical"],
+            index=["single", "hierarchical"].index(st.session_state["conf"].run.selective_mode),
+        )
         retry_max = st.slider(
             "Retry attempts",
             min_value=0,
@@ -138,6 +174,14 @@ def main():
         st.session_state["conf"].run.max_segment_chars = int(max_chars)
         st.session_state["conf"].run.batch_size = int(batch_size)
         st.session_state["conf"].run.retry_max = int(retry_max)
+        st.session_state["conf"].run.axial_mode = axial_mode
+        st.session_state["conf"].run.selective_mode = selective_mode
+        if oc_model:
+            st.session_state["conf"].stages["open_coding"] = StageConfig(model=oc_model)
+        else:
+            st.session_state["conf"].stages.pop("open_coding", None)
+        st.session_state["conf"].open_coding_cascade.enabled = bool(oc_model and cascade)
+        st.session_state["conf"].open_coding_early_stop.enabled = bool(early_stop)
 
         if name == "openai_compatible":
             st.session_state["conf"].provider.base_url = base_url
@@ -161,93 +205,58 @@ def main():
     run_btn = st.button("Run pipeline", type="primary", disabled=not txt)
 
     if not run_btn:
+        _segment_search()
         return
 
     conf = st.session_state["conf"]
 
-    with st.status("Segmenting...", expanded=True) as status_box:
-        if conf.run.segmentation_strategy == "dialog":
-            segments = segment_dialog(txt, conf.run.max_segment_chars)
-        elif conf.run.segmentation_strategy == "paragraph":
-            segments = segment_paragraph(txt, conf.run.max_segment_chars)
-        else:
-            segments = segment_line(txt, conf.run.max_segment_chars)
-        status_box.update(label=f"Segmented {len(segments)} entries.")
-
-    provider = make_provider(conf.provider)
-    provider.reset_usage_totals()
-
-    progress = st.progress(0, text="Open coding in progress...")
-
-    segment_dicts = [segment.model_dump() for segment in segments]
-    items = run_open_coding(
-        provider,
-        segment_dicts,
-        batch_size=conf.run.batch_size,
-        max_retries=conf.run.retry_max,
-    )
-    progress.progress(20, text="Open coding complete.")
-
-    codebook = build_codebook(provider, items)
-    progress.progress(40, text="Codebook complete.")
-
-    triples = build_axial(provider, codebook)
-    progress.progress(60, text="Axial coding complete.")
-
-    theory = build_theory(provider, triples)
-    progress.progress(75, text="Selective coding complete.")
-
-    negatives = scan_negatives(provider, segment_dicts, theory.storyline)
-    sat = saturation([item.model_dump() for item in items])
-    progress.progress(85, text="Negative cases and saturation calculated.")
+    providers = hedge_providers(make_stage_providers(conf), conf.run)
+    unique_providers = list({id(p): p for p in providers.values()}.values())
+    for provider in unique_providers:
+        provider.reset_usage_totals()
 
     tmpdir = tempfile.mkdtemp(prefix="gtflow_")
     ensure_dir(tmpdir)
-    write_json(os.path.join(tmpdir, "segments.json"), segment_dicts)
-    write_json(os.path.join(tmpdir, "open_codes.json"), [item.model_dump() for item in items])
-    write_json(os.path.join(tmpdir, "codebook.json"), codebook.model_dump())
-    write_json(os.path.join(tmpdir, "axial_triples.json"), [triple.model_dump() for triple in triples])
-    write_json(os.path.join(tmpdir, "theory.json"), theory.model_dump())
-    write_json(os.path.join(tmpdir, "gioia.json"), to_gioia(codebook))
-    write_json(os.path.join(tmpdir, "negatives.json"), negatives)
-    write_json(os.path.join(tmpdir, "saturation.json"), sat)
-    emit_html(
-        os.path.join(tmpdir, "report.html"),
-        {
-            "segments": len(segments),
-            "open_codes": sum(len(item.initial_codes) for item in items),
-            "codebook_entries": len(codebook.entries),
-            "triples": len(triples),
-        },
-        to_gioia(codebook),
-        [triple.model_dump() for triple in triples],
-        items,
-        codebook,
-    )
+    ctx = PipelineContext(conf, providers, tmpdir, input_text=lambda: txt, force=True)
+    stages = pipeline_stages(ctx)
+    progress = st.progress(0, text="Starting pipeline...")
+    finished = []
+
+    def on_event(stage, status):
+        if status == "running":
+            progress.progress(int(100 * len(finished) / len(stages)), text=f"{stage.title} in progress...")
+        else:
+            finished.append(stage.name)
+            progress.progress(int(100 * len(finished) / len(stages)), text=f"{stage.title}: {status}")
+
+    artifacts = run_pipeline(ctx, on_event=on_event)
+    segment_dicts = artifacts["segments"]
+    segments = [Segment.model_validate(segment) for segment in segment_dicts]
+    items = artifacts["open_codes"]
+    codebook = artifacts["codebook"]
+    theory = artifacts["theory"]
+    st.session_state["segment_index"] = artifacts["index"]
+    st.session_state["segments_by_id"] = {segment["seg_id"]: segment for segment in segment_dicts}
     _save_config_snippet(conf, tmpdir)
 
-    totals = provider.total_usage()
-    price_in = conf.provider.price_input_per_1k
-    price_out = conf.provider.price_output_per_1k
-    run_meta = {
-        "totals": {
-            "input_tokens": totals["input_tokens"],
-            "output_tokens": totals["output_tokens"],
-            "total_tokens": totals["total_tokens"],
-            "estimated_cost": round(
-                totals["input_tokens"] / 1000.0 * price_in
-                + totals["output_tokens"] / 1000.0 * price_out,
-                6,
-            ),
-        }
-    }
+    totals = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "estimated_cost": 0.0}
+    for provider in unique_providers:
+        for key, value in provider.total_usage().items():
+            totals[key] += value
+    totals["estimated_cost"] = round(totals["estimated_cost"], 6)
+    run_meta = dict(ctx.run_meta, totals=totals)
+    hedging = hedging_summary(providers)
+    if hedging:
+        run_meta["hedging"] = hedging
     write_json(os.path.join(tmpdir, "run_meta.json"), run_meta)
 
     buffer = io.BytesIO()
     with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipped:
-        for filename in os.listdir(tmpdir):
-            zipped.write(os.path.join(tmpdir, filename), arcname=filename)
-    progress.progress(100, text="All done.")
+        for root, _, filenames in os.walk(tmpdir):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                zipped.write(path, arcname=os.path.relpath(path, tmpdir))
+    progress.progress(100, text=f"All done (critical path: {' -> '.join(run_meta['schedule']['critical_path'])}).")
 
     st.success("Pipeline completed.")
     st.download_button(
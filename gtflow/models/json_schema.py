@@ -0,0 +1,54 @@
+from __future__ import annotations
+from typing import Any, Dict, Optional
+
+from pydantic import TypeAdapter
+
+def strict_schema(tp: Any, wrap_key: Optional[str] = None) -> Dict[str, Any]:
+    """JSON Schema for `tp` (a pydantic model or typing type) in the subset accepted by
+    schema-constrained decoding ("strict" structured outputs): every object lists all of
+    its properties as required and forbids additional ones, optional fields stay
+    nullable, and titles/defaults are dropped. Non-object roots (e.g. a list of items)
+    are wrapped as `{wrap_key: ...}`. Free-form mappings such as `Dict[str, List[str]]`
+    cannot be expressed and raise ValueError.
+    """
+    schema = _strict(TypeAdapter(tp).json_schema())
+    if schema.get("type") != "object":
+        if not wrap_key:
+            raise ValueError("strict schemas need an object root; pass wrap_key")
+        defs = schema.pop("$defs", None)
+        schema = {"type": "object", "properties": {wrap_key: schema}, "required": [wrap_key], "additionalProperties": False}
+        if defs:
+            schema["$defs"] = defs
+    return schema
+
+def _strict(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_strict(x) for x in node]
+    if not isinstance(node, dict):
+        return node
+    out: Dict[str, Any] = {}
+    for key, value in node.items():
+        if key in ("title", "default"):
+            continue
+        if key in ("properties", "$defs"):
+            out[key] = {name: _strict(sub) for name, sub in value.items()}
+        else:
+            out[key] = _strict(value)
+    if out.get("type") == "object":
+        if out.get("additionalProperties") not in (None, False):
+            raise ValueError("free-form mappings are not supported by strict schemas")
+        out.setdefault("properties", {})
+        out["required"] = list(out["properties"])
+        out["additionalProperties"] = False
+    return out
+
+def response_format_for(conf: Any, tp: Any = None, name: str = "output", wrap_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The `response_format` a stage should send with provider config `conf`: a strict
+    `json_schema` for `tp` when `conf.json_schema` is set, otherwise JSON mode when
+    `conf.structured` is set, otherwise None."""
+    if tp is not None and getattr(conf, "json_schema", False):
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": name, "strict": True, "schema": strict_schema(tp, wrap_key)},
+        }
+    return {"type": "json_object"} if getattr(conf, "structured", True) else None
@@ -39,8 +39,29 @@ class AxialTriple(BaseModel):
     action: str
     result: str
     evidence: List[str] = Field(default_factory=list)
+    theme: Optional[str] = None
 
 class Theory(BaseModel):
     core_category: str
     rationale: Optional[str] = None
     storyline: str
+
+# Intermediate summary of one group of triples (hierarchical selective coding).
+class GroupSummary(BaseModel):
+    label: str
+    mini_storyline: str
+    key_conditions: List[str] = Field(default_factory=list)
+    key_results: List[str] = Field(default_factory=list)
+
+# Compact open-coding output: the same content as OpenCodingItem under one-letter
+# keys, expanded locally by the open coder (see pipeline.open_coder.expand_compact).
+class CompactInitialCode(BaseModel):
+    c: str  # code
+    d: Optional[str] = None  # definition
+    e: Optional[str] = None  # evidence_span
+
+class CompactOpenCodingItem(BaseModel):
+    i: str  # seg_id
+    v: List[str] = Field(default_factory=list)  # in_vivo_phrases
+    c: List[CompactInitialCode] = Field(default_factory=list)  # initial_codes
+    m: Optional[str] = None  # quick_memo
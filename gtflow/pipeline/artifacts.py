@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, MutableMapping, Optional
+
+from pydantic import TypeAdapter
+
+from ..models.schemas import AxialTriple, Codebook, OpenCodingItem, Theory
+from ..utils.file_io import exists, read_json, write_json
+
+# Artifacts persisted in the run directory, with the type they are loaded back into.
+ARTIFACT_FILES: Dict[str, str] = {
+    "segments": "segments.json",
+    "open_codes": "open_codes.json",
+    "codebook": "codebook.json",
+    "axial_triples": "axial_triples.json",
+    "theory": "theory.json",
+    "gioia": "gioia.json",
+    "negatives": "negatives.json",
+    "saturation": "saturation.json",
+}
+_ADAPTERS: Dict[str, TypeAdapter] = {
+    "open_codes": TypeAdapter(List[OpenCodingItem]),
+    "codebook": TypeAdapter(Codebook),
+    "axial_triples": TypeAdapter(List[AxialTriple]),
+    "theory": TypeAdapter(Theory),
+}
+_ON_DISK = object()
+
+
+def dump_artifact(value: Any) -> Any:
+    if isinstance(value, list):
+        return [dump_artifact(item) for item in value]
+    return value.model_dump() if hasattr(value, "model_dump") else value
+
+
+def load_artifact(name: str, data: Any) -> Any:
+    adapter = _ADAPTERS.get(name)
+    return adapter.validate_python(data) if adapter is not None else data
+
+
+class ArtifactStore(MutableMapping[str, Any]):
+    """The artifacts of one run, shared by every stage.
+
+    An artifact is held in memory from the moment it is produced or first read, so
+    each file is parsed and validated at most once per run. Storing an artifact listed
+    in ``ARTIFACT_FILES`` also writes it to ``out_dir``; with ``background`` the
+    writes happen on one writer thread, in the order the artifacts were stored, and
+    :meth:`flush` waits for them. :meth:`from_disk` lets a stage hand over the files
+    of an earlier run without reading them: a file is only loaded when a stage first
+    asks for it. Stored artifacts are shared, not copied, and must not be modified.
+    Files are written with ``compression`` ("gzip" or "zstd"); gzip or zstd files of an
+    earlier run are read as well.
+    """
+
+    def __init__(self, out_dir: str, background: bool = True, compression: Optional[str] = None):
+        self.out_dir = out_dir
+        self.compression = compression
+        self._values: Dict[str, Any] = {}
+        self._plain: Dict[str, Any] = {}
+        self._on_disk: set = set()
+        self._lock = threading.Lock()
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gtflow-artifacts") if background else None
+        self._writes: List[Future] = []
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.out_dir, ARTIFACT_FILES[name])
+
+    def from_disk(self, *names: str) -> Optional[Dict[str, Any]]:
+        """Placeholders for ``names`` if all their files exist (None otherwise); storing
+        a placeholder registers the file for lazy loading."""
+        if not all(exists(self.path(name)) for name in names):
+            return None
+        return {name: _ON_DISK for name in names}
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        with self._lock:
+            self._values.pop(name, None)
+            self._plain.pop(name, None)
+            self._on_disk.discard(name)
+            if value is _ON_DISK:
+                self._on_disk.add(name)
+                return
+            self._values[name] = value
+        if name in ARTIFACT_FILES:
+            if self._writer is None:
+                self._persist(name, value)
+            else:
+                self._writes.append(self._writer.submit(self._persist, name, value))
+
+    def __getitem__(self, name: str) -> Any:
+        with self._lock:
+            if name in self._values:
+                return self._values[name]
+            if name not in self._on_disk:
+                raise KeyError(name)
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:  # two stages asking at once parse the file once
+            with self._lock:
+                if name in self._values:
+                    return self._values[name]
+            plain = read_json(self.path(name))
+            value = load_artifact(name, plain)
+            with self._lock:
+                self._values[name] = value
+                self._plain[name] = plain
+            return value
+
+    def __contains__(self, name: object) -> bool:
+        with self._lock:
+            return name in self._values or name in self._on_disk
+
+    def __delitem__(self, name: str) -> None:
+        with self._lock:
+            if name not in self._values and name not in self._on_disk:
+                raise KeyError(name)
+            self._values.pop(name, None)
+            self._plain.pop(name, None)
+            self._on_disk.discard(name)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._values) + [name for name in self._on_disk if name not in self._values])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(set(self._values) | self._on_disk)
+
+    def plain(self, name: str) -> Any:
+        """The JSON form of an artifact (dicts instead of models), computed once."""
+        return self._dump(name, self[name])
+
+    def _dump(self, name: str, value: Any) -> Any:
+        with self._lock:
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:  # the writer and a stage share one dump
+            with self._lock:
+                if name in self._plain and self._values.get(name) is value:
+                    return self._plain[name]
+            plain = dump_artifact(value)
+            with self._lock:
+                if self._values.get(name) is value:
+                    self._plain[name] = plain
+            return plain
+
+    def _persist(self, name: str, value: Any) -> None:
+        write_json(self.path(name), self._dump(name, value), compression=self.compression)
+
+    def flush(self) -> None:
+        """Wait for the pending writes; re-raises the first one that failed."""
+        writes, self._writes = self._writes, []
+        errors = [f.exception() for f in writes]
+        for error in errors:
+            if error is not None:
+                raise error
+
+    def close(self) -> None:
+        """Flush (re-raising a failed write) and stop the writer thread."""
+        try:
+            self.flush()
+        finally:
+            if self._writer is not None:
+                self._writer.shutdown()
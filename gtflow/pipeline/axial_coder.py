@@ -1,12 +1,19 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 from pydantic import TypeAdapter
 
-from ..models.schemas import AxialTriple, Codebook
+from ..cost import in_context
+from ..models.json_schema import response_format_for
+from ..models.schemas import AxialTriple, Codebook, CodebookEntry, OpenCodingItem
 from ..providers.base import LLMProvider
+from ..rate_limiter import TokenBucket
 from ..utils.json_utils import try_parse_json
+from ..utils.minhash import near_duplicate_groups, shingles
+
+_EXAMPLE = '{"condition":"...","action":"...","result":"...","evidence":["0001"]}'
 
 
 def build_prompt(codebook: Codebook) -> List[Dict[str, str]]:
@@ -14,7 +21,6 @@ def build_prompt(codebook: Codebook) -> List[Dict[str, str]]:
     for entry in codebook.entries[:60]:
         lines.append(f"- {entry.code}: {entry.definition}")
     txt = "\n".join(lines) if lines else "(no data)"
-    example = '{"condition":"...","action":"...","result":"...","evidence":["0001"]}'
     return [
         {
             "role": "system",
@@ -27,7 +33,36 @@ def build_prompt(codebook: Codebook) -> List[Dict[str, str]]:
             "role": "user",
             "content": (
                 f"Reference codebook:\n{txt}\n"
-                f"Return a JSON array where each element looks like: {example}."
+                f"Return a JSON array where each element looks like: {_EXAMPLE}."
+            ),
+        },
+    ]
+
+
+def build_group_prompt(
+    theme: str, entries: List[CodebookEntry], segments: List[Dict[str, Any]]
+) -> List[Dict[str, str]]:
+    codes = "\n".join(f"- {entry.code}: {entry.definition}" for entry in entries) or "(no data)"
+    excerpts = (
+        "\n".join(f"seg_id={segment['seg_id']}: {segment['text']}" for segment in segments)
+        or "(no coded segments)"
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a senior qualitative researcher. Perform axial coding for one theme, extract "
+                "condition->action->result triples, and cite only seg_ids from the supplied excerpts "
+                "as evidence. Output JSON only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Theme: {theme}\n"
+                f"Codes in this theme:\n{codes}\n\n"
+                f"Coded segment excerpts:\n{excerpts}\n\n"
+                f"Return a JSON array where each element looks like: {_EXAMPLE}."
             ),
         },
     ]
@@ -35,12 +70,172 @@ def build_prompt(codebook: Codebook) -> List[Dict[str, str]]:
 
 def build_axial(provider: LLMProvider, codebook: Codebook) -> List[AxialTriple]:
     messages = build_prompt(codebook)
+    return _request_triples(provider, messages)
+
+
+def build_axial_by_theme(
+    provider: LLMProvider,
+    codebook: Codebook,
+    open_items: List[OpenCodingItem],
+    segments: List[Dict[str, Any]],
+    workers: int = 1,
+    max_codes_per_group: int = 15,
+    max_segments_per_group: int = 12,
+    segment_chars: int = 300,
+    rate_limiter: Optional[TokenBucket] = None,
+) -> List[AxialTriple]:
+    """Axial-code each second-order theme (or chunk of ungrouped codes) in its own request.
+
+    Each request carries a bounded sample of the segments actually coded under the
+    group's codes, so returned evidence points at real seg_ids. Groups run
+    concurrently; the merged triples are de-duplicated and evidence outside the
+    corpus is dropped.
+    """
+    groups = group_codes(codebook, max_codes_per_group)
+    seg_by_id = {str(segment["seg_id"]): segment for segment in segments}
+    code_segments = _segments_by_code(codebook, open_items)
+
+    def run(group: Tuple[Optional[str], str, List[CodebookEntry]]) -> List[AxialTriple]:
+        theme, label, entries = group
+        sample = _sample_segments(entries, code_segments, seg_by_id, max_segments_per_group)
+        trimmed = [dict(segment, text=segment["text"][:segment_chars]) for segment in sample]
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        triples = _request_triples(provider, build_group_prompt(label, entries, trimmed))
+        for triple in triples:
+            triple.theme = theme
+        return triples
+
+    if workers <= 1 or len(groups) <= 1:
+        per_group = [run(group) for group in groups]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            per_group = list(pool.map(in_context(run), groups))
+    triples = [triple for group in per_group for triple in group]
+    for triple in triples:
+        triple.evidence = [seg_id for seg_id in triple.evidence if seg_id in seg_by_id]
+    return merge_triples(triples)
+
+
+def group_codes(
+    codebook: Codebook, max_codes_per_group: int = 15
+) -> List[Tuple[Optional[str], str, List[CodebookEntry]]]:
+    """Split the codebook into (theme, label, entries) groups of at most ``max_codes_per_group``.
+
+    Second-order themes come first; codes not listed under any theme are chunked
+    into "Ungrouped" groups (theme ``None``) in codebook order.
+    """
+    by_code = {entry.code.strip().lower(): entry for entry in codebook.entries}
+    size = max(1, max_codes_per_group)
+    groups: List[Tuple[Optional[str], str, List[CodebookEntry]]] = []
+    assigned = set()
+    for theme, codes in codebook.second_order_themes.items():
+        entries = []
+        for code in codes:
+            key = code.strip().lower()
+            if key in by_code and key not in assigned:
+                entries.append(by_code[key])
+                assigned.add(key)
+        for i in range(0, len(entries), size):
+            suffix = f" ({i // size + 1})" if len(entries) > size else ""
+            groups.append((theme, f"{theme}{suffix}", entries[i : i + size]))
+    rest = [entry for key, entry in by_code.items() if key not in assigned]
+    for i in range(0, len(rest), size):
+        groups.append((None, f"Ungrouped {i // size + 1}", rest[i : i + size]))
+    return groups
+
+
+def merge_triples(triples: List[AxialTriple]) -> List[AxialTriple]:
+    """Drop exact duplicates (case/whitespace-insensitive), unioning their evidence."""
+    merged: Dict[Tuple[str, str, str], AxialTriple] = {}
+    for triple in triples:
+        key = tuple(" ".join(part.split()).lower() for part in (triple.condition, triple.action, triple.result))
+        if key in merged:
+            kept = merged[key]
+            kept.evidence.extend(seg_id for seg_id in triple.evidence if seg_id not in kept.evidence)
+        else:
+            merged[key] = triple.model_copy(update={"evidence": list(dict.fromkeys(triple.evidence))})
+    return list(merged.values())
+
+
+def dedupe_triples(triples: List[AxialTriple], threshold: float = 0.8) -> List[AxialTriple]:
+    """Merge paraphrased near-duplicates, unioning their evidence.
+
+    Exact duplicates are folded by ``merge_triples`` first; the rest are compared
+    with MinHash/LSH over per-slot shingles (condition, action and result are
+    shingled separately, so swapping cause and effect is not a duplicate). The
+    triple with the most evidence is kept as the canonical wording of each group.
+    """
+    triples = merge_triples(triples)
+    sets = [
+        shingles(triple.condition, 1) | shingles(triple.action, 2) | shingles(triple.result, 3)
+        for triple in triples
+    ]
+    deduped: List[AxialTriple] = []
+    for group in near_duplicate_groups(sets, threshold):
+        members = [triples[i] for i in group]
+        if len(members) == 1:
+            deduped.append(members[0])
+            continue
+        canonical = max(members, key=lambda triple: len(triple.evidence))
+        evidence: Dict[str, None] = dict.fromkeys(canonical.evidence)
+        for triple in members:
+            evidence.update(dict.fromkeys(triple.evidence))
+        theme = canonical.theme or next((triple.theme for triple in members if triple.theme), None)
+        deduped.append(canonical.model_copy(update={"evidence": list(evidence), "theme": theme}))
+    return deduped
+
+
+def _segments_by_code(codebook: Codebook, open_items: List[OpenCodingItem]) -> Dict[str, List[str]]:
+    """Map each codebook code to the seg_ids whose initial codes match it or one of its aliases."""
+    alias_to_code: Dict[str, str] = {}
+    for entry in codebook.entries:
+        for name in [entry.code, *entry.aliases]:
+            alias_to_code.setdefault(name.strip().lower(), entry.code.strip().lower())
+    result: Dict[str, Dict[str, None]] = {}
+    for item in open_items:
+        for initial in item.initial_codes:
+            code = alias_to_code.get((initial.code or "").strip().lower())
+            if code:
+                result.setdefault(code, {})[item.seg_id] = None
+    return {code: list(seg_ids) for code, seg_ids in result.items()}
+
+
+def _sample_segments(
+    entries: List[CodebookEntry],
+    code_segments: Dict[str, List[str]],
+    seg_by_id: Dict[str, Dict[str, Any]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """Round-robin across the group's codes so every code contributes evidence."""
+    queues = [iter(code_segments.get(entry.code.strip().lower(), [])) for entry in entries]
+    picked: Dict[str, None] = {}
+    active = True
+    while len(picked) < limit and active:
+        active = False
+        for queue in queues:
+            for seg_id in queue:
+                if seg_id not in picked and seg_id in seg_by_id:
+                    picked[seg_id] = None
+                    active = True
+                    break
+            if len(picked) >= limit:
+                break
+    return [seg_by_id[seg_id] for seg_id in picked]
+
+
+def _request_triples(provider: LLMProvider, messages: List[Dict[str, str]]) -> List[AxialTriple]:
     raw = provider.generate_text(
         messages,
-        response_format={"type": "json_object"}
-        if getattr(provider.conf, "structured", True)
-        else None,
+        response_format=response_format_for(provider.conf, List[AxialTriple], "axial_triples", wrap_key="triples"),
     )
     data = try_parse_json(raw)
+    if isinstance(data, dict):
+        for key in ("triples", "items"):
+            if key in data:
+                data = data[key]
+                break
+        else:
+            data = [data]
     adapter = TypeAdapter(List[AxialTriple])
     return adapter.validate_python(data)
@@ -4,7 +4,7 @@ from typing import Any, Dict, List, Tuple
 
 from pydantic import TypeAdapter
 
-from ..models.schemas import Codebook, OpenCodingItem
+from ..models.schemas import Codebook, CodebookEntry, OpenCodingItem
 from ..providers.base import LLMProvider
 from ..utils.json_utils import try_parse_json
 
@@ -106,6 +106,119 @@ def build_codebook(
         )
 
 
+def new_codes(codebook: Codebook, open_items: List[OpenCodingItem]) -> List[OpenCodingItem]:
+    """Restrict ``open_items`` to initial codes that match no codebook code or alias."""
+    known = {
+        name.strip().lower()
+        for entry in codebook.entries
+        for name in [entry.code, *entry.aliases]
+    }
+    out: List[OpenCodingItem] = []
+    for item in open_items:
+        fresh = [c for c in item.initial_codes if (c.code or "").strip() and c.code.strip().lower() not in known]
+        if fresh:
+            out.append(item.model_copy(update={"initial_codes": fresh}))
+    return out
+
+
+def build_merge_prompt(codebook: Codebook, open_items: List[OpenCodingItem]) -> List[Dict[str, str]]:
+    code_summary, unique_codes = _summarize_codes(open_items)
+    existing = "\n".join(
+        f"- {entry.code}: {entry.definition}"
+        + (f" (aliases: {', '.join(entry.aliases)})" if entry.aliases else "")
+        for entry in codebook.entries
+    ) or "(empty codebook)"
+    themes = "\n".join(f"- {theme}: {', '.join(codes)}" for theme, codes in codebook.second_order_themes.items())
+    dimensions = "\n".join(f"- {dim}: {', '.join(names)}" for dim, names in codebook.aggregate_dimensions.items())
+    schema_hint = (
+        "Return JSON with only the changes:\n"
+        "{\n"
+        '  "new_entries": [{"code": "...", "definition": "...", "include": ["..."], "exclude": ["..."], '
+        '"positive_examples": ["..."], "near_miss": ["..."], "aliases": ["..."]}],\n'
+        '  "aliases": {"existing code": ["new code it absorbs"]},\n'
+        '  "second_order_themes": {"Theme A": ["codes to add to this theme"]},\n'
+        '  "aggregate_dimensions": {"Dimension X": ["themes to add to this dimension"]}\n'
+        "}"
+    )
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a qualitative research consultant maintaining an existing codebook while new data "
+                "arrives. Map each new initial code onto an existing code (as an alias) when it means the "
+                "same thing; otherwise add a new entry and place it in the theme hierarchy. Do not rewrite "
+                "existing entries. Return JSON only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Existing codebook entries:\n{existing}\n\n"
+                f"Second-order themes:\n{themes or '(none)'}\n\n"
+                f"Aggregate dimensions:\n{dimensions or '(none)'}\n\n"
+                f"New initial codes not yet in the codebook ({unique_codes}):\n{code_summary}\n\n"
+                f"{schema_hint}"
+            ),
+        },
+    ]
+
+
+def merge_codebook(
+    provider: LLMProvider, codebook: Codebook, open_items: List[OpenCodingItem]
+) -> Tuple[Codebook, bool]:
+    """Delta-merge the initial codes of ``open_items`` into ``codebook``.
+
+    Only codes that are not already a code or alias are sent, together with the
+    existing codebook; the model answers with new entries, alias assignments and
+    theme placements, which are applied locally. Returns the updated codebook and
+    whether it differs from the input (no request is made when nothing is new).
+    """
+    fresh = new_codes(codebook, open_items)
+    if not fresh:
+        return codebook, False
+    raw = provider.generate_text(
+        build_merge_prompt(codebook, fresh),
+        response_format={"type": "json_object"}
+        if getattr(provider.conf, "structured", True)
+        else None,
+    )
+    data = try_parse_json(raw)
+    if not isinstance(data, dict):
+        data = {"new_entries": data}
+    merged = codebook.model_copy(deep=True)
+    by_code = {entry.code.strip().lower(): entry for entry in merged.entries}
+
+    def add_aliases(code: str, aliases: List[str]) -> None:
+        entry = by_code.get(code.strip().lower())
+        if entry is None:
+            return
+        for alias in aliases:
+            if alias.strip().lower() not in {a.strip().lower() for a in [entry.code, *entry.aliases]}:
+                entry.aliases.append(alias)
+
+    for raw_entry in _normalize_entries(data.get("new_entries") or data.get("entries")):
+        key = raw_entry["code"].lower()
+        if key in by_code:
+            add_aliases(key, raw_entry["aliases"])
+            continue
+        entry = CodebookEntry.model_validate(raw_entry)
+        merged.entries.append(entry)
+        by_code[key] = entry
+    aliases = data.get("aliases")
+    if isinstance(aliases, dict):
+        for code, names in aliases.items():
+            add_aliases(str(code), _ensure_list(names))
+    for field_name, key_field, value_field in (
+        ("second_order_themes", ("theme", "name"), ("codes", "items")),
+        ("aggregate_dimensions", ("dimension", "name"), ("themes", "items")),
+    ):
+        target = getattr(merged, field_name)
+        for name, values in _normalize_mapping(data.get(field_name), key_field, value_field).items():
+            current = target.setdefault(name, [])
+            current.extend(v for v in values if v not in current)
+    return merged, merged.model_dump() != codebook.model_dump()
+
+
 def _normalize_codebook_payload(data: Any) -> Dict[str, Any]:
     if isinstance(data, str):
         data = try_parse_json(data)
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence, Tuple
+
+from ..models.schemas import Codebook, InitialCode, OpenCodingItem
+from ..utils.aho_corasick import AhoCorasick
+from .segment_dedup import normalize_text
+
+# Evidence weight of a phrase by the codebook field it comes from.
+WEIGHTS = {"code": 1.0, "aliases": 1.0, "include": 0.7, "positive_examples": 0.5}
+# Phrases from these fields veto a code, whatever else they are listed under.
+NEGATIVE_FIELDS = ("exclude", "near_miss")
+
+
+@dataclass
+class CodeMatch:
+    """Evidence for one code in one segment."""
+
+    code: str
+    weights: Dict[str, float] = field(default_factory=dict)
+    conflict: bool = False
+    vetoed: bool = False
+
+    @property
+    def confidence(self) -> float:
+        """``1 - prod(1 - w)`` over the distinct phrases that matched."""
+        miss = 1.0
+        for weight in self.weights.values():
+            miss *= 1.0 - weight
+        return round(1.0 - miss, 3)
+
+    @property
+    def evidence(self) -> str:
+        return max(self.weights, key=lambda phrase: (self.weights[phrase], len(phrase)))
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+class CodebookMatcher:
+    """The code names, aliases and key phrases of a codebook compiled into one
+    Aho-Corasick automaton.
+
+    Phrases are compared in the :func:`normalize_text` form, so case, punctuation
+    and spacing do not matter. A Latin phrase only matches whole words; CJK phrases
+    match anywhere. A phrase listed for several codes counts for each of them but
+    marks them as conflicting. An ``exclude`` or ``near_miss`` phrase of a code vetoes
+    that code, even when the same phrase is also one of its positive phrases.
+    """
+
+    def __init__(self, codebook: Codebook, min_phrase_chars: int = 2, use_examples: bool = True):
+        targets: Dict[str, Dict[str, float]] = {}
+        vetoes: Dict[str, set] = {}
+        for entry in codebook.entries:
+            sources: List[Tuple[str, List[str]]] = [("code", [entry.code]), ("aliases", entry.aliases), ("include", entry.include)]
+            if use_examples:
+                sources.append(("positive_examples", entry.positive_examples))
+            sources.extend((name, getattr(entry, name)) for name in NEGATIVE_FIELDS)
+            for source, phrases in sources:
+                for phrase in phrases:
+                    norm = normalize_text(phrase or "")
+                    if len(norm) < min_phrase_chars:
+                        continue
+                    codes = targets.setdefault(norm, {})
+                    if source in NEGATIVE_FIELDS:
+                        vetoes.setdefault(norm, set()).add(entry.code)
+                    else:
+                        codes[entry.code] = max(codes.get(entry.code, 0.0), WEIGHTS[source])
+        self.definitions = {entry.code: entry.definition for entry in codebook.entries}
+        self._automaton = AhoCorasick(targets)
+        self._targets = [targets[phrase] for phrase in self._automaton.patterns]
+        self._vetoes = [vetoes.get(phrase, set()) for phrase in self._automaton.patterns]
+
+    def __len__(self) -> int:
+        return len(self._automaton)
+
+    def match(self, text: str) -> Dict[str, CodeMatch]:
+        """Codes with positive evidence in ``text``; vetoed ones are flagged ``vetoed``."""
+        norm = normalize_text(text)
+        spans = []
+        for start, end, index in self._automaton.finditer(norm):
+            if start > 0 and _is_word(norm[start]) and _is_word(norm[start - 1]):
+                continue
+            if end < len(norm) and _is_word(norm[end - 1]) and _is_word(norm[end]):
+                continue
+            spans.append((start, end, index))
+        # a phrase inside a longer match ("压力" in "工作压力") is not evidence of its own
+        spans.sort(key=lambda span: (span[0], -span[1]))
+        kept, reach = [], -1
+        for start, end, index in spans:
+            if end <= reach:
+                continue
+            kept.append((start, end, index))
+            reach = end
+        found: Dict[str, CodeMatch] = {}
+        negative: set = set()
+        for start, end, index in kept:
+            codes = self._targets[index]
+            phrase = norm[start:end]
+            negative |= self._vetoes[index]
+            for code, weight in codes.items():
+                hit = found.setdefault(code, CodeMatch(code))
+                hit.weights[phrase] = max(hit.weights.get(phrase, 0.0), weight)
+                if len(codes) > 1:
+                    hit.conflict = True
+        for code in negative & set(found):
+            found[code].vetoed = True
+        return found
+
+
+def deductive_pass(
+    segments: Sequence[Dict[str, Any]],
+    codebook: Codebook,
+    min_confidence: float = 0.6,
+    min_phrase_chars: int = 2,
+    use_examples: bool = True,
+) -> Tuple[List[OpenCodingItem], List[Dict[str, Any]], Dict[str, Any]]:
+    """Code ``segments`` locally against ``codebook``.
+
+    A segment is coded here when every code with evidence in it reaches
+    ``min_confidence`` and none of them conflicts or is vetoed; its item lists
+    those codes with the matched phrase as evidence and their confidences in
+    ``quick_memo``. All other segments, unmatched or ambiguous, are returned for
+    the LLM together with the coded items and a stats dict.
+    """
+    matcher = CodebookMatcher(codebook, min_phrase_chars, use_examples)
+    items: List[OpenCodingItem] = []
+    remaining: List[Dict[str, Any]] = []
+    ambiguous = 0
+    confidences: List[float] = []
+    for segment in segments:
+        found = matcher.match(segment["text"]) if len(matcher) else {}
+        if not found:
+            remaining.append(segment)
+            continue
+        hits = sorted(found.values(), key=lambda hit: hit.confidence, reverse=True)
+        if any(hit.conflict or hit.vetoed or hit.confidence < min_confidence for hit in hits):
+            ambiguous += 1
+            remaining.append(segment)
+            continue
+        confidences.extend(hit.confidence for hit in hits)
+        items.append(
+            OpenCodingItem(
+                seg_id=str(segment["seg_id"]),
+                initial_codes=[
+                    InitialCode(code=hit.code, definition=matcher.definitions.get(hit.code), evidence_span=hit.evidence)
+                    for hit in hits
+                ],
+                quick_memo="deductive: " + ", ".join(f"{hit.code} ({hit.confidence:.2f})" for hit in hits),
+            )
+        )
+    stats = {
+        "phrases": len(matcher),
+        "segments": len(segments),
+        "coded": len(items),
+        "ambiguous": ambiguous,
+        "unmatched": len(remaining) - ambiguous,
+        "codes_assigned": len(confidences),
+        "mean_confidence": round(sum(confidences) / len(confidences), 3) if confidences else None,
+    }
+    return items, remaining, stats
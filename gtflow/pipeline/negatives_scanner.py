@@ -1,18 +1,19 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 from ..providers.base import LLMProvider
 from ..utils.json_utils import try_parse_json
 
+if TYPE_CHECKING:
+    from .segment_index import SegmentIndex
 
-def scan_negatives(
-    provider: LLMProvider, segments: List[Dict], theory_storyline: str
-) -> List[Dict]:
+
+def build_prompt(segments: List[Dict], theory_storyline: str) -> List[Dict[str, str]]:
     overview = "\n".join(
         f"{segment['seg_id']}: {segment['text'][:120]}" for segment in segments
     )
-    messages = [
+    return [
         {
             "role": "system",
             "content": (
@@ -25,6 +26,24 @@ def scan_negatives(
             "content": f"Storyline:\n{theory_storyline}\nSegment overview:\n{overview}",
         },
     ]
+
+
+def scan_negatives(
+    provider: LLMProvider,
+    segments: List[Dict],
+    theory_storyline: str,
+    index: Optional["SegmentIndex"] = None,
+    top_k: Optional[int] = None,
+) -> List[Dict]:
+    """Ask the model for segments contradicting the storyline.
+
+    With ``index`` and ``top_k`` only the ``top_k`` segments most relevant to the
+    storyline (BM25) are sent instead of an overview of the whole corpus.
+    """
+    if index is not None and top_k:
+        wanted = {seg_id for seg_id, _ in index.query(theory_storyline, top_k)}
+        segments = [segment for segment in segments if str(segment["seg_id"]) in wanted]
+    messages = build_prompt(segments, theory_storyline)
     raw = provider.generate_text(
         messages,
         response_format={"type": "json_object"}
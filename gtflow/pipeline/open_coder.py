@@ -1,17 +1,24 @@
 from __future__ import annotations
 
 import json
+import threading
 import time
-from typing import Any, Dict, List
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional
 
 from pydantic import TypeAdapter
 
-from ..models.schemas import OpenCodingItem
+from ..budget import BudgetExceeded
+from ..cost import in_context
+from ..models.json_schema import response_format_for
+from ..models.schemas import CompactOpenCodingItem, OpenCodingItem
 from ..providers.base import LLMProvider
+from ..rate_limiter import TokenBucket
 from ..utils.json_utils import try_parse_json
+from .saturation import SaturationMonitor
 
 
-def build_prompt(segments: List[Dict[str, str]]) -> List[Dict[str, str]]:
+def build_prompt(segments: List[Dict[str, str]], compact: bool = False) -> List[Dict[str, str]]:
     lines: List[str] = []
     for segment in segments:
         speaker = (
@@ -21,6 +28,24 @@ def build_prompt(segments: List[Dict[str, str]]) -> List[Dict[str, str]]:
         )
         lines.append(f"seg_id={segment['seg_id']}{speaker}: {segment['text']}")
     user = "\n".join(lines)
+    if compact:
+        instructions = (
+            "Open-code the following segments. Return a JSON object "
+            '{"items": [...]} with one object per seg_id, using these short keys:\n'
+            "- i: seg_id\n"
+            "- v: in-vivo phrases (verbatim excerpts)\n"
+            "- c: initial codes [{c: code, d: definition, e: evidence_span}]\n"
+            "- m: quick memo\n"
+            f"Segments:\n{user}\nStrictly return JSON."
+        )
+    else:
+        instructions = (
+            "Open-code the following segments. For each seg_id provide:\n"
+            "- in_vivo_phrases (verbatim excerpts)\n"
+            "- initial_codes [{code, definition, evidence_span}]\n"
+            "- quick_memo\n"
+            f"Segments:\n{user}\nStrictly return a JSON array."
+        )
     return [
         {
             "role": "system",
@@ -29,16 +54,7 @@ def build_prompt(segments: List[Dict[str, str]]) -> List[Dict[str, str]]:
                 "Respond in Chinese and return JSON only."
             ),
         },
-        {
-            "role": "user",
-            "content": (
-                "Open-code the following segments. For each seg_id provide:\n"
-                "- in_vivo_phrases (verbatim excerpts)\n"
-                "- initial_codes [{code, definition, evidence_span}]\n"
-                "- quick_memo\n"
-                f"Segments:\n{user}\nStrictly return a JSON array."
-            ),
-        },
+        {"role": "user", "content": instructions},
     ]
 
 
@@ -48,45 +64,209 @@ def _call_with_retry(
     response_format: Any,
     max_retries: int = 3,
     backoff_base: float = 1.5,
+    rate_limiter: Optional[TokenBucket] = None,
 ) -> str:
     err: Exception | None = None
     for i in range(max_retries):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
         try:
             return provider.generate_text(messages, response_format=response_format)
+        except BudgetExceeded:
+            raise
         except Exception as exc:
             err = exc
             time.sleep(backoff_base**i)
     raise RuntimeError(f"Open coding request failed after {max_retries} attempts: {err}")
 
 
+def _code_batch(
+    provider: LLMProvider,
+    batch: List[Dict[str, Any]],
+    adapter: TypeAdapter[List[OpenCodingItem]],
+    max_retries: int,
+    rate_limiter: Optional[TokenBucket],
+    compact: bool = False,
+) -> List[OpenCodingItem]:
+    messages = build_prompt(batch, compact)
+    raw = _call_with_retry(
+        provider,
+        messages,
+        response_format=response_format_for(
+            provider.conf,
+            List[CompactOpenCodingItem] if compact else List[OpenCodingItem],
+            "open_coding",
+            wrap_key="items",
+        ),
+        max_retries=max_retries,
+        rate_limiter=rate_limiter,
+    )
+    try:
+        return _parse_items(raw, adapter)
+    except Exception as exc:
+        raise RuntimeError(
+            f"Open coding parse failed: {exc}\nModel raw (first 800 chars): {raw[:800]}"
+        )
+
+
+def quality_problems(
+    batch: List[Dict[str, Any]], items: List[OpenCodingItem], min_codes: int = 1
+) -> List[str]:
+    """Cheap local check of a parsed batch; an empty list means it looks usable."""
+    problems: List[str] = []
+    expected = [str(segment["seg_id"]) for segment in batch]
+    returned = {item.seg_id: item for item in items}
+    missing = [seg_id for seg_id in expected if seg_id not in returned]
+    if missing:
+        problems.append(f"missing seg_id: {', '.join(missing)}")
+    unknown = [seg_id for seg_id in returned if seg_id not in set(expected)]
+    if unknown:
+        problems.append(f"unknown seg_id: {', '.join(unknown)}")
+    thin = [
+        item.seg_id
+        for item in items
+        if len([c for c in item.initial_codes if (c.code or "").strip()]) < min_codes
+    ]
+    if thin:
+        problems.append(f"fewer than {min_codes} initial_codes: {', '.join(thin)}")
+    return problems
+
+
 def run_open_coding(
     provider: LLMProvider,
     segments: List[Dict[str, Any]],
     batch_size: int = 10,
     max_retries: int = 3,
+    workers: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
+    fallback_provider: Optional[LLMProvider] = None,
+    min_codes_per_segment: int = 1,
+    stats: Optional[Dict[str, Any]] = None,
+    output_format: str = "verbose",
+    monitor: Optional[SaturationMonitor] = None,
+    sample_every: int = 0,
 ) -> List[OpenCodingItem]:
+    """Open-code ``segments`` in batches of ``batch_size``.
+
+    With ``workers > 1`` batches are dispatched concurrently (results keep segment
+    order); ``rate_limiter`` throttles every request, including retries.
+    ``output_format="compact"`` asks for the short-key layout of
+    :class:`CompactOpenCodingItem`; replies in either layout are accepted.
+
+    When ``fallback_provider`` is given the run becomes a cascade: each batch is
+    tried on ``provider`` first and re-sent to ``fallback_provider`` only if the
+    request fails, the output does not validate, or :func:`quality_problems`
+    reports an issue. Batch and escalation counts are written to ``stats``.
+
+    A :class:`BudgetExceeded` raised by a governed provider stops the run at a
+    batch boundary: completed batches are returned and the seg_ids of batches
+    that were not coded are listed in ``stats["skipped_seg_ids"]``.
+
+    With a ``monitor`` batches are dispatched in order, at most ``workers`` at a
+    time, and fed to the monitor in order as they complete. Once it reports
+    saturation the remaining batches are not coded, or only every ``sample_every``-th
+    one is; dense coding resumes if a sampled batch brings the new-code rate back
+    above the threshold. Those seg_ids go to ``stats["saturation_skipped_seg_ids"]``.
+    """
     adapter = TypeAdapter(List[OpenCodingItem])
-    results: List[OpenCodingItem] = []
-    for i in range(0, len(segments), batch_size):
-        batch = segments[i : i + batch_size]
-        messages = build_prompt(batch)
-        raw = _call_with_retry(
-            provider,
-            messages,
-            response_format={"type": "json_object"}
-            if getattr(provider.conf, "structured", True)
-            else None,
-            max_retries=max_retries,
-        )
+    batches = [segments[i : i + batch_size] for i in range(0, len(segments), batch_size)]
+    counters = stats if stats is not None else {}
+    counters.setdefault("batches", 0)
+    counters.setdefault("escalated_batches", 0)
+    lock = threading.Lock()
+    stopped = threading.Event()
+    compact = output_format == "compact"
+
+    def cascade(batch: List[Dict[str, Any]]) -> List[OpenCodingItem]:
+        if fallback_provider is None:
+            return _code_batch(provider, batch, adapter, max_retries, rate_limiter, compact)
         try:
-            results.extend(_parse_items(raw, adapter))
-        except Exception as exc:
-            raise RuntimeError(
-                f"Open coding parse failed: {exc}\nModel raw (first 800 chars): {raw[:800]}"
-            )
+            items = _code_batch(provider, batch, adapter, max_retries, rate_limiter, compact)
+            if not quality_problems(batch, items, min_codes_per_segment):
+                return items
+        except BudgetExceeded:
+            raise
+        except Exception:
+            pass
+        with lock:
+            counters["escalated_batches"] += 1
+        return _code_batch(fallback_provider, batch, adapter, max_retries, rate_limiter, compact)
+
+    def code(batch: List[Dict[str, Any]]) -> Optional[List[OpenCodingItem]]:
+        if stopped.is_set():
+            return None
+        with lock:
+            counters["batches"] += 1
+        try:
+            return cascade(batch)
+        except BudgetExceeded:
+            stopped.set()
+            return None
+
+    not_needed: set = set()
+    if monitor is not None:
+        coded = _code_until_saturated(code, batches, workers, monitor, sample_every, not_needed)
+    elif workers <= 1 or len(batches) <= 1:
+        coded = [code(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            coded = list(pool.map(in_context(code), batches))
+
+    results: List[OpenCodingItem] = []
+    skipped: List[str] = []
+    saturated: List[str] = []
+    for i, (batch, items) in enumerate(zip(batches, coded)):
+        if i in not_needed:
+            saturated.extend(str(segment["seg_id"]) for segment in batch)
+        elif items is None:
+            skipped.extend(str(segment["seg_id"]) for segment in batch)
+        else:
+            results.extend(items)
+    if skipped:
+        counters["skipped_seg_ids"] = skipped
+    if saturated:
+        counters["saturation_skipped_seg_ids"] = saturated
     return results
 
 
+def _code_until_saturated(
+    code: Any,
+    batches: List[List[Dict[str, Any]]],
+    workers: int,
+    monitor: SaturationMonitor,
+    sample_every: int,
+    not_needed: set,
+) -> List[Optional[List[OpenCodingItem]]]:
+    """Dispatch ``batches`` in order and feed the completed prefix to ``monitor``;
+    the indices of batches left out after saturation are added to ``not_needed``."""
+    coded: List[Optional[List[OpenCodingItem]]] = [None] * len(batches)
+    pending: Dict[int, Future] = {}
+    next_batch = fed = since_sample = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while True:
+            while next_batch < len(batches) and len(pending) < max(1, workers):
+                if monitor.saturated:
+                    since_sample += 1
+                    if not sample_every or since_sample % sample_every:
+                        not_needed.add(next_batch)
+                        next_batch += 1
+                        continue
+                else:
+                    since_sample = 0
+                pending[next_batch] = pool.submit(in_context(code), batches[next_batch])
+                next_batch += 1
+            if not pending:
+                break
+            done, _ = wait(pending.values(), return_when=FIRST_COMPLETED)
+            for i in [i for i, future in pending.items() if future in done]:
+                coded[i] = pending.pop(i).result()
+            while fed < next_batch and fed not in pending:
+                if coded[fed] is not None:
+                    monitor.add(coded[fed])
+                fed += 1
+    return coded
+
+
 def _parse_items(raw: str, adapter: TypeAdapter[List[OpenCodingItem]]) -> List[OpenCodingItem]:
     data = try_parse_json(raw)
     parsed = _coerce_and_validate(data, adapter)
@@ -107,5 +287,37 @@ def _coerce_and_validate(data: Any, adapter: TypeAdapter[List[OpenCodingItem]])
         else:
             data = [data]
     if isinstance(data, list):
-        return adapter.validate_python(data)
+        return adapter.validate_python([expand_compact(entry) for entry in data])
     return None
+
+
+def _text(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+def expand_compact(entry: Any) -> Any:
+    """Expand one compact reply item into OpenCodingItem fields.
+
+    Accepts the short-key object ``{"i", "v", "c": [{"c", "d", "e"}], "m"}`` and
+    the positional form ``[seg_id, phrases, [[code, definition, span], ...], memo]``;
+    anything else (e.g. an item already in the verbose layout) is returned as is.
+    """
+    if isinstance(entry, list):
+        entry = dict(zip(("i", "v", "c", "m"), entry))
+    elif not isinstance(entry, dict) or "i" not in entry or "seg_id" in entry:
+        return entry
+    codes = []
+    for code in entry.get("c") or []:
+        if isinstance(code, list):
+            code = dict(zip(("c", "d", "e"), code))
+        elif isinstance(code, str):
+            code = {"c": code}
+        if isinstance(code, dict) and code.get("c"):
+            codes.append({"code": str(code["c"]), "definition": _text(code.get("d")), "evidence_span": _text(code.get("e"))})
+    phrases = entry.get("v") or []
+    return {
+        "seg_id": str(entry.get("i")),
+        "in_vivo_phrases": [str(p) for p in ([phrases] if isinstance(phrases, str) else phrases)],
+        "initial_codes": codes,
+        "quick_memo": _text(entry.get("m")),
+    }
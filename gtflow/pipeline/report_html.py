@@ -1,8 +1,15 @@
-
 from __future__ import annotations
-from typing import List, Dict, Any
-from jinja2 import Template
-from ..utils.file_io import write_text
+import json
+import os
+import shutil
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from jinja2 import Environment
+from ..utils.file_io import ensure_dir
+
+DATA_DIR = "report_data"
+# "auto" switches to the sharded report above this many table rows
+AUTO_SHARD_ROWS = 2000
 
 HTML = """
 <!DOCTYPE html>
@@ -61,6 +68,283 @@ flowchart TD
 </html>
 """
 
+
+SHARDED_HTML = """
+<!DOCTYPE html>
+<html lang="zh">
+<head>
+<meta charset="utf-8"/>
+<title>GTFlow Report</title>
+<script src="https://cdn.jsdelivr.net/npm/mermaid/dist/mermaid.min.js"></script>
+<script>mermaid.initialize({ startOnLoad: true });</script>
+<style>
+body { font-family: -apple-system, BlinkMacSystemFont, Segoe UI, Roboto, Helvetica, Arial, "Microsoft YaHei", sans-serif; padding: 24px; }
+table { border-collapse: collapse; width: 100%; margin: 12px 0; }
+th, td { border: 1px solid #ddd; padding: 8px; vertical-align: top; }
+th { background: #f7f7f7; }
+pre { background: #f9f9f9; padding: 12px; overflow: auto; }
+.pager { display: flex; gap: 8px; align-items: center; }
+.pager input[type=search] { flex: 1; padding: 4px 8px; }
+.muted { color: #777; }
+</style>
+</head>
+<body>
+<h1>GTFlow Grounded Theory Report</h1>
+<h2>Stats</h2>
+<ul>
+{% for k,v in stats.items() %}
+<li><b>{{k}}</b>: {{v}}</li>
+{% endfor %}
+</ul>
+
+<h2>Gioia View</h2>
+<pre>{{gioia | tojson(indent=2)}}</pre>
+
+<h2>Axial Graph (aggregated)</h2>
+<p class="muted">{{graph.note}}</p>
+<div class="mermaid">
+{{graph.mermaid | safe}}
+</div>
+
+{% for name, table in manifest.tables.items() %}
+<h2>{{table.title}} <span class="muted">({{table.rows}} rows)</span></h2>
+<div class="pager" data-table="{{name}}">
+<input type="search" placeholder="Search {{table.title | lower}}..."/>
+<button data-step="-1">&lsaquo; Prev</button>
+<span class="status muted"></span>
+<button data-step="1">Next &rsaquo;</button>
+</div>
+<table id="table-{{name}}"><thead><tr>{% for c in table.columns %}<th>{{c}}</th>{% endfor %}</tr></thead><tbody></tbody></table>
+{% endfor %}
+
+<script id="manifest" type="application/json">{{manifest | tojson}}</script>
+<script>
+(function () {
+  // Data chunks are small scripts calling GTFlowReport.receive(), so the report
+  // also works when opened straight from disk (file:// blocks fetch()).
+  const manifest = JSON.parse(document.getElementById("manifest").textContent);
+  const cache = {}, waiting = {};
+  window.GTFlowReport = {
+    receive(table, n, rows) {
+      const key = table + "/" + n;
+      cache[key] = rows;
+      (waiting[key] || []).forEach(resolve => resolve(rows));
+      delete waiting[key];
+    }
+  };
+  function chunk(table, n) {
+    const key = table + "/" + n;
+    if (cache[key]) return Promise.resolve(cache[key]);
+    return new Promise(resolve => {
+      if (!waiting[key]) {
+        waiting[key] = [];
+        const script = document.createElement("script");
+        script.src = manifest.data_dir + "/" + table + "-" + n + ".js";
+        document.head.appendChild(script);
+      }
+      waiting[key].push(resolve);
+    });
+  }
+  function cell(value) {
+    if (Array.isArray(value)) return value.join(", ");
+    return value === null || value === undefined ? "" : String(value);
+  }
+  Object.entries(manifest.tables).forEach(([name, meta]) => {
+    const pager = document.querySelector('.pager[data-table="' + name + '"]');
+    const body = document.querySelector("#table-" + name + " tbody");
+    const status = pager.querySelector(".status");
+    const size = manifest.page_size;
+    const state = { page: 0, query: "", matches: null };
+    function draw(rows, total) {
+      body.textContent = "";
+      rows.forEach(row => {
+        const tr = document.createElement("tr");
+        meta.columns.forEach(column => {
+          const td = document.createElement("td");
+          td.textContent = cell(row[column]);
+          tr.appendChild(td);
+        });
+        body.appendChild(tr);
+      });
+      const pages = Math.max(1, Math.ceil(total / size));
+      status.textContent = "Page " + (state.page + 1) + " / " + pages + " (" + total + " rows)";
+    }
+    function show() {
+      if (state.matches === null) {
+        chunk(name, state.page).then(rows => draw(rows, meta.rows));
+      } else {
+        draw(state.matches.slice(state.page * size, (state.page + 1) * size), state.matches.length);
+      }
+    }
+    function search(query) {
+      state.query = query.trim().toLowerCase();
+      state.page = 0;
+      if (!state.query) { state.matches = null; show(); return; }
+      status.textContent = "Searching...";
+      const all = [];
+      for (let n = 0; n < meta.chunks; n++) all.push(chunk(name, n));
+      Promise.all(all).then(parts => {
+        if (query.trim().toLowerCase() !== state.query) return;
+        state.matches = [].concat(...parts).filter(row =>
+          meta.columns.some(column => cell(row[column]).toLowerCase().includes(state.query)));
+        show();
+      });
+    }
+    let timer = null;
+    pager.querySelector("input").addEventListener("input", event => {
+      clearTimeout(timer);
+      timer = setTimeout(() => search(event.target.value), 250);
+    });
+    pager.querySelectorAll("button").forEach(button => button.addEventListener("click", () => {
+      const total = state.matches === null ? meta.rows : state.matches.length;
+      const pages = Math.max(1, Math.ceil(total / size));
+      state.page = Math.min(pages - 1, Math.max(0, state.page + Number(button.dataset.step)));
+      show();
+    }));
+    show();
+  });
+})();
+</script>
+</body>
+</html>
+"""
+
+# Compiled once at import; rendering streams to disk instead of building one string.
+_ENV = Environment(autoescape=False)
+_TEMPLATE = _ENV.from_string(HTML)
+_SHARDED_TEMPLATE = Environment(autoescape=True).from_string(SHARDED_HTML)
+
 def emit_html(out_path: str, stats: Dict[str, Any], gioia: Dict[str, Any], triples: List[Dict[str,str]], open_codes: List[Any], codebook: Any):
-    html = Template(HTML).render(stats=stats, gioia=gioia, triples=triples, open_codes=open_codes, codebook=codebook)
-    write_text(out_path, html)
+    ensure_dir(os.path.dirname(out_path) or ".")
+    _TEMPLATE.stream(stats=stats, gioia=gioia, triples=triples, open_codes=open_codes, codebook=codebook).dump(out_path, encoding="utf-8")
+
+def emit_sharded_html(
+    out_path: str,
+    stats: Dict[str, Any],
+    gioia: Dict[str, Any],
+    triples: List[Dict[str, Any]],
+    open_codes: List[Any],
+    codebook: Any,
+    segments: Optional[List[Dict[str, Any]]] = None,
+    page_size: int = 200,
+    max_graph_edges: int = 60,
+) -> Dict[str, Any]:
+    """Write a small index page plus `report_data/<table>-<n>.js` chunks of `page_size` rows.
+
+    The page loads one chunk per page and pages/searches on the client; the graph
+    aggregates triples into condition -> result edges and keeps the `max_graph_edges`
+    heaviest. Returns the manifest embedded in the page.
+    """
+    page_size = max(1, page_size)
+    data_dir = os.path.join(os.path.dirname(out_path) or ".", DATA_DIR)
+    ensure_dir(data_dir)
+    for name in os.listdir(data_dir):
+        if name.endswith(".js"):
+            os.remove(os.path.join(data_dir, name))
+    tables = {
+        "triples": ("Axial Triples", ["condition", "action", "result", "theme", "evidence"], (dict(t) for t in triples)),
+        "open_codes": ("Open Codes", ["seg_id", "codes"], (_open_code_row(row) for row in open_codes)),
+        "codebook": ("Codebook Entries", ["code", "definition", "aliases"], (_entry_row(e) for e in _entries(codebook))),
+    }
+    if segments is not None:
+        tables["segments"] = ("Segments", ["seg_id", "speaker", "text"], iter(segments))
+    manifest: Dict[str, Any] = {"data_dir": DATA_DIR, "page_size": page_size, "tables": {}}
+    for name, (title, columns, rows) in tables.items():
+        count, chunks = _write_chunks(data_dir, name, columns, rows, page_size)
+        manifest["tables"][name] = {"title": title, "columns": columns, "rows": count, "chunks": chunks}
+    graph = aggregate_graph(triples, max_graph_edges)
+    ensure_dir(os.path.dirname(out_path) or ".")
+    _SHARDED_TEMPLATE.stream(stats=stats, gioia=gioia, graph=graph, manifest=manifest).dump(out_path, encoding="utf-8")
+    return manifest
+
+def write_report(
+    out_path: str,
+    stats: Dict[str, Any],
+    gioia: Dict[str, Any],
+    triples: List[Dict[str, Any]],
+    open_codes: List[Any],
+    codebook: Any,
+    segments: Optional[List[Dict[str, Any]]] = None,
+    mode: str = "auto",
+    page_size: int = 200,
+    max_graph_edges: int = 60,
+) -> str:
+    """Write the single-page or sharded report; returns the mode that was used.
+
+    A single-page report removes the `report_data/` chunks a previous sharded one left.
+    """
+    if mode == "auto":
+        rows = len(triples) + len(open_codes) + len(_entries(codebook)) + len(segments or [])
+        mode = "sharded" if rows > AUTO_SHARD_ROWS else "single"
+    if mode == "sharded":
+        emit_sharded_html(out_path, stats, gioia, triples, open_codes, codebook, segments, page_size, max_graph_edges)
+    else:
+        emit_html(out_path, stats, gioia, triples, open_codes, codebook)
+        shutil.rmtree(os.path.join(os.path.dirname(out_path) or ".", DATA_DIR), ignore_errors=True)
+    return mode
+
+def aggregate_graph(triples: List[Dict[str, Any]], max_edges: int = 60) -> Dict[str, str]:
+    """Collapse triples into weighted condition -> result edges labelled with the most
+    frequent action; only the `max_edges` heaviest edges are drawn."""
+    edges: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    labels: Dict[str, str] = {}
+    for t in triples:
+        ends = []
+        for part in (t.get("condition", ""), t.get("result", "")):
+            key = " ".join(str(part).split()).lower()
+            labels.setdefault(key, str(part))
+            ends.append(key)
+        edge = edges.setdefault((ends[0], ends[1]), {"count": 0, "evidence": 0, "actions": Counter()})
+        edge["count"] += 1
+        edge["evidence"] += len(t.get("evidence") or [])
+        edge["actions"][str(t.get("action", ""))] += 1
+    ranked = sorted(edges.items(), key=lambda kv: (-kv[1]["count"], -kv[1]["evidence"], kv[0]))
+    shown = ranked[:max(0, max_edges)]
+    node_ids: Dict[str, str] = {}
+    lines = ["flowchart LR"]
+    for (src, dst), edge in shown:
+        for key in (src, dst):
+            if key not in node_ids:
+                node_ids[key] = f"N{len(node_ids) + 1}"
+                lines.append(f'  {node_ids[key]}["{_mermaid_label(labels[key])}"]')
+        action = _mermaid_label(edge["actions"].most_common(1)[0][0], 40)
+        weight = f" x{edge['count']}" if edge["count"] > 1 else ""
+        lines.append(f'  {node_ids[src]} -->|"{action}{weight}"| {node_ids[dst]}')
+    note = f"{len(triples)} triples aggregated into {len(edges)} condition -> result edges"
+    if len(ranked) > len(shown):
+        note += f"; showing the {len(shown)} most frequent (see the triples table for the rest)"
+    return {"mermaid": "\n".join(lines), "note": note + "."}
+
+def _write_chunks(data_dir: str, name: str, columns: List[str], rows: Iterable[Dict[str, Any]], page_size: int) -> Tuple[int, int]:
+    count, chunks, buf = 0, 0, []
+    def flush():
+        payload = json.dumps(buf, ensure_ascii=False).replace("</", "<\\/")
+        with open(os.path.join(data_dir, f"{name}-{chunks}.js"), "w", encoding="utf-8") as f:
+            f.write(f"GTFlowReport.receive({json.dumps(name)}, {chunks}, {payload});\n")
+    for row in rows:
+        buf.append({c: row.get(c) for c in columns})
+        count += 1
+        if len(buf) == page_size:
+            flush()
+            chunks, buf = chunks + 1, []
+    if buf or not chunks:
+        flush()
+        chunks += 1
+    return count, chunks
+
+def _field(obj: Any, name: str, default: Any = None) -> Any:
+    return obj.get(name, default) if isinstance(obj, dict) else getattr(obj, name, default)
+
+def _entries(codebook: Any) -> List[Any]:
+    return list(_field(codebook, "entries", []) or [])
+
+def _open_code_row(item: Any) -> Dict[str, Any]:
+    codes = [_field(c, "code", "") for c in _field(item, "initial_codes", []) or []]
+    return {"seg_id": _field(item, "seg_id"), "codes": codes}
+
+def _entry_row(entry: Any) -> Dict[str, Any]:
+    return {"code": _field(entry, "code"), "definition": _field(entry, "definition"), "aliases": list(_field(entry, "aliases", []) or [])}
+
+def _mermaid_label(text: str, limit: int = 60) -> str:
+    text = " ".join(str(text).split()).replace('"', "'").replace("<", "#lt;").replace(">", "#gt;")
+    return text if len(text) <= limit else text[:limit - 1] + "…"
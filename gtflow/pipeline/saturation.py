@@ -1,6 +1,7 @@
 
 from __future__ import annotations
-from typing import List, Dict, Tuple
+import random
+from typing import Any, List, Dict, Optional, Tuple
 
 def saturation(open_codes: List[Dict], window: int = 20, threshold: float = 0.05) -> Dict:
     seen = set()
@@ -29,3 +30,85 @@ def saturation(open_codes: List[Dict], window: int = 20, threshold: float = 0.05
         else:
             consec = 0
     return {"window": window, "threshold": threshold, "saturation_seg_index": idx, "rates": rates}
+
+# Single-document corpora are cut into this many contiguous parts for "stratified".
+_SINGLE_DOC_STRATA = 8
+
+def coding_order(segments: List[Dict], order: str = "sequential", seed: int = 0) -> List[Dict]:
+    """Segments in the order they should be open-coded, grouped by `meta["doc"]`.
+
+    "sequential" keeps the corpus order; "stratified" takes segments round-robin from
+    each document (a single document is cut into parts first), so early batches cover
+    the whole corpus; "random" shuffles the documents with `seed`, keeping each one in
+    order (a single document has its segments shuffled).
+    """
+    if order == "sequential" or len(segments) < 2:
+        return list(segments)
+    docs: Dict[str, List[Dict]] = {}
+    for s in segments:
+        docs.setdefault(str((s.get("meta") or {}).get("doc") or ""), []).append(s)
+    groups = list(docs.values())
+    rng = random.Random(seed)
+    if order == "random":
+        if len(groups) == 1:
+            shuffled = list(segments)
+            rng.shuffle(shuffled)
+            return shuffled
+        rng.shuffle(groups)
+        return [s for g in groups for s in g]
+    if order != "stratified":
+        raise ValueError(f"unknown coding order: {order}")
+    if len(groups) == 1:
+        size = -(-len(segments) // _SINGLE_DOC_STRATA)
+        groups = [segments[i:i + size] for i in range(0, len(segments), size)]
+    out = []
+    for i in range(max(len(g) for g in groups)):
+        out.extend(g[i] for g in groups if i < len(g))
+    return out
+
+class SaturationMonitor:
+    """Incremental `saturation` for open coding in progress.
+
+    Coded items are fed in coding order, one batch per `add`. The windowed new-code
+    rate is checked after each batch; the corpus counts as saturated once it stayed at
+    or below `threshold` for `patience` checks in a row and at least `min_segments`
+    segments were coded. A later batch above the threshold clears it again.
+    """
+    def __init__(self, window: int = 20, threshold: float = 0.05, patience: int = 3, min_segments: int = 0):
+        self.window = window
+        self.threshold = threshold
+        self.patience = patience
+        self.min_segments = min_segments
+        self.seen: set = set()
+        self.new_counts: List[int] = []
+        self.curve: List[Tuple[int, float]] = []
+        self.saturated_at: Optional[int] = None
+        self._below = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self._below >= self.patience and len(self.new_counts) >= self.min_segments
+
+    def add(self, items: List[Any]) -> bool:
+        for item in items:
+            n_new = 0
+            for ic in item.initial_codes:
+                c = (ic.code or "").strip().lower()
+                if c and c not in self.seen:
+                    self.seen.add(c)
+                    n_new += 1
+            self.new_counts.append(n_new)
+        recent = self.new_counts[-self.window:]
+        rate = sum(recent) / max(1, len(recent))
+        self.curve.append((len(self.new_counts), round(rate, 4)))
+        self._below = self._below + 1 if rate <= self.threshold else 0
+        if self.saturated and self.saturated_at is None:
+            self.saturated_at = len(self.new_counts)
+        return self.saturated
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "window": self.window, "threshold": self.threshold, "patience": self.patience,
+            "saturated_at": self.saturated_at, "codes": len(self.seen),
+            "curve": [list(point) for point in self.curve],
+        }
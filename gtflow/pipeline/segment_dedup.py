@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Sequence
+
+from ..models.schemas import OpenCodingItem
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize_text(text: str) -> str:
+    """Comparison form of a segment: NFKC, case-folded, punctuation and runs of
+    whitespace collapsed to single spaces."""
+    return _NON_WORD.sub(" ", unicodedata.normalize("NFKC", text).casefold()).strip()
+
+
+@dataclass
+class SegmentDedup:
+    """Which segments to send to open coding and how to map the results back.
+
+    ``unique`` holds the first occurrence of every distinct normalized text,
+    ``copies`` maps those seg_ids to the seg_ids of their repeats, and ``trivial``
+    lists segments skipped outright.
+    """
+
+    unique: List[Dict[str, Any]] = field(default_factory=list)
+    copies: Dict[str, List[str]] = field(default_factory=dict)
+    trivial: List[str] = field(default_factory=list)
+
+    @property
+    def duplicates(self) -> int:
+        return sum(len(seg_ids) for seg_ids in self.copies.values())
+
+    def stats(self, total: int) -> Dict[str, Any]:
+        saved = total - len(self.unique)
+        return {
+            "segments": total,
+            "unique_segments": len(self.unique),
+            "duplicate_segments": self.duplicates,
+            "trivial_segments": len(self.trivial),
+            "saved_share": round(saved / total, 3) if total else 0.0,
+        }
+
+
+def plan_dedup(
+    segments: Sequence[Dict[str, Any]],
+    dedupe: bool = True,
+    trivial_max_chars: int = 0,
+    trivial_patterns: Sequence[str] = (),
+) -> SegmentDedup:
+    """Group segments by a hash of their normalized text (every segment is kept
+    when ``dedupe`` is off).
+
+    A segment is trivial, and is not coded at all, when its normalized text is
+    empty, is at most ``trivial_max_chars`` characters long, or fully matches one
+    of ``trivial_patterns``. The patterns are regular expressions applied to the
+    normalized text.
+    """
+    patterns = [re.compile(pattern) for pattern in trivial_patterns]
+    plan = SegmentDedup()
+    first: Dict[str, str] = {}
+    for segment in segments:
+        seg_id = str(segment["seg_id"])
+        norm = normalize_text(segment["text"])
+        if not norm or len(norm) <= trivial_max_chars or any(p.fullmatch(norm) for p in patterns):
+            plan.trivial.append(seg_id)
+            continue
+        digest = hashlib.sha1(norm.encode("utf-8")).hexdigest() if dedupe else seg_id
+        if digest in first:
+            plan.copies.setdefault(first[digest], []).append(seg_id)
+            continue
+        first[digest] = seg_id
+        plan.unique.append(segment)
+    return plan
+
+
+def fan_out(
+    items: List[OpenCodingItem], plan: SegmentDedup, segments: Sequence[Dict[str, Any]]
+) -> List[OpenCodingItem]:
+    """Copy each coded item to the repeats of its segment, in original segment order.
+    Items whose seg_id is not in ``segments`` are kept at the end."""
+    coded = {item.seg_id: item for item in items}
+    known = {str(segment["seg_id"]) for segment in segments}
+    source = {dup: seg_id for seg_id, dups in plan.copies.items() for dup in dups}
+    out: List[OpenCodingItem] = []
+    for segment in segments:
+        seg_id = str(segment["seg_id"])
+        if seg_id in coded:
+            out.append(coded[seg_id])
+        elif seg_id in source and source[seg_id] in coded:
+            out.append(coded[source[seg_id]].model_copy(update={"seg_id": seg_id}, deep=True))
+    out.extend(item for item in items if item.seg_id not in known)
+    return out
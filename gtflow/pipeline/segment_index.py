@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import math
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models.schemas import AxialTriple
+from ..utils.file_io import exists, read_json, write_json
+from ..utils.text_utils import tokenize
+
+INDEX_FILE = "segment_index.json"
+_FORMAT_VERSION = 1
+
+
+def _fingerprint(segments: List[Dict[str, Any]]) -> str:
+    digest = hashlib.sha1()
+    for segment in segments:
+        digest.update(str(segment["seg_id"]).encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(segment["text"].encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+class SegmentIndex:
+    """BM25 inverted index over segments (Latin words + CJK bigrams via ``tokenize``)."""
+
+    def __init__(
+        self,
+        seg_ids: List[str],
+        doc_len: List[int],
+        postings: Dict[str, List[Tuple[int, int]]],
+        fingerprint: str = "",
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        self.seg_ids = seg_ids
+        self.doc_len = doc_len
+        self.postings = postings
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self.avgdl = (sum(doc_len) / len(doc_len)) if doc_len else 0.0
+        self._position = {seg_id: i for i, seg_id in enumerate(seg_ids)}
+
+    @classmethod
+    def build(cls, segments: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75) -> "SegmentIndex":
+        seg_ids: List[str] = []
+        doc_len: List[int] = []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for i, segment in enumerate(segments):
+            terms = tokenize(segment["text"])
+            seg_ids.append(str(segment["seg_id"]))
+            doc_len.append(len(terms))
+            for term, tf in Counter(terms).items():
+                postings.setdefault(term, []).append((i, tf))
+        return cls(seg_ids, doc_len, postings, _fingerprint(segments), k1, b)
+
+    def __len__(self) -> int:
+        return len(self.seg_ids)
+
+    def idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.seg_ids)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def query(
+        self, text: str, k: int = 10, restrict: Optional[List[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-``k`` (seg_id, score) pairs for ``text``, best first.
+
+        ``restrict`` limits the candidates to the given seg_ids.
+        """
+        allowed = None
+        if restrict is not None:
+            allowed = {self._position[s] for s in restrict if s in self._position}
+        scores: Dict[int, float] = {}
+        for term, qtf in Counter(tokenize(text)).items():
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = self.idf(term)
+            for doc, tf in plist:
+                if allowed is not None and doc not in allowed:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[doc] / (self.avgdl or 1.0))
+                scores[doc] = scores.get(doc, 0.0) + qtf * idf * tf * (self.k1 + 1.0) / (tf + norm)
+        best = heapq.nlargest(k, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+        return [(self.seg_ids[doc], round(score, 4)) for doc, score in best]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": _FORMAT_VERSION,
+            "fingerprint": self.fingerprint,
+            "k1": self.k1,
+            "b": self.b,
+            "seg_ids": self.seg_ids,
+            "doc_len": self.doc_len,
+            "postings": {term: [list(p) for p in plist] for term, plist in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SegmentIndex":
+        postings = {term: [(int(d), int(tf)) for d, tf in plist] for term, plist in data["postings"].items()}
+        return cls(data["seg_ids"], data["doc_len"], postings, data.get("fingerprint", ""), data.get("k1", 1.5), data.get("b", 0.75))
+
+    def save(self, path: str, compression: Optional[str] = None):
+        write_json(path, self.to_dict(), pretty=False, compression=compression)
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentIndex":
+        return cls.from_dict(read_json(path))
+
+
+def load_or_build_index(out_dir: str, segments: List[Dict[str, Any]], compression: Optional[str] = None) -> SegmentIndex:
+    """Load ``segment_index.json`` from the run directory, rebuilding it when the
+    segments changed since it was written."""
+    path = os.path.join(out_dir, INDEX_FILE)
+    if exists(path):
+        try:
+            data = read_json(path)
+            if data.get("version") == _FORMAT_VERSION and data.get("fingerprint") == _fingerprint(segments):
+                return SegmentIndex.from_dict(data)
+        except Exception:
+            pass
+    index = SegmentIndex.build(segments)
+    index.save(path, compression)
+    return index
+
+
+def ground_evidence(triples: List[AxialTriple], index: SegmentIndex, k: int = 3) -> int:
+    """Replace missing or unknown evidence seg_ids with the ``k`` best BM25 matches
+    for the triple's text. Returns the number of triples that were changed."""
+    known = set(index.seg_ids)
+    changed = 0
+    for triple in triples:
+        valid = [seg_id for seg_id in triple.evidence if seg_id in known]
+        if valid:
+            if len(valid) != len(triple.evidence):
+                triple.evidence = valid
+                changed += 1
+            continue
+        hits = index.query(f"{triple.condition} {triple.action} {triple.result}", k)
+        if hits:
+            triple.evidence = [seg_id for seg_id, _ in hits]
+            changed += 1
+    return changed
@@ -1,21 +1,29 @@
 from __future__ import annotations
 
-from typing import Dict, List
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 from pydantic import TypeAdapter
 
-from ..models.schemas import AxialTriple, Theory
+from ..cost import in_context
+from ..models.json_schema import response_format_for
+from ..models.schemas import AxialTriple, GroupSummary, Theory
 from ..providers.base import LLMProvider
+from ..rate_limiter import TokenBucket
 from ..utils.json_utils import try_parse_json
+from ..utils.text_utils import tokenize
+
+
+def _triple_line(triple: AxialTriple) -> str:
+    evidence = ",".join(triple.evidence[:5])
+    return f"- ({triple.condition}) -> ({triple.action}) -> ({triple.result}); evidence: {evidence}"
 
 
 def build_prompt(triples: List[AxialTriple]) -> List[Dict[str, str]]:
     lines: List[str] = []
     for triple in triples[:40]:
-        evidence = ",".join(triple.evidence[:5])
-        lines.append(
-            f"- ({triple.condition}) -> ({triple.action}) -> ({triple.result}); evidence: {evidence}"
-        )
+        lines.append(_triple_line(triple))
     txt = "\n".join(lines) if lines else "(no triples yet)"
     example = '{"core_category":"...","rationale":"...","storyline":"..."}'
     return [
@@ -33,13 +41,173 @@ def build_prompt(triples: List[AxialTriple]) -> List[Dict[str, str]]:
     ]
 
 
+def build_group_prompt(label: str, lines: List[str]) -> List[Dict[str, str]]:
+    example = '{"label":"...","mini_storyline":"...","key_conditions":["..."],"key_results":["..."]}'
+    txt = "\n".join(lines) if lines else "(empty group)"
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a qualitative methods expert. Condense one group of axial-coding material into "
+                "an intermediate mini-storyline that keeps the main conditions, actions and results. "
+                "Output JSON only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Group: {label}\n{txt}\nReturn: {example}",
+        },
+    ]
+
+
+def build_synthesis_prompt(summaries: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    txt = "\n".join(_summary_line(summary) for summary in summaries) or "(no summaries)"
+    example = '{"core_category":"...","rationale":"...","storyline":"..."}'
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are a qualitative methods expert. The mini-storylines below together cover every "
+                "axial triple of the study. Integrate them into a selective-coding theory: identify the "
+                "core category, provide a rationale, and draft a storyline. Output JSON only."
+            ),
+        },
+        {
+            "role": "user",
+            "content": f"Mini-storylines:\n{txt}\nReturn: {example}",
+        },
+    ]
+
+
 def build_theory(provider: LLMProvider, triples: List[AxialTriple]) -> Theory:
     messages = build_prompt(triples)
+    return _request_theory(provider, messages)
+
+
+def build_theory_hierarchical(
+    provider: LLMProvider,
+    triples: List[AxialTriple],
+    group_size: int = 40,
+    workers: int = 1,
+    rate_limiter: Optional[TokenBucket] = None,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Theory:
+    """Build the theory from all triples by map-reduce instead of the first 40.
+
+    Triples are grouped (by ``theme`` when present, otherwise by shared
+    condition/result terms) into groups of at most ``group_size``, each group is
+    condensed into a mini-storyline concurrently, and the summaries are reduced
+    again the same way until they fit in a single synthesis prompt. The
+    intermediate summaries of every level are written to ``stats["levels"]``.
+    """
+    size = max(2, group_size)
+    if len(triples) <= size:
+        return build_theory(provider, triples)
+
+    def summarise(job: Dict[str, Any]) -> Dict[str, Any]:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        raw = provider.generate_text(
+            build_group_prompt(job["label"], job["lines"]),
+            response_format=response_format_for(provider.conf, GroupSummary, "group_summary"),
+        )
+        data = try_parse_json(raw)
+        if not isinstance(data, dict):
+            data = {"mini_storyline": str(data)}
+        data.setdefault("label", job["label"])
+        data["sources"] = job["sources"]
+        return data
+
+    def map_level(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if workers <= 1 or len(jobs) <= 1:
+            return [summarise(job) for job in jobs]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(in_context(summarise), jobs))
+
+    jobs = [
+        {
+            "label": label,
+            "lines": [_triple_line(triple) for triple in group],
+            "sources": len(group),
+        }
+        for label, group in group_triples(triples, size)
+    ]
+    levels: List[List[Dict[str, Any]]] = []
+    summaries = map_level(jobs)
+    levels.append(summaries)
+    while len(summaries) > size:
+        jobs = [
+            {
+                "label": f"Level {len(levels) + 1} group {i // size + 1}",
+                "lines": [_summary_line(summary) for summary in summaries[i : i + size]],
+                "sources": sum(summary.get("sources", 0) for summary in summaries[i : i + size]),
+            }
+            for i in range(0, len(summaries), size)
+        ]
+        summaries = map_level(jobs)
+        levels.append(summaries)
+    if stats is not None:
+        stats["triples"] = len(triples)
+        stats["levels"] = levels
+    return _request_theory(provider, build_synthesis_prompt(summaries))
+
+
+def group_triples(
+    triples: List[AxialTriple], group_size: int = 40
+) -> List[Tuple[str, List[AxialTriple]]]:
+    """Partition triples into (label, triples) groups of at most ``group_size``.
+
+    Triples carrying a ``theme`` are grouped by it. The rest are anchored on the
+    condition/result term shared with the most other triples (terms found in over
+    half of all triples are treated as stop words); small anchors are packed
+    together so no request is wasted on a tiny group.
+    """
+    size = max(1, group_size)
+    term_sets = [set(tokenize(f"{t.condition} {t.result}")) for t in triples]
+    df = Counter(term for terms in term_sets for term in terms)
+    common = {term for term, n in df.items() if n * 2 > len(triples)}
+    term_sets = [terms - common for terms in term_sets]
+    buckets: Dict[str, List[AxialTriple]] = {}
+    for triple, terms in zip(triples, term_sets):
+        if triple.theme:
+            key = f"theme: {triple.theme}"
+        else:
+            shared = [term for term in terms if df[term] > 1]
+            key = f"terms: {max(shared, key=lambda term: (df[term], term))}" if shared else "misc"
+        buckets.setdefault(key, []).append(triple)
+
+    groups: List[Tuple[str, List[AxialTriple]]] = []
+    small: List[AxialTriple] = []
+    small_labels: List[str] = []
+    for key, bucket in sorted(buckets.items(), key=lambda kv: (-len(kv[1]), kv[0])):
+        if len(bucket) * 2 < size:
+            if len(small) + len(bucket) > size and small:
+                groups.append(("; ".join(small_labels[:5]), small))
+                small, small_labels = [], []
+            small.extend(bucket)
+            small_labels.append(key)
+            continue
+        for i in range(0, len(bucket), size):
+            suffix = f" ({i // size + 1})" if len(bucket) > size else ""
+            groups.append((f"{key}{suffix}", bucket[i : i + size]))
+    if small:
+        groups.append(("; ".join(small_labels[:5]), small))
+    return groups
+
+
+def _summary_line(summary: Dict[str, Any]) -> str:
+    parts = [f"- [{summary.get('label', '')}] {summary.get('mini_storyline', '')}"]
+    for field in ("key_conditions", "key_results"):
+        values = summary.get(field)
+        if isinstance(values, list) and values:
+            parts.append(f"{field}: {', '.join(str(v) for v in values[:6])}")
+    return "; ".join(parts)
+
+
+def _request_theory(provider: LLMProvider, messages: List[Dict[str, str]]) -> Theory:
     raw = provider.generate_text(
         messages,
-        response_format={"type": "json_object"}
-        if getattr(provider.conf, "structured", True)
-        else None,
+        response_format=response_format_for(provider.conf, Theory, "theory"),
     )
     data = try_parse_json(raw)
     adapter = TypeAdapter(Theory)
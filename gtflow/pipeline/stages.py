@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from ..budget import BudgetExceeded, BudgetGovernor
+from ..config import AppConfig
+from ..cost import usage_scope
+from ..models.schemas import Codebook, OpenCodingItem
+from ..profiling import Profiler
+from ..providers.base import LLMProvider
+from ..rate_limiter import TokenBucket
+from ..scheduler import Stage, StageSkipped, run_stages
+from ..utils.file_io import read_json, write_json, write_text
+from .artifacts import ArtifactStore
+from .axial_coder import build_axial, build_axial_by_theme, dedupe_triples
+from .codebook_builder import build_codebook
+from .deductive_coder import deductive_pass
+from .gioia_view import to_gioia
+from .negatives_scanner import scan_negatives
+from .open_coder import run_open_coding
+from .report_html import write_report
+from .saturation import SaturationMonitor, coding_order, saturation
+from .segment_dedup import fan_out, plan_dedup
+from .segment_index import ground_evidence, load_or_build_index
+from .segmenter import segment_text
+from .selective_coder import build_theory, build_theory_hierarchical
+
+@dataclass
+class PipelineContext:
+    """Everything the pipeline stages share during one run.
+
+    ``input_text`` is only called when the segments have to be (re)built.
+    ``open_code`` replaces the in-process open coder (the CLI uses it for the work
+    queue); it receives the unique segments and a stats dict. Stage usage, dedup
+    and queue statistics are collected in ``run_meta``; ``remote_usage`` holds the
+    usage reported by queue workers, which no local provider saw. With a
+    ``profiler`` the stages run one at a time, each inside ``profiler.stage(name)``.
+    ``store`` holds the artifacts of the run (an ``ArtifactStore`` on ``out_dir``
+    unless given).
+    """
+
+    conf: AppConfig
+    providers: Dict[str, LLMProvider]
+    out_dir: str
+    input_text: Callable[[], str]
+    force: bool = False
+    governor: Optional[BudgetGovernor] = None
+    log: Callable[[str], None] = lambda message: None
+    open_code: Optional[Callable[[List[Dict[str, Any]], Dict[str, Any]], List[OpenCodingItem]]] = None
+    run_meta: Dict[str, Any] = field(default_factory=lambda: {"stages": {}})
+    remote_usage: Dict[str, Any] = field(default_factory=dict)
+    halted: Optional[BudgetExceeded] = None
+    profiler: Optional[Profiler] = None
+    store: Optional[ArtifactStore] = None
+
+    def __post_init__(self) -> None:
+        if self.store is None:
+            self.store = ArtifactStore(self.out_dir, compression=self.conf.output.compression)
+
+    def halt(self, stage: str, exc: BudgetExceeded) -> None:
+        self.halted = exc
+        if self.governor is not None:
+            self.governor.note(stage, "stopped", str(exc))
+        self.log(f"[warn]{exc}; remaining LLM stages skipped.[/warn]")
+        raise StageSkipped(str(exc))
+
+    def check_halted(self) -> None:
+        if self.halted is not None:
+            raise StageSkipped(f"budget exhausted in {self.halted.stage}")
+
+
+def pipeline_stages(ctx: PipelineContext) -> List[Stage]:
+    """The GTFlow stage graph. Each stage declares the artifacts it reads and
+    writes; stages whose files already exist in ``ctx.out_dir`` are loaded instead
+    of run unless ``ctx.force`` is set. Artifacts are persisted by ``ctx.store``
+    when a stage returns them."""
+    conf = ctx.conf
+    providers = ctx.providers
+
+    def path(name: str) -> str:
+        return os.path.join(ctx.out_dir, name)
+
+    def loader(*names: str) -> Callable[[], Optional[Dict[str, Any]]]:
+        def load() -> Optional[Dict[str, Any]]:
+            return None if ctx.force else ctx.store.from_disk(*names)
+
+        return load
+
+    def segment(a: Dict[str, Any]) -> Dict[str, Any]:
+        segs = segment_text(
+            ctx.input_text(),
+            conf.run.segmentation_strategy,
+            conf.run.max_segment_chars,
+            conf.run.max_segment_tokens,
+        )
+        ctx.log(f"[ok] segments: {len(segs)}")
+        return {"segments": [s.model_dump() for s in segs]}
+
+    def index(a: Dict[str, Any]) -> Dict[str, Any]:
+        return {"index": load_or_build_index(ctx.out_dir, a["segments"], ctx.conf.output.compression)}
+
+    def open_coding(a: Dict[str, Any]) -> Dict[str, Any]:
+        seg_dicts = a["segments"]
+        oc_stats: Dict[str, Any] = {}
+        dedup = plan_dedup(
+            seg_dicts,
+            conf.run.dedupe_segments,
+            conf.run.trivial_segment_max_chars,
+            conf.run.trivial_segment_patterns,
+        )
+        to_code = dedup.unique
+        if len(to_code) < len(seg_dicts):
+            ctx.log(
+                f"[info]Coding {len(to_code)} of {len(seg_dicts)} segments ({dedup.duplicates} repeats, "
+                f"{len(dedup.trivial)} trivial skipped).[/info]"
+            )
+        deductive = conf.open_coding_deductive
+        deductive_items: List[OpenCodingItem] = []
+        deductive_stats = None
+        if deductive.enabled and deductive.codebook:
+            deductive_items, to_code, deductive_stats = deductive_pass(
+                to_code,
+                Codebook.model_validate(read_json(deductive.codebook)),
+                deductive.min_confidence,
+                deductive.min_phrase_chars,
+                deductive.use_examples,
+            )
+            ctx.log(
+                f"[info]Deductive pre-pass coded {deductive_stats['coded']} of {deductive_stats['segments']} segments "
+                f"locally; {len(to_code)} go to the LLM.[/info]"
+            )
+        elif deductive.enabled:
+            ctx.log("[warn]open_coding_deductive needs a codebook file in run-all; pre-pass skipped.[/warn]")
+        early = conf.open_coding_early_stop
+        monitor = None
+        if early.enabled:
+            to_code = coding_order(to_code, early.order, early.seed)
+            if ctx.open_code is not None:
+                ctx.log("[warn]open_coding_early_stop is not applied in work-queue mode; every segment is coded.[/warn]")
+            else:
+                monitor = SaturationMonitor(early.window, early.threshold, early.patience, early.min_segments)
+        with usage_scope("open_coding") as used:
+            if ctx.open_code is not None:
+                items = ctx.open_code(to_code, oc_stats)
+            else:
+                items = run_open_coding(
+                    providers["open_coding"],
+                    to_code,
+                    batch_size=conf.run.batch_size,
+                    max_retries=conf.run.retry_max,
+                    workers=conf.run.concurrent_workers,
+                    rate_limiter=TokenBucket(conf.run.rate_limit_rps),
+                    fallback_provider=providers.get("open_coding_strong"),
+                    min_codes_per_segment=conf.open_coding_cascade.min_codes_per_segment,
+                    stats=oc_stats,
+                    output_format=conf.run.open_coding_format,
+                    monitor=monitor,
+                    sample_every=early.sample_every if early.after_saturation == "sample" else 0,
+                )
+        items = fan_out(items + deductive_items, dedup, seg_dicts)
+        remote = "usage" in oc_stats
+        if remote:
+            ctx.remote_usage = dict(oc_stats["usage"])
+            ctx.run_meta["queue"] = {k: oc_stats[k] for k in ("path", "run_id", "jobs", "workers", "errors")}
+        meta = dict(oc_stats["usage"]) if remote else used.to_dict()
+        meta["dedup"] = dedup.stats(len(seg_dicts))
+        if deductive_stats is not None:
+            meta["deductive"] = deductive_stats
+        if "open_coding_strong" in providers or remote:
+            meta.update({k: oc_stats[k] for k in ("batches", "escalated_batches")})
+        if monitor is not None:
+            not_coded = oc_stats.get("saturation_skipped_seg_ids", [])
+            meta["early_stop"] = {
+                "order": early.order,
+                "after_saturation": early.after_saturation,
+                "coded_segments": len(to_code) - len(not_coded) - len(oc_stats.get("skipped_seg_ids", [])),
+                "skipped_segments": len(not_coded),
+                **monitor.to_dict(),
+                "skipped_seg_ids": not_coded,
+            }
+            if monitor.saturated_at is not None:
+                ctx.log(
+                    f"[info]Saturation reached after {monitor.saturated_at} coded segments; "
+                    f"{len(not_coded)} of {len(to_code)} segments not coded.[/info]"
+                )
+        ctx.run_meta["stages"]["open_coding"] = meta
+        skipped = oc_stats.get("skipped_seg_ids")
+        if skipped and remote:
+            ctx.log(f"[warn]{len(skipped)} segments were not coded: their queue jobs failed (see run_meta.json).[/warn]")
+        elif skipped:
+            if ctx.governor is not None:
+                ctx.governor.note(
+                    "open_coding",
+                    "stopped",
+                    f"budget reached; {len(items)} segments coded, {len(skipped)} not coded",
+                    skipped_seg_ids=skipped,
+                )
+            ctx.log(f"[warn]Budget reached: open coding stopped after {len(items)} segments ({len(skipped)} skipped).[/warn]")
+        return {"open_codes": items}
+
+    def codebook(a: Dict[str, Any]) -> Dict[str, Any]:
+        ctx.check_halted()
+        with usage_scope("codebook") as used:
+            try:
+                result = build_codebook(providers["codebook"], a["open_codes"])
+            except BudgetExceeded as e:
+                ctx.halt("codebook", e)
+            finally:
+                ctx.run_meta["stages"]["codebook"] = used.to_dict()
+        return {"codebook": result}
+
+    def axial(a: Dict[str, Any]) -> Dict[str, Any]:
+        ctx.check_halted()
+        with usage_scope("axial") as used:
+            try:
+                if conf.run.axial_mode == "per_theme":
+                    triples = build_axial_by_theme(
+                        providers["axial"],
+                        a["codebook"],
+                        a["open_codes"],
+                        a["segments"],
+                        workers=conf.run.concurrent_workers,
+                        max_codes_per_group=conf.run.axial_max_codes_per_group,
+                        max_segments_per_group=conf.run.axial_max_segments_per_group,
+                        rate_limiter=TokenBucket(conf.run.rate_limit_rps),
+                    )
+                else:
+                    triples = build_axial(providers["axial"], a["codebook"])
+            except BudgetExceeded as e:
+                ctx.halt("axial", e)
+            finally:
+                ctx.run_meta["stages"]["axial"] = used.to_dict()
+        if conf.run.triple_dedup_threshold:
+            produced = len(triples)
+            triples = dedupe_triples(triples, conf.run.triple_dedup_threshold)
+            if produced > len(triples):
+                ctx.log(f"[info]Merged {produced - len(triples)} near-duplicate triples ({len(triples)} kept).[/info]")
+        if conf.run.axial_evidence_top_k:
+            grounded = ground_evidence(triples, a["index"], conf.run.axial_evidence_top_k)
+            if grounded:
+                ctx.log(f"[info]Evidence looked up in the segment index for {grounded} triples.[/info]")
+        return {"axial_triples": triples}
+
+    def theory(a: Dict[str, Any]) -> Dict[str, Any]:
+        ctx.check_halted()
+        with usage_scope("theory") as used:
+            try:
+                if conf.run.selective_mode == "hierarchical":
+                    th_stats: Dict[str, Any] = {}
+                    result = build_theory_hierarchical(
+                        providers["theory"],
+                        a["axial_triples"],
+                        group_size=conf.run.selective_group_size,
+                        workers=conf.run.concurrent_workers,
+                        rate_limiter=TokenBucket(conf.run.rate_limit_rps),
+                        stats=th_stats,
+                    )
+                    if th_stats:
+                        write_json(path("theory_groups.json"), th_stats, compression=conf.output.compression)
+                else:
+                    result = build_theory(providers["theory"], a["axial_triples"])
+            except BudgetExceeded as e:
+                ctx.halt("theory", e)
+            finally:
+                ctx.run_meta["stages"]["theory"] = used.to_dict()
+        write_text(
+            path("theory.md"),
+            f"# Core Category\n\n{result.core_category}\n\n## Storyline\n\n{result.storyline}\n",
+        )
+        return {"theory": result}
+
+    def gioia(a: Dict[str, Any]) -> Dict[str, Any]:
+        return {"gioia": to_gioia(a["codebook"])}
+
+    def negatives(a: Dict[str, Any]) -> Dict[str, Any]:
+        ctx.check_halted()
+        if ctx.governor is not None and ctx.governor.should_skip("negatives"):
+            raise StageSkipped("optional stage skipped by budget")
+        with usage_scope("negatives") as used:
+            try:
+                negs = scan_negatives(
+                    providers["negatives"],
+                    a["segments"],
+                    a["theory"].storyline,
+                    index=a["index"],
+                    top_k=conf.run.negatives_top_k,
+                )
+            except BudgetExceeded as e:
+                if ctx.governor is not None:
+                    ctx.governor.note("negatives", "skipped", str(e))
+                raise StageSkipped(str(e))
+            finally:
+                ctx.run_meta["stages"]["negatives"] = used.to_dict()
+        return {"negatives": negs}
+
+    def sat(a: Dict[str, Any]) -> Dict[str, Any]:
+        return {"saturation": saturation(ctx.store.plain("open_codes"))}
+
+    def report(a: Dict[str, Any]) -> Dict[str, Any]:
+        open_items = a["open_codes"]
+        stats = {
+            "segments": len(a["segments"]),
+            "open_codes": sum(len(i.initial_codes) for i in open_items),
+            "codebook_entries": len(a["codebook"].entries),
+            "triples": len(a["axial_triples"]),
+        }
+        mode = write_report(
+            path("report.html"),
+            stats,
+            a["gioia"],
+            ctx.store.plain("axial_triples"),
+            open_items,
+            a["codebook"],
+            segments=a["segments"],
+            mode=conf.output.report_mode,
+            page_size=conf.output.report_page_size,
+            max_graph_edges=conf.output.report_graph_max_edges,
+        )
+        ctx.run_meta["report_mode"] = mode
+        return {"report": mode}
+
+    return [
+        Stage("segment", (), ("segments",), segment, loader("segments"), "Segment"),
+        Stage("index", ("segments",), ("index",), index, title="Segment Index"),
+        Stage("open_coding", ("segments",), ("open_codes",), open_coding, loader("open_codes"), "Open Coding"),
+        Stage("codebook", ("open_codes",), ("codebook",), codebook, loader("codebook"), "Codebook"),
+        Stage("saturation", ("open_codes",), ("saturation",), sat, loader("saturation"), "Saturation"),
+        Stage("gioia", ("codebook",), ("gioia",), gioia, loader("gioia"), "Gioia View"),
+        Stage(
+            "axial",
+            ("codebook", "open_codes", "segments", "index"),
+            ("axial_triples",),
+            axial,
+            loader("axial_triples"),
+            "Axial Coding",
+        ),
+        Stage("theory", ("axial_triples",), ("theory",), theory, loader("theory"), "Selective Coding / Theory"),
+        Stage(
+            "negatives",
+            ("segments", "theory", "index"),
+            ("negatives",),
+            negatives,
+            loader("negatives"),
+            "Negative Cases",
+        ),
+        Stage(
+            "report",
+            ("segments", "open_codes", "codebook", "axial_triples", "gioia"),
+            ("report",),
+            report,
+            title="HTML Report",
+        ),
+    ]
+
+
+def run_pipeline(
+    ctx: PipelineContext,
+    on_event: Optional[Callable[[Stage, str], None]] = None,
+) -> Dict[str, Any]:
+    """Run the stage graph for ``ctx``; returns the artifact store once every
+    artifact has been written. The schedule (stage timings and critical path) is
+    stored in ``ctx.run_meta["schedule"]``."""
+    try:
+        ctx.run_meta["schedule"] = run_stages(
+            pipeline_stages(ctx),
+            ctx.store,
+            max_parallel=1 if ctx.profiler else ctx.conf.run.max_parallel_stages,
+            on_event=on_event,
+            around=(lambda stage: ctx.profiler.stage(stage.name)) if ctx.profiler else None,
+        )
+    finally:
+        ctx.store.close()
+    return ctx.store
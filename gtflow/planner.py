@@ -0,0 +1,204 @@
+from __future__ import annotations
+import math
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Union
+
+from .config import AppConfig, ProviderConfig
+from .cost import Usage, estimate_cost
+from .models.schemas import AxialTriple, Codebook, CodebookEntry, InitialCode, OpenCodingItem, Segment
+from .pipeline import axial_coder, codebook_builder, negatives_scanner, open_coder, selective_coder
+from .pipeline.deductive_coder import deductive_pass
+from .pipeline.segment_dedup import plan_dedup
+from .utils.file_io import read_json
+from .utils.text_utils import estimate_message_tokens
+
+# Output-size assumptions for the single-request stages (tokens per produced unit).
+_CODEBOOK_TOKENS_PER_ENTRY = 90
+_AXIAL_TOKENS_PER_TRIPLE = 45
+_AXIAL_TRIPLES = 20
+_AXIAL_TRIPLES_PER_THEME = 6
+_GROUP_SUMMARY_TOKENS = 200
+_THEORY_OUTPUT_TOKENS = 400
+_NEGATIVES_OUTPUT_TOKENS = 300
+_PLACEHOLDER_DEFINITION = "placeholder definition of typical length for a code"
+
+@dataclass
+class StagePlan:
+    stage: str
+    model: str
+    requests: float
+    input_tokens: int
+    output_tokens: int
+    estimated_cost: float
+    wall_sec: float
+    # True when the real figure can only be lower (open coding with early stop)
+    upper_bound: bool = False
+
+def _pricing(pconf: Union[ProviderConfig, List[ProviderConfig]]) -> Dict[str, Any]:
+    """Weight-averaged prices for a provider or pool (requests spread by weight)."""
+    members = pconf if isinstance(pconf, list) else [pconf]
+    total = sum(max(0.01, m.weight) for m in members)
+    return {
+        "model": "+".join(sorted({m.deployment or m.model for m in members})),
+        "price_in": sum(m.price_input_per_1k * max(0.01, m.weight) for m in members) / total,
+        "price_out": sum(m.price_output_per_1k * max(0.01, m.weight) for m in members) / total,
+        "max_tokens": min(m.max_tokens for m in members),
+    }
+
+def _stage(stage: str, pricing: Dict[str, Any], requests: float, in_tok: int, out_tok: int, wall: float, upper_bound: bool = False) -> StagePlan:
+    cost = estimate_cost(Usage(in_tok, out_tok), pricing["price_in"], pricing["price_out"])
+    return StagePlan(stage, pricing["model"], round(requests, 2), in_tok, out_tok, round(cost, 6), round(wall, 1), upper_bound)
+
+def plan_run(
+    conf: AppConfig,
+    segments: List[Segment],
+    output_tokens_per_segment: int = 150,
+    codes_per_segment: float = 2.0,
+    base_latency_sec: float = 2.0,
+    output_tokens_per_sec: float = 50.0,
+    escalation_rate: float = 0.1,
+) -> Dict[str, Any]:
+    """Project requests, tokens, cost and wall time for `run_all` without calling a provider.
+
+    Prompts are built with each stage's real `build_prompt`; downstream stages whose
+    inputs do not exist yet are fed placeholder codes/entries/triples sized from
+    `codes_per_segment`. Single-request stages assume the model writes up to its
+    `max_tokens`-capped projection. The deductive pre-pass is applied as configured
+    (it runs locally); with early stop on, open coding is planned for every segment
+    and flagged as an upper bound. `axial_mode="per_theme"` is planned as one request
+    per code group, `selective_mode="hierarchical"` as one request per group of
+    triples (and of summaries, level by level) plus the synthesis. With
+    `negatives_top_k` the negatives prompt holds the `top_k` longest segments.
+    """
+    def latency(out_tokens: float) -> float:
+        return base_latency_sec + out_tokens / max(1.0, output_tokens_per_sec)
+
+    def fan_out_wall(requests: int, avg_latency: float) -> float:
+        # concurrent requests, bounded by the workers and the rate limit
+        if not requests:
+            return 0.0
+        return max(math.ceil(requests / max(1, conf.run.concurrent_workers)) * avg_latency, requests / max(0.1, conf.run.rate_limit_rps))
+
+    plans: List[StagePlan] = []
+    seg_dicts = [s.model_dump() for s in segments]
+
+    # open coding: one request per batch of unique, non-trivial segments, concurrent and rate limited
+    oc = _pricing(conf.stage_provider("open_coding"))
+    bs = max(1, conf.run.batch_size)
+    dedup = plan_dedup(seg_dicts, conf.run.dedupe_segments, conf.run.trivial_segment_max_chars, conf.run.trivial_segment_patterns)
+    to_code = dedup.unique
+    deductive = conf.open_coding_deductive
+    deductive_stats = None
+    if deductive.enabled and deductive.codebook:
+        _, to_code, deductive_stats = deductive_pass(
+            to_code, Codebook.model_validate(read_json(deductive.codebook)),
+            deductive.min_confidence, deductive.min_phrase_chars, deductive.use_examples,
+        )
+    early_stop = conf.open_coding_early_stop.enabled
+    batches = [to_code[i:i + bs] for i in range(0, len(to_code), bs)]
+    oc_in = sum(estimate_message_tokens(open_coder.build_prompt(b, conf.run.open_coding_format == "compact")) for b in batches)
+    oc_out = sum(min(oc["max_tokens"], len(b) * output_tokens_per_segment) for b in batches)
+    warnings: List[str] = []
+    if early_stop:
+        warnings.append(
+            "open_coding: early stop is on, so the open-coding figures are a maximum; coding stops or thins out "
+            f"once new codes saturate (after at least {conf.open_coding_early_stop.min_segments} segments)."
+        )
+    if deductive.enabled and not deductive.codebook:
+        warnings.append("open_coding: the deductive pre-pass needs a codebook file in run-all; planned without it.")
+    truncated = sum(1 for b in batches if len(b) * output_tokens_per_segment > oc["max_tokens"])
+    if truncated:
+        warnings.append(
+            f"open_coding: {truncated}/{len(batches)} batches are projected to exceed max_tokens={oc['max_tokens']}; "
+            "lower batch_size or raise max_tokens to avoid truncated JSON."
+        )
+    n = len(batches)
+    avg_lat = latency(oc_out / n) if n else 0.0
+    oc_wall = fan_out_wall(n, avg_lat)
+    plans.append(_stage("open_coding", oc, n, oc_in, oc_out, oc_wall, upper_bound=early_stop))
+    if conf.open_coding_cascade.enabled and n:
+        strong = _pricing(conf.resolve_provider(conf.open_coding_cascade.strong))
+        esc = n * escalation_rate
+        plans.append(_stage("open_coding_escalation", strong, esc, int(oc_in * escalation_rate), int(oc_out * escalation_rate), esc / n * oc_wall, upper_bound=early_stop))
+
+    # codebook from placeholder open codes
+    unique_codes = max(1, round(len(segments) * codes_per_segment * 0.3))
+    items = [
+        OpenCodingItem(seg_id=f"{i:04d}", initial_codes=[InitialCode(code=f"code_{i:04d}", definition=_PLACEHOLDER_DEFINITION)])
+        for i in range(min(unique_codes, 200))
+    ]
+    cb = _pricing(conf.stage_provider("codebook"))
+    cb_out = min(cb["max_tokens"], min(unique_codes, 60) * _CODEBOOK_TOKENS_PER_ENTRY)
+    plans.append(_stage("codebook", cb, 1, estimate_message_tokens(codebook_builder.build_prompt(items)), cb_out, latency(cb_out)))
+
+    # axial from a placeholder codebook: one request, or one per theme group with sampled segments
+    codebook = Codebook(entries=[CodebookEntry(code=f"code_{i:04d}", definition=_PLACEHOLDER_DEFINITION) for i in range(min(unique_codes, 60))])
+    ax = _pricing(conf.stage_provider("axial"))
+    if conf.run.axial_mode == "per_theme":
+        groups = axial_coder.group_codes(codebook, conf.run.axial_max_codes_per_group)
+        sample = [dict(s, text=s["text"][:300]) for s in dedup.unique[:conf.run.axial_max_segments_per_group]]
+        ax_in = sum(estimate_message_tokens(axial_coder.build_group_prompt(label, entries, sample)) for _, label, entries in groups)
+        group_out = min(ax["max_tokens"], _AXIAL_TRIPLES_PER_THEME * _AXIAL_TOKENS_PER_TRIPLE)
+        n_triples = len(groups) * _AXIAL_TRIPLES_PER_THEME
+        plans.append(_stage("axial", ax, len(groups), ax_in, group_out * len(groups), fan_out_wall(len(groups), latency(group_out))))
+    else:
+        ax_out = min(ax["max_tokens"], _AXIAL_TRIPLES * _AXIAL_TOKENS_PER_TRIPLE)
+        n_triples = _AXIAL_TRIPLES
+        plans.append(_stage("axial", ax, 1, estimate_message_tokens(axial_coder.build_prompt(codebook)), ax_out, latency(ax_out)))
+
+    # theory from placeholder triples: one request, or a map-reduce over groups of triples
+    triple = AxialTriple(condition="condition", action="action", result="result", evidence=["0001", "0002"])
+    th = _pricing(conf.stage_provider("theory"))
+    th_out = min(th["max_tokens"], _THEORY_OUTPUT_TOKENS)
+    size = max(2, conf.run.selective_group_size)
+    if conf.run.selective_mode == "hierarchical" and n_triples > size:
+        summary_out = min(th["max_tokens"], _GROUP_SUMMARY_TOKENS)
+        summary = {"label": "group", "mini_storyline": "storyline " * (summary_out // 2)}
+        th_requests, th_in, th_out_total, th_wall = 1, 0, th_out, latency(th_out)
+        lines = [selective_coder._triple_line(triple)] * n_triples
+        while len(lines) > size:
+            jobs = [lines[i:i + size] for i in range(0, len(lines), size)]
+            th_in += sum(estimate_message_tokens(selective_coder.build_group_prompt("group", job)) for job in jobs)
+            th_requests += len(jobs)
+            th_out_total += summary_out * len(jobs)
+            th_wall += fan_out_wall(len(jobs), latency(summary_out))
+            lines = [selective_coder._summary_line(summary)] * len(jobs)
+        th_in += estimate_message_tokens(selective_coder.build_synthesis_prompt([summary] * len(lines)))
+        plans.append(_stage("theory", th, th_requests, th_in, th_out_total, th_wall))
+    else:
+        triples = [triple] * n_triples
+        plans.append(_stage("theory", th, 1, estimate_message_tokens(selective_coder.build_prompt(triples)), th_out, latency(th_out)))
+
+    # negatives over every segment (or the `negatives_top_k` longest ones the index
+    # may retrieve) with a storyline-sized placeholder
+    ng = _pricing(conf.stage_provider("negatives"))
+    ng_out = min(ng["max_tokens"], _NEGATIVES_OUTPUT_TOKENS)
+    storyline = "storyline " * (_THEORY_OUTPUT_TOKENS // 2)
+    ng_segs = seg_dicts
+    if conf.run.negatives_top_k:
+        ng_segs = sorted(seg_dicts, key=lambda s: len(s["text"]), reverse=True)[:conf.run.negatives_top_k]
+    plans.append(_stage("negatives", ng, 1, estimate_message_tokens(negatives_scanner.build_prompt(ng_segs, storyline)), ng_out, latency(ng_out)))
+
+    totals = {
+        "requests": round(sum(p.requests for p in plans), 2),
+        "input_tokens": sum(p.input_tokens for p in plans),
+        "output_tokens": sum(p.output_tokens for p in plans),
+        "estimated_cost": round(sum(p.estimated_cost for p in plans), 6),
+        "wall_sec": round(sum(p.wall_sec for p in plans), 1),
+        "upper_bound": any(p.upper_bound for p in plans),
+    }
+    return {
+        "segments": len(segments),
+        "dedup": dedup.stats(len(seg_dicts)),
+        "deductive": deductive_stats,
+        "assumptions": {
+            "output_tokens_per_segment": output_tokens_per_segment,
+            "codes_per_segment": codes_per_segment,
+            "base_latency_sec": base_latency_sec,
+            "output_tokens_per_sec": output_tokens_per_sec,
+            "escalation_rate": escalation_rate if conf.open_coding_cascade.enabled else None,
+        },
+        "stages": [asdict(p) for p in plans],
+        "totals": totals,
+        "warnings": warnings,
+    }
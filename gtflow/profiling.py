@@ -0,0 +1,214 @@
+from __future__ import annotations
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from .cost import _THREAD_HOOK
+from .providers.base import LLMProvider
+from .utils.file_io import ensure_dir, write_json
+
+# Stage being profiled in the current context; provider calls are timed against it.
+_ACTIVE: contextvars.ContextVar[Optional["StageProfile"]] = contextvars.ContextVar("gtflow_profile_stage", default=None)
+
+def _enable(profile: cProfile.Profile) -> bool:
+    # Python 3.12+ allows one active profiler per process, and it already sees every
+    # thread; older versions profile the calling thread only.
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+class StageProfile:
+    """CPU profile, memory and provider wait of one stage (or one whole command).
+
+    `provider_call_sec` adds up the duration of every provider call, so it can exceed
+    the wall time when calls run concurrently; `provider_wait_sec` is the wall time
+    during which at least one call was in flight, and `local_sec` the rest.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_sec = 0.0
+        self.cpu_sec = 0.0
+        self.provider_calls = 0
+        self.provider_call_sec = 0.0
+        self.provider_wait_sec = 0.0
+        self.peak_bytes = 0
+        self.retained_bytes = 0
+        self.allocations: List[Dict[str, Any]] = []
+        self.stats: Optional[pstats.Stats] = None
+        self._in_flight = 0
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    def call_started(self) -> float:
+        now = time.perf_counter()
+        with self._lock:
+            if self._in_flight == 0:
+                self._since = now
+            self._in_flight += 1
+        return now
+
+    def call_finished(self, started: float):
+        now = time.perf_counter()
+        with self._lock:
+            self.provider_calls += 1
+            self.provider_call_sec += now - started
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.provider_wait_sec += now - self._since
+
+    def add_profile(self, profile: cProfile.Profile):
+        with self._lock:
+            try:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile, stream=io.StringIO())
+                else:
+                    self.stats.add(profile)
+            except TypeError:
+                pass  # nothing was recorded
+
+    def run_in_thread(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Profile a call that `in_context` runs on an executor thread for this stage."""
+        profile = cProfile.Profile()
+        if not _enable(profile):
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.add_profile(profile)
+
+    def top_functions(self, limit: int = 10) -> List[Dict[str, Any]]:
+        if self.stats is None:
+            return []
+        rows = sorted(self.stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:limit]
+        return [
+            {"function": pstats.func_std_string(func), "calls": nc, "tottime": round(tt, 4), "cumtime": round(ct, 4)}
+            for func, (cc, nc, tt, ct, callers) in rows
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wall_sec": round(self.wall_sec, 3),
+            "provider_wait_sec": round(self.provider_wait_sec, 3),
+            "local_sec": round(max(0.0, self.wall_sec - self.provider_wait_sec), 3),
+            "cpu_sec": round(self.cpu_sec, 3),
+            "provider_calls": self.provider_calls,
+            "provider_call_sec": round(self.provider_call_sec, 3),
+            "peak_mb": round(self.peak_bytes / 2**20, 2),
+            "retained_mb": round(self.retained_bytes / 2**20, 2),
+            "top_allocations": self.allocations,
+            "top_functions": self.top_functions(),
+        }
+
+class ProfiledProvider(LLMProvider):
+    """Provider wrapper that times every call against the stage being profiled."""
+    def __init__(self, inner: LLMProvider):
+        super().__init__(inner.conf)
+        self.inner = inner
+
+    def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        stage = _ACTIVE.get()
+        started = stage.call_started() if stage else 0.0
+        try:
+            text, usage = self.inner.generate_with_usage(messages, response_format=response_format, **kwargs)
+        finally:
+            if stage:
+                stage.call_finished(started)
+        self._update_usage(usage.input_tokens, usage.output_tokens, cost=usage.cost, scoped=False)
+        return text
+
+class Profiler:
+    """Collects one StageProfile per `stage(name)` block (re-entering a name adds to it).
+
+    Stages are meant to run one at a time: CPU time and traced memory are measured for
+    the whole process. Tracing memory with tracemalloc slows Python code down, so
+    compare timings only between profiled runs.
+    """
+    def __init__(self, memory: bool = True, top: int = 10):
+        self.stages: Dict[str, StageProfile] = {}
+        self.top = top
+        self.memory = memory and not tracemalloc.is_tracing()
+        if self.memory:
+            tracemalloc.start()
+
+    def wrap(self, provider: LLMProvider) -> LLMProvider:
+        return ProfiledProvider(provider)
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageProfile]:
+        prof = self.stages.setdefault(name, StageProfile(name))
+        before = self._snapshot()
+        if before is not None:
+            tracemalloc.reset_peak()
+            start_bytes = tracemalloc.get_traced_memory()[0]
+        active = _ACTIVE.set(prof)
+        hook = _THREAD_HOOK.set(prof.run_in_thread)
+        profile = cProfile.Profile()
+        enabled = _enable(profile)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield prof
+        finally:
+            prof.wall_sec += time.perf_counter() - t0
+            prof.cpu_sec += time.process_time() - c0
+            if enabled:
+                profile.disable()
+                prof.add_profile(profile)
+            _THREAD_HOOK.reset(hook)
+            _ACTIVE.reset(active)
+            if before is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                prof.peak_bytes = max(prof.peak_bytes, peak)
+                prof.retained_bytes += current - start_bytes
+                diff = self._snapshot().compare_to(before, "lineno")[: self.top]
+                prof.allocations = sorted(
+                    prof.allocations + [
+                        {"where": str(d.traceback[0]), "size_kb": round(d.size_diff / 1024, 1), "count": d.count_diff}
+                        for d in diff if d.size_diff > 0
+                    ],
+                    key=lambda a: a["size_kb"], reverse=True,
+                )[: self.top]
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: prof.to_dict() for name, prof in self.stages.items()}
+
+    def write(self, out_dir: str) -> str:
+        """Write `summary.json` plus, per stage, `<stage>.prof` (pstats format, for
+        snakeviz or `python -m pstats`) and `<stage>.txt` (top functions by cumulative
+        time) to `out_dir`. Stops memory tracing started by this profiler."""
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        ensure_dir(out_dir)
+        for name, prof in self.stages.items():
+            if prof.stats is None:
+                continue
+            base = os.path.join(out_dir, re.sub(r"[^\w.-]+", "_", name))
+            prof.stats.dump_stats(base + ".prof")
+            stream = io.StringIO()
+            prof.stats.stream = stream
+            prof.stats.sort_stats("cumulative").print_stats(40)
+            with open(base + ".txt", "w", encoding="utf-8") as f:
+                f.write(stream.getvalue())
+        write_json(os.path.join(out_dir, "summary.json"), self.summary())
+        return out_dir
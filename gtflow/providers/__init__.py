@@ -3,3 +3,6 @@ from .base import LLMProvider, make_provider
 from .openai_compatible import OpenAICompatibleProvider
 from .azure_openai_provider import AzureOpenAIProvider
 from .anthropic_provider import AnthropicProvider
+from .mock import MockProvider
+from .pool import PooledProvider
+from .hedge import HedgedProvider
@@ -1,8 +1,10 @@
-
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from .base import LLMProvider
+from ..config import RunConfig
 
 class AzureOpenAIProvider(LLMProvider):
     """Azure OpenAI (not strictly the same path as OpenAI).
@@ -12,13 +14,45 @@ class AzureOpenAIProvider(LLMProvider):
       - conf.deployment (Azure deployment name)
       - conf.api_version (e.g., 2024-02-15-preview)
       - conf.api_key
+
+    Requests go through one `requests.Session` per provider, so TCP/TLS connections
+    are kept alive and reused across calls and threads. The pool holds
+    `conf.http_pool_size` connections (default: `run.concurrent_workers`), the read
+    timeout is `run.timeout_sec`, and failed connection attempts are retried twice.
+    `response_format` is sent as-is; if the deployment rejects it and
+    `conf.json_mode_fallback` is set, the request is repeated with plain JSON mode
+    (for a strict `json_schema`) or without it, and stays downgraded for this provider.
     """
-    def __init__(self, conf):
+    def __init__(self, conf, run: Optional[RunConfig] = None):
         super().__init__(conf)
         if not conf.endpoint or not conf.deployment or not conf.api_key:
             raise ValueError("AzureOpenAI requires endpoint, deployment and api_key.")
-        self.url = f"{conf.endpoint}/openai/deployments/{conf.deployment}/chat/completions?api-version={conf.api_version}"
-        self.headers = {"api-key": conf.api_key, "Content-Type": "application/json"}
+        run = run or RunConfig()
+        self.url = f"{conf.endpoint.rstrip('/')}/openai/deployments/{conf.deployment}/chat/completions?api-version={conf.api_version}"
+        self.timeout = (min(10.0, float(run.timeout_sec)), float(run.timeout_sec))
+        self.json_mode = True
+        self.json_schema_ok = True
+        pool_size = max(1, conf.http_pool_size or run.concurrent_workers)
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, other=0, raise_on_status=False),
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(conf.extra_headers or {})
+        self.session.headers.update({
+            "api-key": conf.api_key,
+            "Content-Type": "application/json",
+            "Connection": "keep-alive" if conf.http_keep_alive else "close",
+        })
+
+    def close(self):
+        self.session.close()
+
+    def _post(self, payload: Dict[str, Any]) -> requests.Response:
+        return self.session.post(self.url, json=payload, timeout=self.timeout)
 
     def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         payload = {
@@ -26,8 +60,25 @@ class AzureOpenAIProvider(LLMProvider):
             "temperature": kwargs.get("temperature", self.conf.temperature),
             "max_tokens": kwargs.get("max_tokens", self.conf.max_tokens),
         }
+        if response_format and self.json_mode:
+            payload["response_format"] = response_format
+            if response_format.get("type") == "json_schema" and not self.json_schema_ok:
+                payload["response_format"] = {"type": "json_object"}
         try:
-            r = requests.post(self.url, headers=self.headers, json=payload, timeout=60)
+            r = self._post(payload)
+            if (
+                r.status_code == 400 and payload.get("response_format", {}).get("type") == "json_schema"
+                and ("response_format" in r.text or "json_schema" in r.text) and self.conf.json_mode_fallback
+            ):
+                # no schema-constrained decoding on this deployment: try plain JSON mode
+                self.json_schema_ok = False
+                payload["response_format"] = {"type": "json_object"}
+                r = self._post(payload)
+            if r.status_code == 400 and "response_format" in payload and "response_format" in r.text and self.conf.json_mode_fallback:
+                # older api-versions / models do not know JSON mode
+                self.json_mode = False
+                payload.pop("response_format")
+                r = self._post(payload)
             r.raise_for_status()
             data = r.json()
             usage = data.get("usage", {}) or {}
@@ -1,55 +1,133 @@
-
 from __future__ import annotations
-from typing import Any, Dict, List, Optional
+import json
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass
-from ..config import ProviderConfig
+from ..config import AppConfig, ProviderConfig, RunConfig
+from ..cost import record_usage, usage_scope
 
 @dataclass
 class UsageStats:
     input_tokens: int = 0
     output_tokens: int = 0
+    cost: float = 0.0
 
 class LLMProvider:
+    """Base class for chat-completion providers.
+
+    Implementations report every request through `_update_usage`, which adds it to
+    the provider's totals and to the `usage_scope`s open in the caller's context.
+    Wrappers that delegate to another provider (pools, budget governors) take the
+    inner call's record from `generate_with_usage` and pass `scoped=False`, so a
+    request is counted once per scope however deeply it is wrapped.
+    """
     def __init__(self, conf: ProviderConfig):
         self.conf = conf
-        self._last_usage = UsageStats()
+        self._lock = threading.Lock()
+        self._local = threading.local()
         self._total_usage = UsageStats()
 
-    def _update_usage(self, input_tokens: int, output_tokens: int):
-        self._last_usage = UsageStats(int(input_tokens or 0), int(output_tokens or 0))
-        self._total_usage.input_tokens += int(input_tokens or 0)
-        self._total_usage.output_tokens += int(output_tokens or 0)
+    def estimate_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000.0) * self.conf.price_input_per_1k + (output_tokens / 1000.0) * self.conf.price_output_per_1k
 
-    def last_usage(self) -> Dict[str, int]:
-        return {
-            "input_tokens": self._last_usage.input_tokens,
-            "output_tokens": self._last_usage.output_tokens,
-            "total_tokens": self._last_usage.input_tokens + self._last_usage.output_tokens,
-        }
+    def _update_usage(self, input_tokens: int, output_tokens: int, cost: Optional[float] = None, scoped: bool = True) -> UsageStats:
+        input_tokens = int(input_tokens or 0)
+        output_tokens = int(output_tokens or 0)
+        if cost is None:
+            cost = self.estimate_cost(input_tokens, output_tokens)
+        record = UsageStats(input_tokens, output_tokens, cost)
+        self._local.last = record
+        with self._lock:
+            self._total_usage.input_tokens += input_tokens
+            self._total_usage.output_tokens += output_tokens
+            self._total_usage.cost += cost
+        if scoped:
+            record_usage(input_tokens, output_tokens, cost)
+        return record
 
-    def total_usage(self) -> Dict[str, int]:
+    def last_usage(self) -> Dict[str, Any]:
+        """Usage of the last call made from the current thread."""
+        last = getattr(self._local, "last", None) or UsageStats()
         return {
-            "input_tokens": self._total_usage.input_tokens,
-            "output_tokens": self._total_usage.output_tokens,
-            "total_tokens": self._total_usage.input_tokens + self._total_usage.output_tokens,
+            "input_tokens": last.input_tokens,
+            "output_tokens": last.output_tokens,
+            "total_tokens": last.input_tokens + last.output_tokens,
+            "estimated_cost": round(last.cost, 6),
         }
 
+    def total_usage(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "input_tokens": self._total_usage.input_tokens,
+                "output_tokens": self._total_usage.output_tokens,
+                "total_tokens": self._total_usage.input_tokens + self._total_usage.output_tokens,
+                "estimated_cost": round(self._total_usage.cost, 6),
+            }
+
     def reset_usage_totals(self):
-        self._total_usage = UsageStats()
+        with self._lock:
+            self._total_usage = UsageStats()
 
     def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
         raise NotImplementedError
 
-def make_provider(conf: ProviderConfig) -> LLMProvider:
+    def generate_with_usage(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> Tuple[str, UsageStats]:
+        """`generate_text` plus the usage record of exactly this call (retries inside
+        a pool included), unaffected by concurrent calls on the same provider."""
+        with usage_scope() as scope:
+            text = self.generate_text(messages, response_format=response_format, **kwargs)
+        return text, UsageStats(scope.input_tokens, scope.output_tokens, scope.cost)
+
+def make_provider(conf: Union[ProviderConfig, List[ProviderConfig]], run: Optional[RunConfig] = None) -> LLMProvider:
+    if isinstance(conf, list):
+        if not conf:
+            raise ValueError("Provider pool requires at least one member.")
+        if len(conf) == 1:
+            return make_provider(conf[0], run)
+        from .pool import PooledProvider
+        run = run or RunConfig()
+        return PooledProvider(
+            [make_provider(c, run) for c in conf],
+            failure_threshold=run.pool_failure_threshold,
+            cooldown_sec=run.pool_cooldown_sec,
+        )
     name = (conf.name or "openai_compatible").lower()
     if name in ("openai_compatible","openai","ollama"):
         from .openai_compatible import OpenAICompatibleProvider
         return OpenAICompatibleProvider(conf)
     elif name == "azure_openai":
         from .azure_openai_provider import AzureOpenAIProvider
-        return AzureOpenAIProvider(conf)
+        return AzureOpenAIProvider(conf, run)
     elif name == "anthropic":
         from .anthropic_provider import AnthropicProvider
         return AnthropicProvider(conf)
+    elif name == "mock":
+        from .mock import MockProvider
+        return MockProvider(conf)
     else:
         raise ValueError(f"Unknown provider: {name}")
+
+PIPELINE_STAGES = ("open_coding", "codebook", "axial", "theory", "negatives")
+
+def make_stage_providers(conf: AppConfig) -> Dict[str, LLMProvider]:
+    """Build the provider for every LLM stage, honouring `conf.stages` overrides.
+
+    Stages whose resolved configs are identical share one provider instance (and
+    therefore one pool / usage counter). When the open-coding cascade is enabled
+    the escalation target is returned under "open_coding_strong".
+    """
+    cache: Dict[str, LLMProvider] = {}
+
+    def build(pconf) -> LLMProvider:
+        if isinstance(pconf, list):
+            key = json.dumps([c.model_dump() for c in pconf], sort_keys=True)
+        else:
+            key = json.dumps(pconf.model_dump(), sort_keys=True)
+        if key not in cache:
+            cache[key] = make_provider(pconf, conf.run)
+        return cache[key]
+
+    providers = {stage: build(conf.stage_provider(stage)) for stage in PIPELINE_STAGES}
+    if conf.open_coding_cascade.enabled:
+        providers["open_coding_strong"] = build(conf.resolve_provider(conf.open_coding_cascade.strong))
+    return providers
@@ -0,0 +1,192 @@
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from ..config import RunConfig
+from ..cost import in_context
+from ..rate_limiter import TokenBucket
+from .base import LLMProvider, UsageStats
+
+# Latencies of this many recent calls set the hedge delay.
+_WINDOW = 200
+
+class HedgePool:
+    """Bounded thread pool shared by the HedgedProviders of a run.
+
+    `submit` only hands a call to a free worker and returns None while all of them are
+    busy (with calls in flight or abandoned losers still finishing), so nothing waits
+    in a queue and abandoned requests cannot pile up threads.
+    """
+    def __init__(self, max_workers: int):
+        self.max_workers = max(1, max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="gtflow-hedge")
+        self._lock = threading.Lock()
+        self._busy = 0
+
+    def submit(self, fn: Callable[[], Any]) -> Optional[Future]:
+        with self._lock:
+            if self._busy >= self.max_workers:
+                return None
+            self._busy += 1
+        future = self._executor.submit(in_context(fn))
+        future.add_done_callback(self._free)
+        return future
+
+    def _free(self, future: Future):
+        with self._lock:
+            self._busy -= 1
+
+class HedgedProvider(LLMProvider):
+    """Provider wrapper that hedges slow calls.
+
+    Once `min_samples` calls have completed, a call that is still running after the
+    `percentile` latency of the recent calls (at least `min_delay_sec`) gets a
+    duplicate request, and whichever succeeds first is returned. Duplicates are
+    capped at `budget` times the number of calls and each one first takes a token
+    from `rate_limiter`. Hedgeable calls run on `pool`; when it has no free worker
+    the call runs on the caller's thread without a hedge. The losing request cannot
+    be interrupted (the HTTP clients block); it is abandoned, finishes on its pool
+    worker and its usage is still counted.
+    """
+    def __init__(self, inner: LLMProvider, percentile: float = 0.95, budget: float = 0.05, min_samples: int = 20, min_delay_sec: float = 1.0,
+                 rate_limiter: Optional[TokenBucket] = None, pool: Optional[HedgePool] = None):
+        super().__init__(inner.conf)
+        self.inner = inner
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay_sec = min_delay_sec
+        self.rate_limiter = rate_limiter
+        self.pool = pool or HedgePool(8)
+        self.stages: List[str] = []
+        self._latencies: Deque[float] = deque(maxlen=_WINDOW)
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.abandoned_cost = 0.0
+
+    def delay(self) -> Optional[float]:
+        """Seconds after which a call is hedged now, or None while there is too little
+        latency history."""
+        with self._stats_lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return max(self.min_delay_sec, ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))])
+
+    def _may_hedge(self) -> bool:
+        with self._stats_lock:
+            return self.hedged + 1 <= self.budget * self.calls
+
+    def _call(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]], kwargs: Dict[str, Any]):
+        started = time.perf_counter()
+        result = self.inner.generate_with_usage(messages, response_format=response_format, **kwargs)
+        with self._stats_lock:
+            self._latencies.append(time.perf_counter() - started)
+        return result
+
+    def _finish(self, text: str, usage: UsageStats) -> str:
+        self._update_usage(usage.input_tokens, usage.output_tokens, cost=usage.cost, scoped=False)
+        return text
+
+    def _abandon(self, future: Future):
+        if future.cancel():
+            return
+        def done(f: Future):
+            if f.exception() is None:
+                usage = f.result()[1]
+                with self._stats_lock:
+                    self.abandoned_cost += usage.cost
+                self._update_usage(usage.input_tokens, usage.output_tokens, cost=usage.cost, scoped=False)
+        future.add_done_callback(done)
+
+    def _send_hedge(self, primary: Future, call: Callable[[], Any]) -> Optional[Future]:
+        with self._stats_lock:
+            if self.hedged + 1 > self.budget * self.calls:
+                return None
+            self.hedged += 1
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        hedge = None if primary.done() else self.pool.submit(call)
+        if hedge is None:
+            with self._stats_lock:
+                self.hedged -= 1
+        return hedge
+
+    def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        with self._stats_lock:
+            self.calls += 1
+        call = lambda: self._call(messages, response_format, kwargs)
+        delay = self.delay()
+        primary = self.pool.submit(call) if delay is not None and self._may_hedge() else None
+        if primary is None:
+            return self._finish(*call())
+        done, _ = wait([primary], timeout=delay)
+        hedge = None if done else self._send_hedge(primary, call)
+        if hedge is None:
+            return self._finish(*primary.result())
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        self._abandon(other)
+                    if future is hedge:
+                        with self._stats_lock:
+                            self.hedge_wins += 1
+                    return self._finish(*future.result())
+        raise primary.exception()
+
+    def summary(self) -> Dict[str, Any]:
+        delay = self.delay()
+        with self._stats_lock:
+            return {
+                "stages": self.stages,
+                "percentile": self.percentile,
+                "budget": self.budget,
+                "calls": self.calls,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "hedge_rate": round(self.hedged / self.calls, 3) if self.calls else 0.0,
+                "win_rate": round(self.hedge_wins / self.hedged, 3) if self.hedged else None,
+                "delay_sec": round(delay, 2) if delay is not None else None,
+                "abandoned_cost": round(self.abandoned_cost, 6),
+            }
+
+def hedge_providers(providers: Dict[str, LLMProvider], run: RunConfig) -> Dict[str, LLMProvider]:
+    """Wrap the stage providers in HedgedProviders when `run.hedge_percentile` is set;
+    stages sharing a provider share its wrapper, and all wrappers share one HedgePool
+    and one TokenBucket at `run.rate_limit_rps` for their duplicates."""
+    if run.hedge_percentile is None:
+        return providers
+    # every call in flight plus one duplicate each; duplicates are paced like the stages
+    pool = HedgePool(2 * run.concurrent_workers)
+    limiter = TokenBucket(run.rate_limit_rps)
+    wrapped: Dict[int, HedgedProvider] = {}
+    out: Dict[str, LLMProvider] = {}
+    for stage, provider in providers.items():
+        if id(provider) not in wrapped:
+            wrapped[id(provider)] = HedgedProvider(
+                provider, run.hedge_percentile, run.hedge_budget, run.hedge_min_samples, run.hedge_min_delay_sec,
+                rate_limiter=limiter, pool=pool,
+            )
+        out[stage] = wrapped[id(provider)]
+        out[stage].stages.append(stage)
+    return out
+
+def hedging_summary(providers: Dict[str, LLMProvider]) -> List[Dict[str, Any]]:
+    """Hedge statistics of every distinct HedgedProvider in `providers` (outer wrappers
+    such as the profiler's are looked through)."""
+    rows, seen = [], set()
+    for provider in providers.values():
+        while not isinstance(provider, HedgedProvider) and hasattr(provider, "inner"):
+            provider = provider.inner
+        if isinstance(provider, HedgedProvider) and id(provider) not in seen:
+            seen.add(id(provider))
+            rows.append(provider.summary())
+    return rows
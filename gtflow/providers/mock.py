@@ -0,0 +1,107 @@
+from __future__ import annotations
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from ..utils.text_utils import estimate_message_tokens, estimate_tokens, tokenize
+from .base import LLMProvider
+
+_SEGMENT = re.compile(r"^seg_id=(\S+?)(?: \(.*?\))?: (.*)$", re.M)
+_CODE_LINE = re.compile(r"^- (.+?) \(x\d+\)", re.M)
+_ENTRY_LINE = re.compile(r"^- ([^:\n]+):", re.M)
+_STOP = frozenset("a an and are as at be but by for from had has have i in is it its of on or so that the their there they this to was we were with you".split())
+
+class MockProvider(LLMProvider):
+    """Offline stand-in for a chat model (`name: mock`).
+
+    Recognises the prompts of every pipeline stage and answers with well-formed JSON
+    derived from the prompt: open codes are the most frequent content words of each
+    segment, the codebook groups the codes it is shown, and so on. The reply costs
+    `mock_latency_sec` plus its output tokens at `mock_tokens_per_sec`, is cut off at
+    `max_tokens` like a real completion, and calls beyond `mock_max_concurrency` in
+    flight (or a `mock_failure_rate` share of calls) fail like a busy gateway. Meant
+    for tests, demos and `gtflow tune` dry runs.
+    """
+    def __init__(self, conf):
+        super().__init__(conf)
+        self._rng = random.Random(0)
+        self._in_flight = 0
+        self._gate = threading.Lock()
+
+    def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        with self._gate:
+            self._in_flight += 1
+            busy = self.conf.mock_max_concurrency is not None and self._in_flight > self.conf.mock_max_concurrency
+            flaky = self.conf.mock_failure_rate > 0 and self._rng.random() < self.conf.mock_failure_rate
+        try:
+            if busy or flaky:
+                time.sleep(self.conf.mock_latency_sec)
+                raise RuntimeError("429 Too Many Requests (mock)" if busy else "502 Bad Gateway (mock)")
+            text = self._reply(messages[0]["content"], messages[-1]["content"])
+            out_tokens = estimate_tokens(text)
+            max_tokens = int(kwargs.get("max_tokens") or self.conf.max_tokens)
+            if out_tokens > max_tokens:
+                text = text[: len(text) * max_tokens // out_tokens]
+                out_tokens = max_tokens
+            time.sleep(self.conf.mock_latency_sec + out_tokens / max(1.0, self.conf.mock_tokens_per_sec))
+            self._update_usage(estimate_message_tokens(messages), out_tokens)
+            return text
+        finally:
+            with self._gate:
+                self._in_flight -= 1
+
+    def _reply(self, system: str, user: str) -> str:
+        if "Open-code the following" in user:
+            return self._open_codes(user)
+        if "maintaining an existing codebook" in system:
+            section = user.split("New initial codes not yet in the codebook", 1)[-1]
+            codes = _CODE_LINE.findall(section)
+            return json.dumps({
+                "new_entries": [{"code": c, "definition": f"Mentions of {c}.", "aliases": []} for c in codes],
+                "aliases": {}, "second_order_themes": {"New material": codes} if codes else {}, "aggregate_dimensions": {},
+            }, ensure_ascii=False)
+        if "structured codebook" in system:
+            return self._codebook(_CODE_LINE.findall(user))
+        if "core category" in system:
+            return json.dumps({"core_category": "Adapting under pressure", "rationale": "Most triples connect conditions to coping actions.", "storyline": "Participants describe pressures and how they adapt to them."})
+        if "mini-storyline" in system:
+            return json.dumps({"label": "group", "mini_storyline": "Conditions lead to actions and results.", "key_conditions": [], "key_results": []})
+        if "axial coding" in system:
+            codes = [c.strip() for c in _ENTRY_LINE.findall(user)] or ["condition", "action", "result"]
+            triples = [
+                {"condition": codes[i % len(codes)], "action": codes[(i + 1) % len(codes)], "result": codes[(i + 2) % len(codes)], "evidence": []}
+                for i in range(min(len(codes), 12))
+            ]
+            return json.dumps(triples, ensure_ascii=False)
+        if "contradict the storyline" in system:
+            return "[]"
+        return "{}"
+
+    def _open_codes(self, user: str) -> str:
+        compact = "short keys" in user
+        items = []
+        for seg_id, text in _SEGMENT.findall(user):
+            words = [w for w in tokenize(text) if w not in _STOP and (len(w) > 3 or not w.isascii())]
+            codes = [w for w, _ in Counter(words).most_common(2)] or ["general remark"]
+            span = text[:60]
+            if compact:
+                items.append({"i": seg_id, "v": [span[:30]], "c": [{"c": c, "d": f"Mentions of {c}.", "e": span} for c in codes], "m": None})
+            else:
+                items.append({
+                    "seg_id": seg_id, "in_vivo_phrases": [span[:30]],
+                    "initial_codes": [{"code": c, "definition": f"Mentions of {c}.", "evidence_span": span} for c in codes],
+                    "quick_memo": None,
+                })
+        return json.dumps({"items": items} if compact else items, ensure_ascii=False)
+
+    def _codebook(self, codes: List[str]) -> str:
+        entries = [{"code": c, "definition": f"Mentions of {c}.", "include": [c], "exclude": [], "positive_examples": [], "near_miss": [], "aliases": []} for c in codes]
+        themes = {f"Theme {i // 4 + 1}": codes[i:i + 4] for i in range(0, len(codes), 4)}
+        return json.dumps({
+            "entries": entries, "second_order_themes": themes,
+            "aggregate_dimensions": {"Dimension 1": list(themes)} if themes else {},
+        }, ensure_ascii=False)
@@ -2,9 +2,12 @@
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
 import os
-from openai import OpenAI
+from openai import BadRequestError, OpenAI
 from .base import LLMProvider
 
+def _mentions_response_format(message: str) -> bool:
+    return "response_format" in message or "json_schema" in message
+
 class OpenAICompatibleProvider(LLMProvider):
     """Provider for any cloud that adopts the OpenAI protocol.
 
@@ -22,6 +25,7 @@ class OpenAICompatibleProvider(LLMProvider):
             headers.update(conf.extra_headers)
         self.client = OpenAI(base_url=base_url, api_key=api_key, organization=organization, default_headers=headers)
         self.use_responses = bool(conf.use_responses_api)
+        self.json_schema_ok = True
 
     def _extract_and_update_usage(self, obj: Any):
         try:
@@ -63,9 +67,20 @@ class OpenAICompatibleProvider(LLMProvider):
         kwargs_payload = dict(model=model, messages=messages, temperature=temperature)
         if max_tokens:
             kwargs_payload["max_tokens"] = max_tokens
+        if response_format and response_format.get("type") == "json_schema" and not self.json_schema_ok:
+            response_format = {"type": "json_object"}
         if response_format:
             kwargs_payload["response_format"] = response_format
 
-        resp = self.client.chat.completions.create(**kwargs_payload)
+        try:
+            resp = self.client.chat.completions.create(**kwargs_payload)
+        except BadRequestError as e:
+            # only a rejected schema downgrades; rate limits, timeouts and 5xx go to the caller's retries
+            if not (response_format and response_format.get("type") == "json_schema" and self.conf.json_mode_fallback and _mentions_response_format(str(e))):
+                raise
+            # the endpoint does not do schema-constrained decoding: use JSON mode from now on
+            self.json_schema_ok = False
+            kwargs_payload["response_format"] = {"type": "json_object"}
+            resp = self.client.chat.completions.create(**kwargs_payload)
         self._extract_and_update_usage(resp)
         return resp.choices[0].message.content
@@ -0,0 +1,133 @@
+from __future__ import annotations
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from ..utils.text_utils import estimate_message_tokens
+from .base import LLMProvider
+
+_WINDOW_SEC = 60.0
+
+class _Member:
+    def __init__(self, provider: LLMProvider):
+        self.provider = provider
+        conf = provider.conf
+        self.weight = max(0.01, float(conf.weight or 1.0))
+        self.rpm = conf.rpm
+        self.tpm = conf.tpm
+        self.label = f"{conf.name}:{conf.deployment or conf.model}@{conf.endpoint or conf.base_url or 'default'}"
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        # [timestamp, tokens] for requests started in the last minute; a request in
+        # flight counts its estimated prompt tokens until it reports its usage
+        self.window: Deque[List[float]] = deque()
+
+    def _trim(self, now: float):
+        while self.window and now - self.window[0][0] >= _WINDOW_SEC:
+            self.window.popleft()
+
+    def budget_wait(self, now: float, tokens: int = 0) -> float:
+        """Seconds until this member has room under its RPM/TPM budget for a request of
+        `tokens` (0 if it has room now; an idle member always has room)."""
+        self._trim(now)
+        if not self.window:
+            return 0.0
+        expiry = self.window[0][0] + _WINDOW_SEC - now
+        if self.rpm and len(self.window) >= self.rpm:
+            return max(0.0, expiry)
+        if self.tpm and sum(t for _, t in self.window) + tokens > self.tpm:
+            return max(0.0, expiry)
+        return 0.0
+
+    def load(self) -> float:
+        return (self.in_flight + 1) / self.weight
+
+class PooledProvider(LLMProvider):
+    """Routes each request to the least-loaded healthy member of a provider pool.
+
+    Members may mix openai_compatible, azure_openai and anthropic endpoints. Each has
+    its own weight and optional RPM/TPM budget (ProviderConfig.weight/rpm/tpm); requests
+    in flight count their estimated prompt tokens toward the TPM budget. A member
+    that fails `failure_threshold` times in a row is benched for `cooldown_sec` seconds;
+    a failed request is retried once on every other member before giving up.
+    """
+    def __init__(self, members: List[LLMProvider], failure_threshold: int = 3, cooldown_sec: float = 30.0):
+        super().__init__(members[0].conf)
+        self.members = [_Member(p) for p in members]
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.cooldown_sec = float(cooldown_sec)
+        self._lock = threading.Lock()
+
+    def _acquire(self, tried: set, tokens: int = 0) -> Tuple[Optional[_Member], Optional[List[float]]]:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [m for m in self.members if id(m) not in tried]
+                if not candidates:
+                    return None, None
+                healthy = [m for m in candidates if m.cooldown_until <= now]
+                if not healthy:
+                    # everyone is benched: probe the member that recovers first
+                    healthy = [min(candidates, key=lambda m: m.cooldown_until)]
+                waits = {id(m): m.budget_wait(now, tokens) for m in healthy}
+                ready = [m for m in healthy if waits[id(m)] <= 0.0]
+                if ready:
+                    member = min(ready, key=lambda m: m.load())
+                    member.in_flight += 1
+                    member.requests += 1
+                    entry = [now, tokens]
+                    member.window.append(entry)
+                    return member, entry
+                delay = min(waits.values())
+            time.sleep(min(delay, 1.0))
+
+    def _release(self, member: _Member, entry: List[float], ok: bool, tokens: int = 0):
+        # the reservation made at acquire is replaced by what the request reported
+        with self._lock:
+            member.in_flight -= 1
+            entry[1] = tokens
+            if ok:
+                member.consecutive_failures = 0
+                member.cooldown_until = 0.0
+            else:
+                member.failures += 1
+                member.consecutive_failures += 1
+                if member.consecutive_failures >= self.failure_threshold:
+                    member.cooldown_until = time.monotonic() + self.cooldown_sec
+
+    def generate_text(self, messages: List[Dict[str, str]], response_format: Optional[Dict[str, Any]] = None, **kwargs) -> str:
+        tried: set = set()
+        last_err: Exception | None = None
+        prompt_tokens = estimate_message_tokens(messages)
+        while True:
+            member, entry = self._acquire(tried, prompt_tokens)
+            if member is None:
+                break
+            tried.add(id(member))
+            try:
+                text, usage = member.provider.generate_with_usage(messages, response_format=response_format, **kwargs)
+            except Exception as e:
+                self._release(member, entry, ok=False)
+                last_err = e
+                continue
+            self._release(member, entry, ok=True, tokens=usage.input_tokens + usage.output_tokens)
+            self._update_usage(usage.input_tokens, usage.output_tokens, cost=usage.cost, scoped=False)
+            return text
+        self._update_usage(0, 0, scoped=False)
+        raise RuntimeError(f"All provider pool members failed: {last_err}")
+
+    def member_usage(self) -> List[Dict[str, Any]]:
+        rows = []
+        for m in self.members:
+            row = {"member": m.label, "requests": m.requests, "failures": m.failures}
+            row.update(m.provider.total_usage())
+            rows.append(row)
+        return rows
+
+    def reset_usage_totals(self):
+        super().reset_usage_totals()
+        for m in self.members:
+            m.provider.reset_usage_totals()
@@ -5,7 +5,7 @@ import threading
 class TokenBucket:
     def __init__(self, rate_per_sec: float, capacity: float = None):
         self.rate = max(0.1, float(rate_per_sec))
-        self.capacity = capacity or self.rate
+        self.capacity = capacity or max(1.0, self.rate)
         self.tokens = self.capacity
         self.timestamp = time.monotonic()
         self.lock = threading.Lock()
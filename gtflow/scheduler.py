@@ -0,0 +1,164 @@
+from __future__ import annotations
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, Callable, ContextManager, Dict, List, MutableMapping, Optional, Tuple
+
+from .cost import in_context
+
+class StageSkipped(Exception):
+    """Raised by a stage that decides not to run (budget, configuration); its
+    dependents are not run either."""
+
+@dataclass
+class Stage:
+    """One node of a pipeline graph.
+
+    `run` receives the artifacts named in `inputs` and returns the artifacts it
+    produced (normally all of `outputs`). `load`, when given, is tried first and may
+    return the outputs from an earlier run instead, in which case `run` is skipped.
+    """
+    name: str
+    inputs: Tuple[str, ...]
+    outputs: Tuple[str, ...]
+    run: Callable[[Dict[str, Any]], Dict[str, Any]]
+    load: Optional[Callable[[], Optional[Dict[str, Any]]]] = None
+    title: str = ""
+
+def _check_graph(stages: List[Stage], available: set) -> Dict[str, set]:
+    producers: Dict[str, str] = {}
+    for stage in stages:
+        for out in stage.outputs:
+            if out in producers:
+                raise ValueError(f"artifact {out!r} is produced by both {producers[out]} and {stage.name}")
+            producers[out] = stage.name
+    deps: Dict[str, set] = {}
+    for stage in stages:
+        missing = [i for i in stage.inputs if i not in producers and i not in available]
+        if missing:
+            raise ValueError(f"stage {stage.name} needs {', '.join(missing)}, which no stage produces")
+        deps[stage.name] = {producers[i] for i in stage.inputs if i in producers}
+    # Kahn's algorithm: anything left over sits on a cycle
+    remaining = {name: set(d) for name, d in deps.items()}
+    while True:
+        ready = [name for name, d in remaining.items() if not d]
+        if not ready:
+            break
+        for name in ready:
+            del remaining[name]
+        for d in remaining.values():
+            d.difference_update(ready)
+    if remaining:
+        raise ValueError(f"stage graph has a cycle through {', '.join(sorted(remaining))}")
+    return deps
+
+def critical_path(deps: Dict[str, set], timings: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Chain of stages that determined the wall time: from the stage that finished
+    last, repeatedly step back to the dependency that finished latest."""
+    ran = {name: t for name, t in timings.items() if "end" in t}
+    if not ran:
+        return []
+    # end times are rounded; on a tie the stage that started later is downstream
+    latest = lambda name: (ran[name]["end"], ran[name].get("start", 0.0))
+    path = [max(ran, key=latest)]
+    while True:
+        before = [d for d in deps[path[-1]] if d in ran]
+        if not before:
+            break
+        path.append(max(before, key=latest))
+    return path[::-1]
+
+def run_stages(
+    stages: List[Stage],
+    artifacts: Optional[MutableMapping[str, Any]] = None,
+    max_parallel: int = 4,
+    on_event: Optional[Callable[[Stage, str], None]] = None,
+    around: Optional[Callable[[Stage], ContextManager]] = None,
+) -> Dict[str, Any]:
+    """Run `stages` as a dependency graph: every stage starts as soon as all of its
+    inputs exist, up to `max_parallel` at a time (1 runs them one by one in
+    declaration order). Stages whose inputs can no longer appear (an upstream stage
+    was skipped or did not produce them) are marked `blocked`.
+
+    `artifacts` (any mutable mapping) is updated in place with everything produced. `on_event(stage, status)`
+    is called from the calling thread when a stage starts and when it ends, with
+    status `running`, `done`, `cached`, `incomplete`, `skipped[: reason]`,
+    `blocked` or `failed`. `around(stage)`, when given, is a context manager entered
+    on the worker thread around loading or running the stage. An exception raised
+    by a stage is re-raised once the stages already running have finished. Returns
+    per-stage timings (seconds since the start), the critical path, and the wall
+    time against the time the same stages would take one after another.
+    """
+    artifacts = artifacts if artifacts is not None else {}
+    deps = _check_graph(stages, set(artifacts))
+    emit = on_event or (lambda stage, status: None)
+    timings: Dict[str, Dict[str, Any]] = {}
+    pending = list(stages)
+    running: Dict[Future, Stage] = {}
+    settled: set = set()
+    error: Optional[BaseException] = None
+    t0 = time.monotonic()
+
+    def execute(stage: Stage) -> Tuple[str, Dict[str, Any], float, float]:
+        start = time.monotonic() - t0
+        with around(stage) if around else nullcontext():
+            loaded = stage.load() if stage.load else None
+            if loaded is not None:
+                return "cached", loaded, start, time.monotonic() - t0
+            try:
+                produced = stage.run({name: artifacts[name] for name in stage.inputs}) or {}
+            except StageSkipped as e:
+                return f"skipped: {e}" if str(e) else "skipped", {}, start, time.monotonic() - t0
+        status = "done" if all(out in produced for out in stage.outputs) else "incomplete"
+        return status, produced, start, time.monotonic() - t0
+
+    limit = max(1, max_parallel)
+    with ThreadPoolExecutor(max_workers=limit) as pool:
+        while True:
+            blocked = True
+            while blocked:
+                # a stage whose producers have all finished but whose inputs are
+                # still missing can never run; that may block its dependents in turn
+                blocked = [s for s in pending if deps[s.name] <= settled and not all(i in artifacts for i in s.inputs)]
+                for stage in blocked:
+                    pending.remove(stage)
+                    settled.add(stage.name)
+                    timings[stage.name] = {"status": "blocked"}
+                    emit(stage, "blocked")
+            for stage in list(pending):
+                if error is not None or len(running) >= limit:
+                    break
+                if all(i in artifacts for i in stage.inputs):
+                    pending.remove(stage)
+                    emit(stage, "running")
+                    running[pool.submit(in_context(execute), stage)] = stage
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                settled.add(stage.name)
+                try:
+                    status, produced, start, end = future.result()
+                except BaseException as e:
+                    error = error or e
+                    timings[stage.name] = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+                    emit(stage, "failed")
+                    continue
+                artifacts.update(produced)
+                timings[stage.name] = {"status": status, "start": round(start, 3), "end": round(end, 3), "sec": round(end - start, 3)}
+                emit(stage, status)
+    if error is not None:
+        raise error
+    for stage in pending:
+        timings[stage.name] = {"status": "blocked"}
+    path = critical_path(deps, timings)
+    ran = [t for t in timings.values() if "sec" in t]
+    return {
+        "stages": timings,
+        "critical_path": path,
+        "critical_path_sec": round(sum(timings[name]["sec"] for name in path), 3),
+        "wall_sec": round(time.monotonic() - t0, 3),
+        "serial_sec": round(sum(t["sec"] for t in ran), 3),
+    }
@@ -0,0 +1,221 @@
+from __future__ import annotations
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import product
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from pydantic import TypeAdapter
+
+from .config import AppConfig, ProviderConfig
+from .cost import in_context
+from .models.json_schema import response_format_for
+from .models.schemas import CompactOpenCodingItem, OpenCodingItem, Segment
+from .pipeline import open_coder
+from .pipeline.segment_dedup import plan_dedup
+from .providers.base import make_provider
+from .rate_limiter import TokenBucket
+
+BATCH_SIZES = (5, 10, 15, 20)
+WORKERS = (2, 4, 8, 12)
+MAX_TOKENS = (512, 1024, 2048, 4096)
+# Throughput gains below this share are not worth more workers or a different batch size.
+_MIN_GAIN = 0.05
+# Headroom on the observed p95 output tokens per batch when picking max_tokens.
+_MAX_TOKENS_HEADROOM = 1.25
+
+@dataclass
+class Probe:
+    """One short open-coding run over the sample with fixed settings."""
+    batch_size: int
+    workers: int
+    max_tokens: int
+    segments: int = 0
+    batches: int = 0
+    parsed_batches: int = 0
+    failed_requests: int = 0
+    coded_segments: int = 0
+    wall_sec: float = 0.0
+    cost: float = 0.0
+    latencies: List[float] = field(default_factory=list, repr=False)
+    output_tokens: List[int] = field(default_factory=list, repr=False)
+
+    @property
+    def parse_rate(self) -> float:
+        return self.parsed_batches / self.batches if self.batches else 0.0
+
+    @property
+    def coverage(self) -> float:
+        return self.coded_segments / self.segments if self.segments else 0.0
+
+    @property
+    def segments_per_sec(self) -> float:
+        return self.coded_segments / self.wall_sec if self.wall_sec else 0.0
+
+    @property
+    def cost_per_segment(self) -> Optional[float]:
+        return self.cost / self.coded_segments if self.coded_segments else None
+
+    def feasible(self, min_success: float) -> bool:
+        return self.parse_rate >= min_success and self.coverage >= min_success
+
+    def to_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        return {
+            "batch_size": self.batch_size, "workers": self.workers, "max_tokens": self.max_tokens,
+            "batches": self.batches, "parse_rate": round(self.parse_rate, 3), "coverage": round(self.coverage, 3),
+            "failed_requests": self.failed_requests, "wall_sec": round(self.wall_sec, 2),
+            "segments_per_sec": round(self.segments_per_sec, 2),
+            "cost_per_segment": round(self.cost_per_segment, 6) if self.cost_per_segment is not None else None,
+            "latency_p50_sec": round(statistics.median(lat), 2) if lat else None,
+            "latency_p95_sec": round(lat[int(0.95 * (len(lat) - 1))], 2) if lat else None,
+            "output_tokens_p95": _p95(self.output_tokens),
+        }
+
+def _p95(values: Sequence[int]) -> Optional[int]:
+    ordered = sorted(values)
+    return ordered[int(0.95 * (len(ordered) - 1))] if ordered else None
+
+def _with_max_tokens(pconf: Union[ProviderConfig, List[ProviderConfig]], max_tokens: int):
+    if isinstance(pconf, list):
+        return [m.model_copy(update={"max_tokens": max_tokens}) for m in pconf]
+    return pconf.model_copy(update={"max_tokens": max_tokens})
+
+def sample_segments(conf: AppConfig, segments: List[Segment], size: int) -> List[Dict[str, Any]]:
+    """`size` segments spread evenly over the unique, non-trivial segments of the input."""
+    dedup = plan_dedup([s.model_dump() for s in segments], conf.run.dedupe_segments, conf.run.trivial_segment_max_chars, conf.run.trivial_segment_patterns)
+    unique = dedup.unique
+    if len(unique) <= size:
+        return unique
+    step = len(unique) / size
+    return [unique[int(i * step)] for i in range(size)]
+
+def run_probe(conf: AppConfig, sample: List[Dict[str, Any]], batch_size: int, workers: int, max_tokens: int) -> Probe:
+    """Open-code `sample` once with these settings (no retries, no cascade) and measure it."""
+    provider = make_provider(_with_max_tokens(conf.stage_provider("open_coding"), max_tokens), conf.run)
+    compact = conf.run.open_coding_format == "compact"
+    response_format = response_format_for(provider.conf, List[CompactOpenCodingItem] if compact else List[OpenCodingItem], "open_coding", wrap_key="items")
+    adapter = TypeAdapter(List[OpenCodingItem])
+    limiter = TokenBucket(conf.run.rate_limit_rps)
+    batches = [sample[i:i + batch_size] for i in range(0, len(sample), batch_size)]
+    probe = Probe(batch_size, workers, max_tokens, segments=len(sample), batches=len(batches))
+
+    def code(batch: List[Dict[str, Any]]) -> Tuple[str, float, int, float, int]:
+        messages = open_coder.build_prompt(batch, compact)
+        limiter.acquire()
+        start = time.perf_counter()
+        try:
+            raw, usage = provider.generate_with_usage(messages, response_format=response_format)
+        except Exception:
+            return "failed", time.perf_counter() - start, 0, 0.0, 0
+        elapsed = time.perf_counter() - start
+        try:
+            items = open_coder._parse_items(raw, adapter)
+        except Exception:
+            return "invalid", elapsed, usage.output_tokens, usage.cost, 0
+        expected = {str(s["seg_id"]) for s in batch}
+        return "parsed", elapsed, usage.output_tokens, usage.cost, len({i.seg_id for i in items} & expected)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(in_context(code), batches))
+    probe.wall_sec = time.perf_counter() - start
+    for status, elapsed, out_tokens, cost, coded in results:
+        probe.cost += cost
+        if status == "failed":
+            probe.failed_requests += 1
+            continue
+        probe.latencies.append(elapsed)
+        probe.output_tokens.append(out_tokens)
+        probe.parsed_batches += status == "parsed"
+        probe.coded_segments += coded
+    return probe
+
+def _better(a: Probe, b: Optional[Probe], min_success: float) -> bool:
+    """Whether `a` beats `b`: feasible first, then throughput; within _MIN_GAIN of each
+    other the cheaper per segment, then the one with fewer workers, wins."""
+    if b is None:
+        return True
+    if a.feasible(min_success) != b.feasible(min_success):
+        return a.feasible(min_success)
+    if not a.feasible(min_success):
+        return (a.parse_rate, a.coverage) > (b.parse_rate, b.coverage)
+    if a.segments_per_sec > b.segments_per_sec * (1 + _MIN_GAIN):
+        return True
+    if b.segments_per_sec > a.segments_per_sec * (1 + _MIN_GAIN):
+        return False
+    return ((a.cost_per_segment or 0.0), a.workers) < ((b.cost_per_segment or 0.0), b.workers)
+
+def tune(
+    conf: AppConfig,
+    segments: List[Segment],
+    sample_size: int = 40,
+    strategy: str = "adaptive",
+    batch_sizes: Sequence[int] = BATCH_SIZES,
+    workers: Sequence[int] = WORKERS,
+    max_tokens: Sequence[int] = MAX_TOKENS,
+    min_success: float = 0.95,
+    on_probe: Callable[[Probe], None] = lambda probe: None,
+) -> Dict[str, Any]:
+    """Probe open-coding settings on a sample of `segments` and recommend the fastest
+    one whose parse rate and segment coverage reach `min_success`.
+
+    "grid" probes every combination. "adaptive" probes the batch sizes at the
+    configured worker count and the largest `max_tokens`, then adds workers while
+    throughput still grows by more than 5%, and finally picks the smallest
+    `max_tokens` that covers the observed p95 output of a batch with 25% headroom,
+    verified by one more probe. Every probe codes the whole sample, so it costs
+    about as much as open-coding `sample_size` segments.
+    """
+    sample = sample_segments(conf, segments, sample_size)
+    if not sample:
+        raise ValueError("the input has no segments to sample")
+    probes: List[Probe] = []
+    seen: Dict[Tuple[int, int, int], Probe] = {}
+
+    def probe(bs: int, w: int, mt: int) -> Probe:
+        key = (bs, w, mt)
+        if key not in seen:
+            seen[key] = run_probe(conf, sample, bs, w, mt)
+            probes.append(seen[key])
+            on_probe(seen[key])
+        return seen[key]
+
+    best: Optional[Probe] = None
+    if strategy == "grid":
+        for bs, w, mt in product(sorted(batch_sizes), sorted(workers), sorted(max_tokens)):
+            p = probe(bs, w, mt)
+            if _better(p, best, min_success):
+                best = p
+    elif strategy == "adaptive":
+        top_tokens = max(max_tokens)
+        for bs in sorted(batch_sizes):
+            p = probe(bs, conf.run.concurrent_workers, top_tokens)
+            if _better(p, best, min_success):
+                best = p
+        for w in sorted(workers):
+            p = probe(best.batch_size, w, top_tokens)
+            if _better(p, best, min_success):
+                best = p
+            elif w > best.workers:
+                break  # more workers stopped paying off (or hit the gateway's limits)
+        needed = (_p95(best.output_tokens) or 0) * _MAX_TOKENS_HEADROOM
+        fitting = [mt for mt in sorted(max_tokens) if mt >= needed and mt < best.max_tokens]
+        if fitting:
+            p = probe(best.batch_size, best.workers, fitting[0])
+            if p.feasible(min_success) and p.parse_rate >= best.parse_rate:
+                best = p
+    else:
+        raise ValueError(f"unknown tuning strategy: {strategy}")
+    return {
+        "sample_segments": len(sample),
+        "strategy": strategy,
+        "min_success": min_success,
+        "rate_limit_rps": conf.run.rate_limit_rps,
+        "recommended": {"batch_size": best.batch_size, "concurrent_workers": best.workers, "max_tokens": best.max_tokens},
+        "feasible": best.feasible(min_success),
+        "best": best.to_dict(),
+        "probes": [p.to_dict() for p in probes],
+        "probe_cost": round(sum(p.cost for p in probes), 6),
+    }
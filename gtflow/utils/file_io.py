@@ -1,40 +1,113 @@
-
 from __future__ import annotations
-import os, json, csv
-from typing import Any, List, Dict
+import os, json, csv, gzip, io, uuid
+from contextlib import contextmanager
+from typing import Any, IO, Iterator, List, Dict, Optional
+
+# Compressed variants of a file are recognised by extension: `x.json.gz`, `x.json.zst`.
+_CODECS = {".gz": "gzip", ".zst": "zstd"}
+_EXTENSIONS = {codec: ext for ext, codec in _CODECS.items()}
 
 def ensure_dir(p: str):
     os.makedirs(p, exist_ok=True)
 
+def _codec(p: str) -> Optional[str]:
+    for ext, codec in _CODECS.items():
+        if p.endswith(ext):
+            return codec
+    return None
+
+def _zstandard():
+    try:
+        import zstandard  # type: ignore
+    except ImportError:  # pragma: no cover - depends on optional package
+        raise RuntimeError("zstd-compressed files need the zstandard package (pip install zstandard)") from None
+    return zstandard
+
+def variants(p: str) -> List[str]:
+    """`p` without a compression extension, followed by its .zst and .gz variants."""
+    codec = _codec(p)
+    base = p[: -len(_EXTENSIONS[codec])] if codec else p
+    return [base, base + ".zst", base + ".gz"]
+
+def resolve(p: str) -> str:
+    """The file that holds `p`: `p` itself or, if that does not exist, the first
+    existing compressed (or plain) variant. Returns `p` when none exists."""
+    if os.path.exists(p):
+        return p
+    return next((v for v in variants(p) if os.path.exists(v)), p)
+
+def exists(p: str) -> bool:
+    return os.path.exists(resolve(p))
+
+def remove(p: str):
+    """Remove `p` and all its compressed variants."""
+    for v in variants(p):
+        if os.path.exists(v):
+            os.remove(v)
+
+def target_path(p: str, compression: Optional[str] = None) -> str:
+    """Where a write of `p` goes. An explicit extension wins; otherwise `compression`
+    ("gzip" or "zstd") adds one; otherwise an existing variant keeps its codec."""
+    if _codec(p):
+        return p
+    if compression:
+        return p + _EXTENSIONS[compression]
+    return resolve(p)
+
+def open_text(p: str, mode: str = "r", newline: Optional[str] = None, codec: Optional[str] = None) -> IO[str]:
+    """Open `p` as UTF-8 text, (de)compressing by extension (or `codec`). Reads and
+    writes stream."""
+    codec = codec or _codec(p)
+    if codec == "gzip":
+        return gzip.open(p, mode + "t", encoding="utf-8", newline=newline)
+    if codec == "zstd":
+        raw = _zstandard().open(p, mode + "b")
+        return io.TextIOWrapper(raw, encoding="utf-8", newline=newline)
+    return open(p, mode, encoding="utf-8", newline=newline)
+
+@contextmanager
+def _open_for_write(p: str, compression: Optional[str], newline: Optional[str] = None) -> Iterator[IO[str]]:
+    """Write to a temporary file next to the target and rename it into place, so a
+    crash mid-write leaves the previous artifact (in whatever variant) untouched."""
+    target = target_path(p, compression)
+    ensure_dir(os.path.dirname(target) or ".")
+    tmp = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open_text(tmp, "w", newline=newline, codec=_codec(target)) as f:
+            yield f
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    for v in variants(target):  # one variant per file, so reads find the fresh one
+        if v != target and os.path.exists(v):
+            os.remove(v)
+
 def read_text(p: str) -> str:
-    with open(p, "r", encoding="utf-8") as f:
+    with open_text(resolve(p)) as f:
         return f.read()
 
-def write_text(p: str, s: str):
-    ensure_dir(os.path.dirname(p) or ".")
-    with open(p, "w", encoding="utf-8") as f:
+def write_text(p: str, s: str, compression: Optional[str] = None):
+    with _open_for_write(p, compression) as f:
         f.write(s)
 
 def read_json(p: str) -> Any:
-    with open(p, "r", encoding="utf-8") as f:
+    with open_text(resolve(p)) as f:
         return json.load(f)
 
-def write_json(p: str, obj: Any, pretty: bool=True):
-    ensure_dir(os.path.dirname(p) or ".")
-    with open(p, "w", encoding="utf-8") as f:
+def write_json(p: str, obj: Any, pretty: bool=True, compression: Optional[str] = None):
+    with _open_for_write(p, compression) as f:
         if pretty:
             json.dump(obj, f, ensure_ascii=False, indent=2)
         else:
             json.dump(obj, f, ensure_ascii=False)
 
-def write_csv(p: str, rows: List[Dict[str, Any]]):
-    ensure_dir(os.path.dirname(p) or ".")
-    if not rows:
-        with open(p, "w", encoding="utf-8", newline="") as f:
-            f.write("")
-        return
-    headers = list(rows[0].keys())
-    with open(p, "w", encoding="utf-8", newline="") as f:
+def write_csv(p: str, rows: List[Dict[str, Any]], compression: Optional[str] = None):
+    with _open_for_write(p, compression, newline="") as f:
+        if not rows:
+            return
+        headers = list(rows[0].keys())
         w = csv.DictWriter(f, fieldnames=headers)
         w.writeheader()
         for r in rows:
@@ -1,11 +1,27 @@
+import math
 import re
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 _DIALOG_LINE = re.compile(r"^([^:]+):(.+)$")
-_SPLIT_PUNCTUATION = (".", "!", "?", ";")
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+_CJK_RUN = re.compile(_CJK.pattern + "+")
+_MESSAGE_OVERHEAD_TOKENS = 4
+_WORD_OR_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[^\W_]+", re.UNICODE)
 
+try:  # optional: exact counts for OpenAI-family tokenizers
+    import tiktoken  # type: ignore
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # pragma: no cover - depends on optional package
+    _ENCODING = None
 
-def split_dialog(text: str, max_chars: int) -> List[Tuple[str, str]]:
+# Sentence ends (CJK and Latin terminals, ellipses, "." not inside a word or number)
+# with any closing quotes/brackets, and weaker clause breaks (commas, colons, spaces).
+_CLOSERS = "\"'\u201d\u2019\u300d\u300f\uff09)\\]"
+_SENTENCE_END = re.compile(rf"(?:\.{{2,}}|\u2026+|[!?;\u3002\uff01\uff1f\uff1b]+|\.(?![\w.]))[{_CLOSERS}]*")
+_CLAUSE_BREAK = re.compile(r"[,\uff0c\u3001:\uff1a]|\s+")
+
+
+def split_dialog(text: str, max_chars: int, max_tokens: Optional[int] = None) -> List[Tuple[str, str]]:
     lines = [line.strip() for line in text.splitlines() if line.strip()]
     pairs: List[Tuple[str, str]] = []
     speaker = None
@@ -15,7 +31,7 @@ def split_dialog(text: str, max_chars: int) -> List[Tuple[str, str]]:
         if match:
             if buf and speaker:
                 chunk = " ".join(buf).strip()
-                for part in chunk_split(chunk, max_chars):
+                for part in chunk_split(chunk, max_chars, max_tokens):
                     pairs.append((speaker, part))
             speaker = match.group(1).strip()
             buf = [match.group(2).strip()]
@@ -23,43 +39,136 @@ def split_dialog(text: str, max_chars: int) -> List[Tuple[str, str]]:
             buf.append(line)
     if buf and speaker:
         chunk = " ".join(buf).strip()
-        for part in chunk_split(chunk, max_chars):
+        for part in chunk_split(chunk, max_chars, max_tokens):
             pairs.append((speaker, part))
     return pairs
 
 
-def split_paragraph(text: str, max_chars: int) -> List[str]:
+def split_paragraph(text: str, max_chars: int, max_tokens: Optional[int] = None) -> List[str]:
     paras = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
     out: List[str] = []
     for para in paras:
-        out.extend(chunk_split(para, max_chars))
+        out.extend(chunk_split(para, max_chars, max_tokens))
     return out
 
 
-def split_lines(text: str, max_chars: int) -> List[str]:
+def split_lines(text: str, max_chars: int, max_tokens: Optional[int] = None) -> List[str]:
     lines = [line.strip() for line in text.splitlines() if line.strip()]
     out: List[str] = []
     for line in lines:
-        out.extend(chunk_split(line, max_chars))
+        out.extend(chunk_split(line, max_chars, max_tokens))
     return out
 
 
-def chunk_split(s: str, max_chars: int) -> List[str]:
+def chunk_split(s: str, max_chars: int, max_tokens: Optional[int] = None) -> List[str]:
+    """Split ``s`` into chunks of at most ``max_chars`` characters (and, if given, at most
+    ``max_tokens`` tokens as counted by :func:`estimate_tokens`). Without tiktoken the
+    local estimate is kept up incrementally instead of re-counting every window.
+
+    One pass over the sentence ends: each chunk ends at the last sentence end that
+    still fits (。！？； . ! ? ; ellipses, with trailing closing quotes). Only when
+    the window holds no sentence end does it fall back to the last clause break
+    (comma, colon, whitespace), and then to a hard cut.
+    """
     s = s.strip()
-    if len(s) <= max_chars:
+    max_chars = max(1, max_chars)
+    cursor = [0, 0]  # a position and the number of CJK characters before it
+    start_cjk = [-1, 0]
+
+    def cjk_before(pos: int) -> int:
+        at, count = cursor
+        if pos >= at:
+            count += sum(map(len, _CJK_RUN.findall(s, at, pos)))
+        else:
+            count -= sum(map(len, _CJK_RUN.findall(s, pos, at)))
+        cursor[:] = [pos, count]
+        return count
+
+    def fits(start: int, end: int) -> bool:
+        if end - start > max_chars:
+            return False
+        if max_tokens is None:
+            return True
+        if _ENCODING is not None:
+            return estimate_tokens(s[start:end]) <= max_tokens
+        if start_cjk[0] != start:
+            start_cjk[:] = [start, cjk_before(start)]
+        cjk = cjk_before(end) - start_cjk[1]
+        return cjk + (end - start - cjk) / 4 <= max_tokens
+
+    if fits(0, len(s)):
         return [s]
-    out: List[str] = []
-    start = 0
-    while start < len(s):
-        end = min(len(s), start + max_chars)
+
+    def hard_end(start: int) -> int:
+        lo, hi = start + 1, min(len(s), start + max_chars)
+        if fits(start, hi):
+            return hi
+        while lo < hi:  # largest end that fits; the cost grows with the end
+            mid = (lo + hi + 1) // 2
+            if fits(start, mid):
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def clause_break(start: int, end: int) -> int:
         cut = -1
-        for punct in _SPLIT_PUNCTUATION:
-            cut = s.rfind(punct, start, end)
-            if cut != -1:
-                cut += len(punct)
-                break
-        if cut == -1 or cut <= start:
-            cut = end
-        out.append(s[start:cut].strip())
-        start = cut
+        for match in _CLAUSE_BREAK.finditer(s, start + 1, end):
+            pos = match.start() if match.group().isspace() else match.end()
+            if pos > start:
+                cut = pos
+        return cut
+
+    out: List[str] = []
+    start, strong = 0, -1
+
+    def cut_before(limit: int) -> None:
+        nonlocal start
+        while not fits(start, limit):
+            if strong > start:
+                cut = strong
+            else:
+                end = hard_end(start)
+                soft = clause_break(start, end)
+                cut = soft if soft > start else end
+            out.append(s[start:cut].strip())
+            start = cut
+            while start < len(s) and s[start].isspace():  # the next window starts at text
+                start += 1
+
+    for match in _SENTENCE_END.finditer(s):
+        cut_before(match.end())
+        strong = match.end()
+    cut_before(len(s))
+    out.append(s[start:].strip())
     return [chunk for chunk in out if chunk]
+
+
+def estimate_tokens(s: str) -> int:
+    """Token count of ``s``: exact with tiktoken installed, otherwise a local estimate
+    (one token per CJK character, one per four other characters)."""
+    if not s:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(s, disallowed_special=()))
+    cjk = len(_CJK.findall(s))
+    return cjk + math.ceil((len(s) - cjk) / 4)
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get("content") or "") + _MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def tokenize(s: str) -> List[str]:
+    """Lower-cased index terms: Latin/numeric words, and overlapping character bigrams
+    for CJK runs (single-character runs are kept as unigrams)."""
+    terms: List[str] = []
+    for run in _WORD_OR_CJK_RUN.findall(s.lower()):
+        if _CJK.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i : i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
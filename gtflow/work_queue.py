@@ -0,0 +1,299 @@
+from __future__ import annotations
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import AppConfig
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    job_key INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (run_id, kind, job_key)
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, lease_expires);
+"""
+
+@dataclass
+class Job:
+    id: int
+    run_id: str
+    kind: str
+    job_key: int
+    payload: Any
+    attempts: int
+
+class WorkQueue:
+    """Job queue in a SQLite file (WAL mode) shared by a coordinator and any number of workers.
+
+    A claimed job is leased to one worker until `lease_expires`; a worker that dies
+    simply lets the lease run out and the job becomes claimable again (visibility
+    timeout). Results are only accepted from the current lease holder, so a slow
+    worker whose lease was taken over cannot overwrite the newer result. Jobs that
+    fail `max_attempts` times are marked `failed`, including jobs whose lease ran out
+    that often (a batch that keeps killing its worker).
+    """
+    def __init__(self, path: str, busy_timeout_sec: float = 30.0):
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._local = threading.local()
+        self._busy_timeout = busy_timeout_sec
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self._busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, run_id: str, kind: str, payloads: List[Any]) -> int:
+        """Add one job per payload (keyed by position); existing keys are left alone,
+        so re-enqueueing a resumed run only adds what is missing. Returns the number added."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (run_id, kind, job_key, payload, updated) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, kind, i, json.dumps(p, ensure_ascii=False), now) for i, p in enumerate(payloads)],
+            )
+            added = conn.total_changes - before
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added
+
+    def reset(self, run_id: str, kind: Optional[str] = None):
+        conn = self._conn()
+        if kind is None:
+            conn.execute("DELETE FROM jobs WHERE run_id = ?", (run_id,))
+        else:
+            conn.execute("DELETE FROM jobs WHERE run_id = ? AND kind = ?", (run_id, kind))
+
+    def claim(self, worker_id: str, lease_sec: float, kinds: Optional[List[str]] = None, run_id: Optional[str] = None,
+              max_attempts: Optional[int] = None) -> Optional[Job]:
+        now = time.time()
+        scope, scope_args = "", []
+        if kinds:
+            scope += f" AND kind IN ({','.join('?' * len(kinds))})"
+            scope_args.extend(kinds)
+        if run_id:
+            scope += " AND run_id = ?"
+            scope_args.append(run_id)
+        where = "(status = 'pending' OR (status = 'leased' AND lease_expires < ?))" + scope
+        args: List[Any] = [now] + scope_args
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if max_attempts:
+                # leases that ran out max_attempts times: the batch keeps taking its worker down
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+                    f"WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?{scope}",
+                    [f"lease expired {max_attempts} times (worker lost)", now, now, max_attempts] + scope_args,
+                )
+            row = conn.execute(
+                f"SELECT id, run_id, kind, job_key, payload, attempts FROM jobs WHERE {where} ORDER BY id LIMIT 1", args
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker_id, now + lease_sec, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return Job(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5] + 1)
+
+    def extend(self, job: Job, worker_id: str, lease_sec: float) -> bool:
+        now = time.time()
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (now + lease_sec, now, job.id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job: Job, worker_id: str, result: Any) -> bool:
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job.id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, job: Job, worker_id: str, error: str, max_attempts: int) -> bool:
+        status = "failed" if job.attempts >= max_attempts else "pending"
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated = ? "
+            "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (status, error[:2000], time.time(), job.id, worker_id),
+        )
+        return cur.rowcount == 1
+
+    def counts(self, run_id: str, kind: Optional[str] = None) -> Dict[str, int]:
+        sql = "SELECT status, COUNT(*) FROM jobs WHERE run_id = ?"
+        args: List[Any] = [run_id]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        out = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        for status, n in self._conn().execute(sql + " GROUP BY status", args):
+            out[status] = n
+        return out
+
+    def results(self, run_id: str, kind: str) -> List[Dict[str, Any]]:
+        """Every job of `kind` in key order with its status, payload, result and error."""
+        rows = self._conn().execute(
+            "SELECT job_key, status, payload, result, error, attempts FROM jobs WHERE run_id = ? AND kind = ? ORDER BY job_key",
+            (run_id, kind),
+        )
+        return [
+            {"key": k, "status": s, "payload": json.loads(p), "result": json.loads(r) if r else None, "error": e, "attempts": a}
+            for k, s, p, r, e, a in rows
+        ]
+
+    def wait_drained(self, run_id: str, kind: Optional[str] = None, poll_sec: float = 2.0,
+                     timeout_sec: Optional[float] = None, on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+        """Block until no job of the run is pending or leased; returns the final counts."""
+        deadline = time.monotonic() + timeout_sec if timeout_sec else None
+        last = None
+        while True:
+            counts = self.counts(run_id, kind)
+            if counts != last and on_progress is not None:
+                on_progress(counts)
+            last = counts
+            if counts["pending"] == 0 and counts["leased"] == 0:
+                return counts
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"queue not drained after {timeout_sec}s: {counts}")
+            time.sleep(poll_sec)
+
+def collect_open_coding(queue: WorkQueue, run_id: str) -> Dict[str, Any]:
+    """Merge the results of a drained open-coding run in batch order: coded items,
+    seg_ids of failed batches (and of segments a worker skipped at its budget limit),
+    summed worker usage and the workers involved."""
+    items: List[Dict[str, Any]] = []
+    skipped: List[str] = []
+    errors: List[str] = []
+    usage = {"input_tokens": 0, "output_tokens": 0, "total_tokens": 0, "estimated_cost": 0.0}
+    workers = set()
+    batches = escalated = 0
+    for job in queue.results(run_id, "open_coding"):
+        batches += 1
+        result = job["result"]
+        if job["status"] != "done" or result is None:
+            skipped.extend(str(s["seg_id"]) for s in job["payload"])
+            errors.append(f"batch {job['key']}: {job['error']}")
+            continue
+        items.extend(result["items"])
+        skipped.extend(result.get("skipped_seg_ids", []))
+        escalated += result.get("escalated", 0)
+        workers.add(result.get("worker"))
+        for k in ("input_tokens", "output_tokens", "estimated_cost"):
+            usage[k] += result["usage"].get(k, 0)
+    usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+    usage["estimated_cost"] = round(usage["estimated_cost"], 6)
+    return {
+        "items": items, "skipped_seg_ids": skipped, "errors": errors, "usage": usage,
+        "workers": sorted(w for w in workers if w), "batches": batches, "escalated_batches": escalated,
+    }
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+def run_worker(
+    queue: WorkQueue,
+    conf: AppConfig,
+    worker_id: Optional[str] = None,
+    run_id: Optional[str] = None,
+    idle_exit_sec: Optional[float] = None,
+    poll_sec: float = 2.0,
+    log: Callable[[str], None] = print,
+    providers: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """Claim and process open-coding jobs until the queue stays empty for `idle_exit_sec`
+    (forever when None). Each job is coded with this worker's own providers (built from
+    `conf` unless `providers` is given), including the cascade, and its provider usage
+    is stored with the result."""
+    from .cost import usage_scope
+    from .pipeline.open_coder import run_open_coding
+    from .providers.base import make_stage_providers
+    from .rate_limiter import TokenBucket
+
+    worker_id = worker_id or default_worker_id()
+    providers = providers or make_stage_providers(conf)
+    limiter = TokenBucket(conf.run.rate_limit_rps)
+    lease = float(conf.run.queue_lease_sec)
+    done = failed = 0
+    idle_since = time.monotonic()
+    while True:
+        job = queue.claim(worker_id, lease, kinds=["open_coding"], run_id=run_id, max_attempts=conf.run.queue_max_attempts)
+        if job is None:
+            if idle_exit_sec is not None and time.monotonic() - idle_since >= idle_exit_sec:
+                return {"done": done, "failed": failed}
+            time.sleep(poll_sec)
+            continue
+        # keep the lease alive while the provider is working on the batch
+        stop = threading.Event()
+        def heartbeat():
+            while not stop.wait(lease / 3):
+                if not queue.extend(job, worker_id, lease):
+                    return
+        beat = threading.Thread(target=heartbeat, daemon=True)
+        beat.start()
+        try:
+            stats: Dict[str, Any] = {}
+            with usage_scope(f"job {job.job_key}") as used:
+                items = run_open_coding(
+                    providers["open_coding"], job.payload, batch_size=len(job.payload), max_retries=conf.run.retry_max,
+                    rate_limiter=limiter, fallback_provider=providers.get("open_coding_strong"),
+                    min_codes_per_segment=conf.open_coding_cascade.min_codes_per_segment, stats=stats,
+                    output_format=conf.run.open_coding_format,
+                )
+            result = {
+                "items": [x.model_dump() for x in items],
+                "usage": used.to_dict(),
+                "escalated": stats.get("escalated_batches", 0),
+                "worker": worker_id,
+                # seg_ids left uncoded because the worker's budget ran out
+                "skipped_seg_ids": stats.get("skipped_seg_ids", []),
+            }
+            if queue.complete(job, worker_id, result):
+                done += 1
+                log(f"[{worker_id}] job {job.run_id}/{job.job_key} done ({len(items)} items)")
+            else:
+                log(f"[{worker_id}] job {job.run_id}/{job.job_key} finished after its lease moved on; result dropped")
+        except Exception as e:
+            failed += 1
+            queue.fail(job, worker_id, f"{type(e).__name__}: {e}", conf.run.queue_max_attempts)
+            log(f"[{worker_id}] job {job.run_id}/{job.job_key} failed (attempt {job.attempts}): {e}")
+        finally:
+            stop.set()
+            beat.join()
+        idle_since = time.monotonic()
@@ -0,0 +1,103 @@
+import os
+import threading
+
+import pytest
+
+from gtflow.models.schemas import Codebook, OpenCodingItem, Theory
+from gtflow.pipeline import artifacts as artifacts_module
+from gtflow.pipeline.artifacts import ArtifactStore
+from gtflow.utils.file_io import read_json
+
+SEGMENTS = [{"seg_id": "s1", "text": "we waited"}, {"seg_id": "s2", "text": "it was fine"}]
+OPEN_CODES = [OpenCodingItem(seg_id="s1", initial_codes=[{"code": "waiting"}])]
+THEORY = Theory(core_category="coping", storyline="people cope")
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_round_trip_after_reload(tmp_path, compression):
+    store = ArtifactStore(str(tmp_path), compression=compression)
+    store["segments"] = SEGMENTS
+    store["open_codes"] = OPEN_CODES
+    store["theory"] = THEORY
+    store["scratch"] = object()  # not an artifact file: memory only
+    store.close()
+
+    reloaded = ArtifactStore(str(tmp_path))
+    assert reloaded.from_disk("segments", "codebook") is None  # codebook was never written
+    for name, value in reloaded.from_disk("segments", "open_codes", "theory").items():
+        reloaded[name] = value
+    assert set(reloaded) == {"segments", "open_codes", "theory"}
+    assert reloaded["segments"] == SEGMENTS
+    assert reloaded["open_codes"] == OPEN_CODES
+    assert isinstance(reloaded["theory"], Theory) and reloaded["theory"] == THEORY
+    # parsed once: later reads return the same object
+    assert reloaded["open_codes"] is reloaded["open_codes"]
+    assert reloaded.plain("theory") == THEORY.model_dump()
+    reloaded.close()
+
+
+def test_lazy_placeholders_are_not_read_until_asked_for(tmp_path, monkeypatch):
+    store = ArtifactStore(str(tmp_path), background=False)
+    store["segments"] = SEGMENTS
+    reads = []
+    monkeypatch.setattr(artifacts_module, "read_json", lambda path: reads.append(path) or read_json(path))
+    reloaded = ArtifactStore(str(tmp_path), background=False)
+    reloaded.update(reloaded.from_disk("segments"))
+    assert "segments" in reloaded and reads == []
+    assert reloaded["segments"] == SEGMENTS
+    assert reloaded["segments"] == SEGMENTS
+    assert len(reads) == 1
+
+
+def test_reading_a_key_whose_write_is_pending(tmp_path, monkeypatch):
+    release = threading.Event()
+    real_write = artifacts_module.write_json
+
+    def gated_write(path, data, **kwargs):
+        release.wait(5)
+        real_write(path, data, **kwargs)
+
+    monkeypatch.setattr(artifacts_module, "write_json", gated_write)
+    store = ArtifactStore(str(tmp_path))
+    codebook = Codebook(entries=[{"code": "waiting", "definition": "time spent idle"}])
+    store["codebook"] = codebook
+    # the writer is still blocked, yet the artifact is readable from memory
+    assert not os.path.exists(store.path("codebook"))
+    assert store["codebook"] is codebook
+    assert store.plain("codebook")["entries"][0]["code"] == "waiting"
+    # replacing it queues a second write; the file ends up with the newer value
+    store["codebook"] = Codebook()
+    release.set()
+    store.flush()
+    assert read_json(store.path("codebook"))["entries"] == []
+    store.close()
+
+
+def test_writer_errors_surface_on_flush_and_close(tmp_path, monkeypatch):
+    def failing_write(path, data, **kwargs):
+        raise OSError(f"disk full: {os.path.basename(path)}")
+
+    monkeypatch.setattr(artifacts_module, "write_json", failing_write)
+    store = ArtifactStore(str(tmp_path))
+    store["segments"] = SEGMENTS
+    with pytest.raises(OSError, match="segments.json"):
+        store.flush()
+    store.flush()  # a failed write is reported once
+    assert store["segments"] == SEGMENTS
+
+    store["theory"] = THEORY
+    with pytest.raises(OSError, match="theory.json"):
+        store.close()
+    # close still stopped the writer thread
+    with pytest.raises(RuntimeError):
+        store["theory"] = THEORY
+
+
+def test_synchronous_store_raises_on_store(tmp_path, monkeypatch):
+    def failing_write(path, data, **kwargs):
+        raise OSError("read-only")
+
+    monkeypatch.setattr(artifacts_module, "write_json", failing_write)
+    store = ArtifactStore(str(tmp_path), background=False)
+    with pytest.raises(OSError, match="read-only"):
+        store["segments"] = SEGMENTS
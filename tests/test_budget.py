@@ -0,0 +1,49 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gtflow.budget import BudgetExceeded, BudgetGovernor
+from gtflow.config import BudgetConfig, ProviderConfig
+from gtflow.providers.base import LLMProvider
+
+CALL_TOKENS = 300
+
+
+class SlowProvider(LLMProvider):
+    def generate_text(self, messages, response_format=None, **kwargs):
+        time.sleep(0.02)
+        self._update_usage(100, CALL_TOKENS - 100)
+        return "{}"
+
+
+def test_concurrent_calls_stay_within_one_call_of_the_limit():
+    governor = BudgetGovernor(BudgetConfig(max_tokens=4000, slowdown_at=1.0))
+    provider = governor.wrap(SlowProvider(ProviderConfig(max_tokens=512)), "open_coding")
+
+    def call(_):
+        try:
+            provider.generate_text([{"role": "user", "content": "code this"}])
+            return True
+        except BudgetExceeded:
+            return False
+
+    with ThreadPoolExecutor(max_workers=12) as pool:
+        results = list(pool.map(call, range(100)))
+    spend = governor.summary()["spend"]
+    assert not all(results)
+    assert 4000 <= spend["input_tokens"] + spend["output_tokens"] <= 4000 + CALL_TOKENS
+
+
+def test_failed_calls_release_their_reservation():
+    class Failing(LLMProvider):
+        def generate_text(self, messages, response_format=None, **kwargs):
+            raise RuntimeError("boom")
+
+    governor = BudgetGovernor(BudgetConfig(max_tokens=1000))
+    provider = governor.wrap(Failing(ProviderConfig(max_tokens=900)), "open_coding")
+    for _ in range(3):
+        try:
+            provider.generate_text([{"role": "user", "content": "x"}])
+        except RuntimeError:
+            pass
+    assert governor.summary()["spend"]["input_tokens"] == 0
+    assert governor._in_flight == 0
@@ -0,0 +1,63 @@
+import yaml
+from typer.testing import CliRunner
+
+from gtflow.cli import app
+from gtflow.utils.file_io import read_json
+
+runner = CliRunner()
+
+FIRST = "\n".join(f"P{i % 2 + 1}: We waited {i} hours for the mentoring session." for i in range(6))
+SECOND = "\n".join(f"P{i % 2 + 1}: Overtime on night {i} wore the team down." for i in range(4))
+THIRD = "\n".join(f"P{i % 2 + 1}: Feedback about tooling came late in week {i}." for i in range(3))
+
+
+def _setup(tmp_path):
+    config = tmp_path / "config.yaml"
+    config.write_text(yaml.safe_dump({
+        "provider": {"name": "mock", "mock_latency_sec": 0.0, "mock_tokens_per_sec": 1e6, "max_tokens": 16000},
+        "run": {"batch_size": 4, "rate_limit_rps": 1000},
+    }), encoding="utf-8")
+    paths = []
+    for name, text in (("first.txt", FIRST), ("second.txt", SECOND), ("third.txt", THIRD)):
+        (tmp_path / name).write_text(text, encoding="utf-8")
+        paths.append(str(tmp_path / name))
+    return str(config), str(tmp_path / "out"), paths
+
+
+def _invoke(*args):
+    result = runner.invoke(app, list(args))
+    assert result.exit_code == 0, result.output
+    return result
+
+
+def test_run_all_records_its_input_so_add_skips_it(tmp_path):
+    config, out, (first, _, _) = _setup(tmp_path)
+    _invoke("run-all", "-i", first, "-c", config, "-o", out)
+    documents = read_json(f"{out}/documents.json")
+    assert [(d["path"], d["seg_ids"]) for d in documents] == [(first, ["0001", "0006"])]
+
+    segments = len(read_json(f"{out}/segments.json"))
+    result = _invoke("add", "-i", first, "-c", config, "-o", out)
+    assert "already added" in result.output and "Nothing new to add" in result.output
+    assert len(read_json(f"{out}/segments.json")) == segments
+    assert len(read_json(f"{out}/documents.json")) == 1
+
+
+def test_add_codes_every_path(tmp_path):
+    config, out, (first, second, third) = _setup(tmp_path)
+    _invoke("run-all", "-i", first, "-c", config, "-o", out)
+    _invoke("add", "-i", second, "-i", third, "-i", first, "-c", config, "-o", out)
+    documents = read_json(f"{out}/documents.json")
+    assert [(d["path"], d["seg_ids"]) for d in documents] == [
+        (first, ["0001", "0006"]), (second, ["0007", "0010"]), (third, ["0011", "0013"]),
+    ]
+    segments = read_json(f"{out}/segments.json")
+    assert [s["meta"].get("doc") for s in segments[6:]] == ["second.txt"] * 4 + ["third.txt"] * 3
+    coded = {item["seg_id"] for item in read_json(f"{out}/open_codes.json")}
+    assert {s["seg_id"] for s in segments} <= coded
+    additions = read_json(f"{out}/run_meta.json")["additions"]
+    assert len(additions) == 1 and additions[0]["segments"] == 7
+
+    # a forced rerun rebuilds the segments from the input alone
+    _invoke("run-all", "-i", second, "-c", config, "-o", out, "--force")
+    assert [d["path"] for d in read_json(f"{out}/documents.json")] == [second]
@@ -0,0 +1,103 @@
+import json
+
+from gtflow.config import AppConfig
+from gtflow.models.schemas import Codebook
+from gtflow.pipeline.deductive_coder import CodebookMatcher, deductive_pass
+from gtflow.pipeline.stages import PipelineContext, run_pipeline
+from gtflow.providers.base import make_stage_providers
+
+CODEBOOK = Codebook.model_validate({"entries": [
+    {"code": "Waiting", "definition": "Time lost before care", "aliases": ["waited", "候诊"], "include": ["long queue"]},
+    {"code": "Work pressure", "definition": "Strain from the job", "aliases": ["工作压力"], "include": ["overtime"]},
+    {"code": "Stress", "definition": "Felt strain", "aliases": ["压力"]},
+    {"code": "Staffing", "definition": "Too few staff", "include": ["nurses"], "exclude": ["kind nurses"], "near_miss": ["nurse strike"]},
+    {"code": "Shift work", "definition": "Irregular hours", "include": ["overtime", "night shifts"]},
+    {"code": "Discharge", "definition": "Leaving hospital", "positive_examples": ["sent home"]},
+]})
+
+
+def _match(text, **kwargs):
+    return CodebookMatcher(CODEBOOK, **kwargs).match(text)
+
+
+def test_phrases_match_normalized_whole_words():
+    found = _match("We WAITED -- in a Long  Queue!")
+    assert set(found) == {"Waiting"}
+    assert found["Waiting"].weights == {"waited": 1.0, "long queue": 0.7}
+    assert found["Waiting"].confidence == 1.0 and found["Waiting"].evidence == "waited"
+    assert _match("The waitedness of it all") == {}  # Latin phrases match whole words only
+
+
+def test_overlapping_matches_keep_the_longest():
+    # "压力" sits inside "工作压力": only the longer phrase is evidence
+    assert set(_match("最近工作压力很大")) == {"Work pressure"}
+    assert set(_match("压力很大")) == {"Stress"}
+    # adjacent, non-overlapping phrases both count
+    assert set(_match("候诊的压力")) == {"Waiting", "Stress"}
+
+
+def test_shared_phrase_marks_a_conflict():
+    found = _match("lots of overtime")
+    assert set(found) == {"Work pressure", "Shift work"}
+    assert found["Work pressure"].conflict and found["Shift work"].conflict
+    assert not _match("night shifts again")["Shift work"].conflict
+
+
+def test_exclude_and_near_miss_phrases_veto_the_code():
+    assert not _match("the nurses were rushed")["Staffing"].vetoed
+    # the exclude phrase swallows the shorter "nurses" it contains: no evidence at all
+    assert _match("the kind nurses helped") == {}
+    assert _match("the kind nurses helped, but we need more nurses")["Staffing"].vetoed
+    assert _match("a nurse strike meant fewer nurses")["Staffing"].vetoed
+
+
+def test_examples_and_short_phrases_can_be_left_out():
+    assert set(_match("they sent home everyone")) == {"Discharge"}
+    assert _match("they sent home everyone", use_examples=False) == {}
+    assert "Stress" not in _match("压力很大", min_phrase_chars=3)
+
+
+def test_deductive_pass_codes_confident_segments_and_returns_the_rest():
+    segments = [
+        {"seg_id": "s1", "text": "We waited in a long queue."},        # 1.0: coded
+        {"seg_id": "s2", "text": "They sent home everyone early."},     # 0.5: below threshold
+        {"seg_id": "s3", "text": "Kind nurses, but too few nurses."},   # vetoed
+        {"seg_id": "s4", "text": "Too much overtime."},                 # conflict
+        {"seg_id": "s5", "text": "The food was fine."},                 # unmatched
+        {"seg_id": "s6", "text": "最近工作压力很大，候诊也很久。"},       # two confident codes
+    ]
+    items, remaining, stats = deductive_pass(segments, CODEBOOK, min_confidence=0.6)
+    assert [item.seg_id for item in items] == ["s1", "s6"]
+    assert {code.code for code in items[1].initial_codes} == {"Waiting", "Work pressure"}
+    assert items[0].initial_codes[0].definition == "Time lost before care"
+    assert items[0].quick_memo == "deductive: Waiting (1.00)"
+    assert [s["seg_id"] for s in remaining] == ["s2", "s3", "s4", "s5"]
+    assert stats["coded"] == 2 and stats["ambiguous"] == 3 and stats["unmatched"] == 1
+    assert stats["codes_assigned"] == 3
+
+    # a lower threshold lets the example-only match through
+    items, remaining, _ = deductive_pass(segments, CODEBOOK, min_confidence=0.5)
+    assert "s2" in [item.seg_id for item in items]
+
+
+def test_run_all_sends_only_uncertain_segments_to_the_llm(tmp_path):
+    codebook_path = tmp_path / "codebook.json"
+    codebook_path.write_text(json.dumps(CODEBOOK.model_dump()), encoding="utf-8")
+    transcript = "\n".join([
+        "P1: We waited in a long queue.",
+        "P2: They sent home everyone early.",
+        "P1: The kind nurses stayed late.",
+        "P2: The food was fine.",
+    ])
+    conf = AppConfig.model_validate({
+        "provider": {"name": "mock", "mock_latency_sec": 0.0, "mock_tokens_per_sec": 1e6, "max_tokens": 16000},
+        "run": {"batch_size": 4, "rate_limit_rps": 1000},
+        "open_coding_deductive": {"enabled": True, "codebook": str(codebook_path)},
+    })
+    ctx = PipelineContext(conf, make_stage_providers(conf), str(tmp_path / "out"), input_text=lambda: transcript, force=True)
+    artifacts = run_pipeline(ctx)
+    local = {item.seg_id: (item.quick_memo or "").startswith("deductive:") for item in artifacts["open_codes"]}
+    # the confident segment is coded locally; the example-only match (below
+    # min_confidence) and the unmatched ones were coded by the LLM
+    assert [local[segment["seg_id"]] for segment in artifacts["segments"]] == [True, False, False, False]
+    assert ctx.run_meta["stages"]["open_coding"]["deductive"]["coded"] == 1
@@ -0,0 +1,98 @@
+import json
+import re
+
+from gtflow.config import ProviderConfig
+from gtflow.models.schemas import OpenCodingItem
+from gtflow.pipeline.open_coder import run_open_coding
+from gtflow.pipeline.saturation import SaturationMonitor
+from gtflow.providers.base import LLMProvider
+
+SEG_ID = re.compile(r"^seg_id=(\S+):", re.MULTILINE)
+
+
+class ScriptedCoder(LLMProvider):
+    """Codes each segment with the codes `script` gives for its seg_id and records
+    the seg_ids it was asked about."""
+    def __init__(self, script):
+        super().__init__(ProviderConfig(name="mock"))
+        self.script = script
+        self.asked = []
+
+    def generate_text(self, messages, response_format=None, **kwargs):
+        seg_ids = SEG_ID.findall(messages[-1]["content"])
+        self.asked.extend(seg_ids)
+        self._update_usage(10, 10)
+        return json.dumps([
+            {"seg_id": s, "initial_codes": [{"code": c} for c in self.script(s)]} for s in seg_ids
+        ])
+
+
+def _script(seg_id):
+    n = int(seg_id[1:])
+    if n < 5:
+        return [f"new {n}"]  # every early segment brings a new code
+    if n == 11:
+        return ["spike a", "spike b", "spike c"]  # a sampled batch finds new ground
+    return ["new 0"]
+
+
+SEGMENTS = [{"seg_id": f"s{i}", "text": f"segment {i}"} for i in range(30)]
+
+
+def _monitor():
+    return SaturationMonitor(window=3, threshold=0.0, patience=2, min_segments=0)
+
+
+def test_monitor_saturates_and_a_new_code_spike_clears_it():
+    monitor = _monitor()
+    item = lambda *codes: OpenCodingItem(seg_id="x", initial_codes=[{"code": c} for c in codes])
+    for code in ["a", "b", "a", "a", "B"]:  # codes compare case-insensitively
+        monitor.add([item(code)])
+    assert not monitor.saturated  # one quiet window so far
+    monitor.add([item("A")])
+    assert monitor.saturated and monitor.saturated_at == 6
+    monitor.add([item("c")])
+    assert not monitor.saturated and monitor.saturated_at == 6
+    assert monitor.to_dict()["codes"] == 3
+
+
+def test_min_segments_holds_off_saturation():
+    monitor = SaturationMonitor(window=2, threshold=0.0, patience=1, min_segments=4)
+    item = OpenCodingItem(seg_id="x", initial_codes=[{"code": "same"}])
+    assert [monitor.add([item]) for _ in range(5)] == [False, False, False, True, True]
+
+
+def test_sampling_resumes_dense_coding_after_a_spike():
+    provider = ScriptedCoder(_script)
+    monitor = _monitor()
+    stats = {}
+    items = run_open_coding(provider, SEGMENTS, batch_size=1, workers=1, stats=stats, monitor=monitor, sample_every=3)
+    coded = [int(s[1:]) for s in provider.asked]
+    # saturated after s8; s11 is the third batch after it, sampled, and brings new codes,
+    # so s12-s15 are coded densely until it saturates again; then every third batch
+    assert coded == [0, 1, 2, 3, 4, 5, 6, 7, 8, 11, 12, 13, 14, 15, 18, 21, 24, 27]
+    assert [item.seg_id for item in items] == [f"s{n}" for n in coded]
+    skipped = [int(s[1:]) for s in stats["saturation_skipped_seg_ids"]]
+    assert skipped == [9, 10, 16, 17, 19, 20, 22, 23, 25, 26, 28, 29]
+    assert monitor.saturated_at == 9
+    assert "skipped_seg_ids" not in stats
+
+
+def test_stop_mode_codes_nothing_after_saturation():
+    provider = ScriptedCoder(_script)
+    stats = {}
+    run_open_coding(provider, SEGMENTS, batch_size=1, workers=1, stats=stats, monitor=_monitor(), sample_every=0)
+    assert provider.asked == [f"s{n}" for n in range(9)]
+    assert len(stats["saturation_skipped_seg_ids"]) == 21
+
+
+def test_concurrent_workers_feed_the_monitor_in_order():
+    provider = ScriptedCoder(lambda seg_id: ["new 0"] if seg_id == "s11" else _script(seg_id))
+    stats = {}
+    monitor = _monitor()
+    run_open_coding(provider, SEGMENTS, batch_size=2, workers=3, stats=stats, monitor=monitor, sample_every=0)
+    # saturated after the batch ending at s9; up to two more batches were in flight
+    assert monitor.saturated_at == 10
+    assert 10 <= len(provider.asked) <= 10 + 2 * 2
+    assert len(provider.asked) + len(stats["saturation_skipped_seg_ids"]) == 30
+    assert [n for n, _ in monitor.curve] == sorted(n for n, _ in monitor.curve)
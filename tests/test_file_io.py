@@ -0,0 +1,62 @@
+import gzip
+import os
+
+import pytest
+
+from gtflow.utils.file_io import exists, read_json, read_text, remove, resolve, target_path, variants, write_csv, write_json, write_text
+
+
+def _files(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_gzip_write_leaves_only_the_compressed_file(tmp_path):
+    path = str(tmp_path / "x.json")
+    write_json(path, {"a": 1})
+    write_json(path, {"a": "二"}, compression="gzip")
+    assert _files(tmp_path) == ["x.json.gz"]
+    with gzip.open(path + ".gz", "rt", encoding="utf-8") as f:
+        assert f.read().startswith("{")
+    assert resolve(path) == path + ".gz"
+    assert exists(path)
+    assert read_json(path) == {"a": "二"}
+
+
+def test_without_compression_an_existing_variant_keeps_its_codec(tmp_path):
+    path = str(tmp_path / "notes.txt")
+    write_text(path, "first", compression="gzip")
+    assert target_path(path) == path + ".gz"
+    write_text(path, "second")
+    assert _files(tmp_path) == ["notes.txt.gz"] and read_text(path) == "second"
+
+
+def test_resolve_and_variants(tmp_path):
+    path = str(tmp_path / "x.json")
+    assert variants(path + ".gz") == [path, path + ".zst", path + ".gz"]
+    assert resolve(path) == path and not exists(path)
+    write_json(path + ".gz", [1])
+    assert resolve(path) == path + ".gz" and resolve(path + ".zst") == path + ".gz"
+    remove(path)
+    assert _files(tmp_path) == []
+
+
+def test_failed_write_keeps_the_old_file_and_leaves_no_tmp(tmp_path):
+    path = str(tmp_path / "x.json")
+    write_json(path, {"ok": True}, compression="gzip")
+    with pytest.raises(TypeError):
+        write_json(path, {"ok": object()})  # fails part-way through the dump
+    assert _files(tmp_path) == ["x.json.gz"]
+    assert read_json(path) == {"ok": True}
+
+    with pytest.raises(TypeError):
+        write_json(str(tmp_path / "new.json"), [1, object()], compression="gzip")
+    assert _files(tmp_path) == ["x.json.gz"]
+
+
+def test_write_csv_round_trip(tmp_path):
+    path = str(tmp_path / "codes.csv")
+    write_csv(path, [{"code": "waiting", "count": 2}, {"code": "等待", "count": 1}], compression="gzip")
+    assert _files(tmp_path) == ["codes.csv.gz"]
+    assert read_text(path).splitlines() == ["code,count", "waiting,2", "等待,1"]
+    write_csv(path, [])
+    assert read_text(path) == ""
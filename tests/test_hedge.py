@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from gtflow.config import ProviderConfig, RunConfig
+from gtflow.providers.base import LLMProvider
+from gtflow.providers.hedge import HedgedProvider, HedgePool, hedge_providers, hedging_summary
+
+MESSAGES = [{"role": "user", "content": "code this"}]
+
+
+class ScriptedProvider(LLMProvider):
+    """Call n sleeps delays[n] (the last entry repeats) and replies "call-n"."""
+    def __init__(self, delays):
+        super().__init__(ProviderConfig(price_input_per_1k=1.0, price_output_per_1k=1.0))
+        self.delays = delays
+        self.count = 0
+        self._count_lock = threading.Lock()
+
+    def generate_text(self, messages, response_format=None, **kwargs):
+        with self._count_lock:
+            n = self.count
+            self.count += 1
+        time.sleep(self.delays[min(n, len(self.delays) - 1)])
+        self._update_usage(100, 50)
+        return f"call-{n}"
+
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    def acquire(self, amount=1.0):
+        self.acquired += 1
+
+
+def _hedger(delays, budget=1.0, percentile=0.5, **kwargs):
+    inner = ScriptedProvider(delays)
+    provider = HedgedProvider(inner, percentile=percentile, budget=budget, min_samples=2, min_delay_sec=0.05, **kwargs)
+    return inner, provider
+
+
+def test_no_hedging_before_min_samples():
+    inner, provider = _hedger([0.01])
+    assert provider.delay() is None
+    provider.generate_text(MESSAGES)
+    assert provider.delay() is None
+    provider.generate_text(MESSAGES)
+    assert provider.delay() == 0.05
+    assert provider.hedged == 0 and inner.count == 2
+
+
+def test_first_reply_wins_and_the_loser_is_still_billed():
+    # calls 0-1 warm up, call 2 (primary) hangs, call 3 is the hedge
+    limiter = CountingLimiter()
+    inner, provider = _hedger([0.01, 0.01, 0.6, 0.01], rate_limiter=limiter)
+    provider.generate_text(MESSAGES)
+    provider.generate_text(MESSAGES)
+    started = time.perf_counter()
+    assert provider.generate_text(MESSAGES) == "call-3"
+    assert time.perf_counter() - started < 0.4
+    assert (provider.hedged, provider.hedge_wins, limiter.acquired) == (1, 1, 1)
+
+    # the abandoned primary finishes later; its usage is counted when it does
+    deadline = time.monotonic() + 2
+    while provider.abandoned_cost == 0 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert provider.abandoned_cost == inner.estimate_cost(100, 50)
+    assert provider.total_usage()["input_tokens"] == 4 * 100
+    assert provider.summary()["win_rate"] == 1.0
+
+
+def test_primary_finishing_first_beats_the_hedge():
+    # the primary (call 2) is slower than the delay but faster than the hedge
+    inner, provider = _hedger([0.01, 0.01, 0.15, 0.6])
+    provider.generate_text(MESSAGES)
+    provider.generate_text(MESSAGES)
+    assert provider.generate_text(MESSAGES) == "call-2"
+    assert (provider.hedged, provider.hedge_wins) == (1, 0)
+
+
+def test_hedges_are_capped_by_the_budget():
+    # percentile 0 keeps the delay at min_delay_sec, so every slow call wants a hedge
+    inner, provider = _hedger([0.01, 0.01, 0.12], budget=0.25, percentile=0.0)
+    for _ in range(10):
+        provider.generate_text(MESSAGES)
+    assert provider.calls == 10
+    assert provider.hedged == 2  # 0.25 * 10 calls, rounded down
+    assert provider.hedged <= provider.budget * provider.calls
+
+
+def test_full_pool_runs_the_call_inline_without_a_hedge():
+    pool = HedgePool(1)
+    inner, provider = _hedger([0.01, 0.01, 0.15], pool=pool)
+    provider.generate_text(MESSAGES)
+    provider.generate_text(MESSAGES)
+    # the only worker runs the primary, so there is no room for a duplicate
+    assert provider.generate_text(MESSAGES) == "call-2"
+    assert provider.hedged == 0 and inner.count == 3
+
+    blocker = pool.submit(lambda: time.sleep(0.1))
+    assert pool.submit(lambda: None) is None
+    assert provider.generate_text(MESSAGES) == "call-3"
+    blocker.result()
+
+
+def test_abandoned_request_that_never_started_is_cancelled():
+    inner, provider = _hedger([0.01])
+    future = Future()
+    provider._abandon(future)
+    assert future.cancelled()
+    assert provider.abandoned_cost == 0
+
+
+def test_hedge_providers_share_one_pool_and_rate_limiter():
+    run = RunConfig(hedge_percentile=0.9, concurrent_workers=3, rate_limit_rps=5.0)
+    shared = ScriptedProvider([0.01])
+    providers = hedge_providers({"open_coding": shared, "axial": shared, "theory": ScriptedProvider([0.01])}, run)
+    assert providers["open_coding"] is providers["axial"]
+    assert providers["open_coding"] is not providers["theory"]
+    assert providers["open_coding"].pool is providers["theory"].pool
+    assert providers["open_coding"].pool.max_workers == 6
+    assert providers["open_coding"].rate_limiter is providers["theory"].rate_limiter
+    assert [row["stages"] for row in hedging_summary(providers)] == [["open_coding", "axial"], ["theory"]]
+    assert hedge_providers({"open_coding": shared}, RunConfig())["open_coding"] is shared
@@ -0,0 +1,77 @@
+import random
+
+from gtflow.models.schemas import AxialTriple
+from gtflow.pipeline.axial_coder import dedupe_triples
+from gtflow.utils.minhash import MinHashLSH, jaccard, near_duplicate_groups, shingles
+
+
+def _triple(condition, action, result, evidence, theme=None):
+    return AxialTriple(condition=condition, action=action, result=result, evidence=evidence, theme=theme)
+
+
+def _slots(triple):
+    return shingles(triple.condition, 1) | shingles(triple.action, 2) | shingles(triple.result, 3)
+
+
+WAITING = _triple("Long waiting times in the clinic", "patients complain to the nurses", "nurses feel stressed and overworked", ["s1"])
+REWORDED = _triple("long waiting time at the clinic", "patient complains to nurses", "nurses feel stressed and overworked", ["s2", "s3"], "Workload")
+# the same wording plus one word in the result: Jaccard 11/12
+CLOSE = _triple("Long waiting times in the clinic", "patients complain to the nurses", "nurses feel stressed, tired and overworked", ["s4"])
+SWAPPED = _triple("nurses feel stressed and overworked", "patients complain to the nurses", "Long waiting times in the clinic", ["s5"])
+OTHER = _triple("Clear discharge instructions", "patients follow medication plans", "fewer readmissions", ["s6"])
+
+
+def test_shingles_ignore_stop_words_and_inflections():
+    assert shingles("the team worked") == shingles("team works")
+    assert shingles("nurses", 1) != shingles("nurses", 2)
+    assert shingles("等待很久") == shingles("等待很久。")
+    assert jaccard(frozenset(), frozenset()) == 1.0
+    assert jaccard(frozenset({1, 2, 3}), frozenset({2, 3, 4})) == 0.5
+
+
+def test_signatures_are_deterministic_for_a_seed():
+    sample = shingles("patients complain to the nurses about waiting")
+    assert MinHashLSH(seed=7).signature(sample) == MinHashLSH(seed=7).signature(sample)
+    assert MinHashLSH(seed=7).signature(sample) != MinHashLSH(seed=8).signature(sample)
+
+
+def test_near_duplicate_groups_merge_only_above_the_threshold():
+    rng = random.Random(42)
+    sets, expected_pairs = [], []
+    for _ in range(100):
+        base = frozenset(rng.sample(range(10**6), 30))
+        near = frozenset(list(base)[:29]) | {rng.randrange(10**6, 2 * 10**6)}  # Jaccard 29/31
+        far = frozenset(list(base)[:15]) | frozenset(rng.sample(range(2 * 10**6, 3 * 10**6), 15))  # 15/45
+        expected_pairs.append((len(sets), len(sets) + 1))
+        sets.extend([base, near, far])
+    groups = near_duplicate_groups(sets, threshold=0.8)
+    group_of = {i: tuple(group) for group in groups for i in group}
+    for base, near in expected_pairs:
+        assert group_of[base] == (base, near)
+        assert group_of[near + 1] == (near + 1,)
+    # groups come in first-occurrence order
+    assert [group[0] for group in groups] == sorted(group[0] for group in groups)
+
+
+def test_dedupe_triples_merges_paraphrases_and_unions_evidence():
+    assert jaccard(_slots(WAITING), _slots(REWORDED)) >= 0.8
+    merged = dedupe_triples([WAITING, SWAPPED, REWORDED, OTHER])
+    assert len(merged) == 3
+    # the wording with the most evidence is kept, its evidence first
+    first = merged[0]
+    assert (first.condition, first.evidence, first.theme) == (REWORDED.condition, ["s2", "s3", "s1"], "Workload")
+    # swapping cause and effect is a different claim
+    assert merged[1] == SWAPPED and merged[2] == OTHER
+
+
+def test_dedupe_triples_threshold():
+    similarity = jaccard(_slots(WAITING), _slots(CLOSE))
+    assert 0.85 <= similarity < 0.95
+    assert len(dedupe_triples([WAITING, CLOSE], threshold=0.85)) == 1
+    assert dedupe_triples([WAITING, CLOSE], threshold=0.95) == [WAITING, CLOSE]
+
+
+def test_dedupe_triples_folds_exact_duplicates_first():
+    copy = WAITING.model_copy(update={"evidence": ["s9"]})
+    merged = dedupe_triples([WAITING, copy], threshold=1.0)
+    assert len(merged) == 1 and set(merged[0].evidence) == {"s1", "s9"}
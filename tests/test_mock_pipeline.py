@@ -0,0 +1,29 @@
+from gtflow.config import AppConfig
+from gtflow.pipeline.stages import PipelineContext, run_pipeline
+from gtflow.providers.base import make_stage_providers
+
+TOPICS = ["mentoring", "planning", "overtime", "feedback", "tooling", "pairing", "retrospectives", "budgeting"]
+TRANSCRIPT = "\n".join(
+    f"Interviewer: How did week {i} go?\nP{i % 3}: Honestly {topic} {topic} {topic} and {TOPICS[i - 1]} {TOPICS[i - 1]}."
+    for i, topic in enumerate(TOPICS)
+)
+
+
+def _run(tmp_path, **run):
+    conf = AppConfig.model_validate({
+        "provider": {"name": "mock", "mock_latency_sec": 0.0, "mock_tokens_per_sec": 1e6, "max_tokens": 16000},
+        "run": {"batch_size": 4, "rate_limit_rps": 1000, **run},
+    })
+    ctx = PipelineContext(conf, make_stage_providers(conf), str(tmp_path), input_text=lambda: TRANSCRIPT, force=True)
+    return run_pipeline(ctx)
+
+
+def test_mock_run_all_single(tmp_path):
+    theory = _run(tmp_path)["theory"]
+    assert theory.core_category and theory.storyline
+
+
+def test_mock_run_all_hierarchical(tmp_path):
+    artifacts = _run(tmp_path, selective_mode="hierarchical", selective_group_size=4)
+    assert len(artifacts["axial_triples"]) > 4  # more than one group, so the synthesis prompt runs
+    assert artifacts["theory"].core_category and artifacts["theory"].storyline
@@ -0,0 +1,36 @@
+from gtflow.config import AppConfig
+from gtflow.models.schemas import Segment
+from gtflow.pipeline import negatives_scanner
+from gtflow.planner import _NEGATIVES_OUTPUT_TOKENS, _THEORY_OUTPUT_TOKENS, plan_run
+from gtflow.utils.text_utils import estimate_message_tokens
+
+SEGMENTS = [Segment(seg_id=f"s{i}", text=f"segment {i} " + "words " * (i % 7 + 1)) for i in range(40)]
+
+
+def _conf(**run):
+    return AppConfig.model_validate({"provider": {"name": "mock", "max_tokens": 16000}, "run": run})
+
+
+def _stage(plan, name):
+    return next(stage for stage in plan["stages"] if stage["stage"] == name)
+
+
+def test_negatives_prompt_covers_every_segment_without_top_k():
+    plan = plan_run(_conf(), SEGMENTS)
+    storyline = "storyline " * (_THEORY_OUTPUT_TOKENS // 2)
+    expected = estimate_message_tokens(negatives_scanner.build_prompt([s.model_dump() for s in SEGMENTS], storyline))
+    assert _stage(plan, "negatives")["input_tokens"] == expected
+
+
+def test_negatives_top_k_caps_the_planned_prompt():
+    full = _stage(plan_run(_conf(), SEGMENTS), "negatives")
+    capped = _stage(plan_run(_conf(negatives_top_k=5), SEGMENTS), "negatives")
+    assert capped["input_tokens"] < full["input_tokens"]
+    assert capped["requests"] == 1 and capped["output_tokens"] == min(16000, _NEGATIVES_OUTPUT_TOKENS)
+    # planned with the longest segments, so the real prompt can only be smaller
+    storyline = "storyline " * (_THEORY_OUTPUT_TOKENS // 2)
+    for start in range(0, len(SEGMENTS) - 5):
+        window = [s.model_dump() for s in SEGMENTS[start:start + 5]]
+        assert estimate_message_tokens(negatives_scanner.build_prompt(window, storyline)) <= capped["input_tokens"]
+    # a top_k at least the corpus size plans the whole corpus
+    assert _stage(plan_run(_conf(negatives_top_k=100), SEGMENTS), "negatives")["input_tokens"] == full["input_tokens"]
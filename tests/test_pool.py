@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from gtflow.config import ProviderConfig
+from gtflow.providers.base import LLMProvider
+from gtflow.providers.pool import PooledProvider
+from gtflow.utils.text_utils import estimate_message_tokens
+
+MESSAGES = [{"role": "user", "content": "code these segments " * 20}]
+
+
+class Member(LLMProvider):
+    def __init__(self, model, weight=1.0, tpm=None, fail=False, sleep=0.0):
+        super().__init__(ProviderConfig(name="mock", model=model, weight=weight, tpm=tpm))
+        self.fail = fail
+        self.sleep = sleep
+        self.calls = 0
+
+    def generate_text(self, messages, response_format=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.sleep)
+        if self.fail:
+            raise RuntimeError(f"{self.conf.model} is down")
+        self._update_usage(30, 10)
+        return self.conf.model
+
+
+def test_least_load_is_weighted():
+    heavy, light = Member("heavy", weight=3), Member("light", weight=1)
+    pool = PooledProvider([heavy, light])
+    picked = [pool._acquire(set())[0].provider.conf.model for _ in range(8)]
+    # load = (in_flight + 1) / weight, so heavy takes three requests for each of light's
+    assert picked.count("heavy") == 6 and picked.count("light") == 2
+
+
+def test_concurrent_requests_spread_by_weight():
+    heavy, light = Member("heavy", weight=3, sleep=0.05), Member("light", weight=1, sleep=0.05)
+    pool = PooledProvider([heavy, light])
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: pool.generate_text(MESSAGES), range(32)))
+    assert heavy.calls + light.calls == 32
+    assert heavy.calls > 2 * light.calls > 0
+
+
+def test_failed_request_fails_over_and_the_member_is_benched():
+    down, up = Member("down", weight=10, fail=True), Member("up")
+    pool = PooledProvider([down, up], failure_threshold=2, cooldown_sec=60)
+    assert pool.generate_text(MESSAGES) == "up"
+    assert pool.generate_text(MESSAGES) == "up"
+    assert down.calls == 2
+    # benched after two failures in a row: no longer tried first
+    assert pool.generate_text(MESSAGES) == "up"
+    assert down.calls == 2
+    rows = {row["member"].split("@")[0]: row for row in pool.member_usage()}
+    assert rows["mock:down"]["failures"] == 2 and rows["mock:up"]["requests"] == 3
+    assert pool.total_usage()["input_tokens"] == 3 * 30
+
+
+def test_all_members_failing_raises():
+    pool = PooledProvider([Member("a", fail=True), Member("b", fail=True)])
+    with pytest.raises(RuntimeError, match="All provider pool members failed"):
+        pool.generate_text(MESSAGES)
+
+
+def test_tpm_counts_the_prompt_of_requests_in_flight():
+    prompt = estimate_message_tokens(MESSAGES)
+    limited = Member("limited", weight=10, tpm=prompt + prompt // 2)
+    spare = Member("spare")
+    pool = PooledProvider([limited, spare])
+    first, entry = pool._acquire(set(), prompt)
+    assert first.provider is limited and entry[1] == prompt
+    # a second prompt would not fit into limited's TPM while the first is in flight
+    second, second_entry = pool._acquire(set(), prompt)
+    assert second.provider is spare
+    pool._release(second, second_entry, ok=True, tokens=40)
+    # the first request reports less than its reservation: limited has room again
+    pool._release(first, entry, ok=True, tokens=prompt // 4)
+    assert entry[1] == prompt // 4
+    assert pool._acquire(set(), prompt)[0].provider is limited
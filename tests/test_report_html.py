@@ -0,0 +1,38 @@
+import os
+
+from gtflow.pipeline.report_html import DATA_DIR, aggregate_graph, write_report
+
+TRIPLES = [
+    {"condition": "Long queue", "action": "patients wait", "result": "frustration", "theme": "Waiting", "evidence": "we waited"},
+    {"condition": "long  queue", "action": "staff rush", "result": "Frustration", "theme": "Waiting", "evidence": ""},
+    {"condition": "Night shifts", "action": "nurses cover", "result": "fatigue", "theme": "Staffing", "evidence": ""},
+]
+OPEN_CODES = [{"seg_id": f"s{i}", "initial_codes": [{"code": "waiting"}]} for i in range(5)]
+CODEBOOK = {"entries": [{"code": "waiting", "definition": "time lost", "aliases": ["queue"]}]}
+
+
+def _write(tmp_path, mode, **kwargs):
+    return write_report(str(tmp_path / "report.html"), {"segments": 5}, {}, TRIPLES, OPEN_CODES, CODEBOOK, mode=mode, **kwargs)
+
+
+def test_sharded_report_writes_chunks(tmp_path):
+    assert _write(tmp_path, "sharded", page_size=2) == "sharded"
+    chunks = sorted(os.listdir(tmp_path / DATA_DIR))
+    assert chunks == ["codebook-0.js", "open_codes-0.js", "open_codes-1.js", "open_codes-2.js", "triples-0.js", "triples-1.js"]
+    html = (tmp_path / "report.html").read_text(encoding="utf-8")
+    assert DATA_DIR in html
+
+
+def test_single_report_removes_stale_chunks(tmp_path):
+    _write(tmp_path, "sharded")
+    assert os.path.isdir(tmp_path / DATA_DIR)
+    assert _write(tmp_path, "auto") == "single"
+    assert sorted(os.listdir(tmp_path)) == ["report.html"]
+    # nothing to remove is fine too
+    assert _write(tmp_path, "single") == "single"
+
+
+def test_graph_merges_equivalent_edges():
+    graph = aggregate_graph(TRIPLES, max_edges=1)
+    assert graph["note"].startswith("3 triples aggregated into 2 condition -> result edges; showing the 1 most")
+    assert '-->|"patients wait x2"|' in graph["mermaid"] and "fatigue" not in graph["mermaid"]
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+from gtflow.scheduler import Stage, StageSkipped, critical_path, run_stages
+
+
+def _stage(name, inputs, outputs, log, sleep=0.0, fail=None):
+    def run(got):
+        log.append(("start", name, sorted(got)))
+        time.sleep(sleep)
+        if fail is not None:
+            raise fail
+        log.append(("end", name))
+        return {out: f"{name}:{out}" for out in outputs}
+    return Stage(name, tuple(inputs), tuple(outputs), run)
+
+
+def test_stages_start_after_their_inputs_and_independent_ones_overlap():
+    log = []
+    stages = [
+        _stage("report", ["theory", "saturation"], ["report"], log),
+        _stage("theory", ["codebook"], ["theory"], log, sleep=0.05),
+        _stage("saturation", ["open_codes"], ["saturation"], log, sleep=0.05),
+        _stage("codebook", ["open_codes"], ["codebook"], log, sleep=0.05),
+        _stage("open", ["segments"], ["open_codes"], log),
+    ]
+    artifacts = {"segments": "seg"}
+    schedule = run_stages(stages, artifacts, max_parallel=4)
+
+    order = [entry[1] for entry in log if entry[0] == "start"]
+    assert order.index("open") < order.index("codebook") < order.index("theory") < order.index("report")
+    assert order.index("saturation") < order.index("report")
+    assert ("start", "report", ["saturation", "theory"]) in log
+    assert artifacts["report"] == "report:report"
+    assert all(t["status"] == "done" for t in schedule["stages"].values())
+    # saturation ran next to codebook, so the wall time is below the serial time
+    assert schedule["wall_sec"] < schedule["serial_sec"]
+
+
+def test_max_parallel_one_runs_in_declaration_order():
+    log = []
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def around(stage):
+        class Count:
+            def __enter__(self):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+
+            def __exit__(self, *exc):
+                with lock:
+                    active[0] -= 1
+        return Count()
+
+    stages = [_stage(name, ["segments"], [name], log, sleep=0.01) for name in ("a", "b", "c")]
+    run_stages(stages, {"segments": 1}, max_parallel=1, around=around)
+    assert [entry[1] for entry in log if entry[0] == "start"] == ["a", "b", "c"]
+    assert peak[0] == 1
+
+
+def test_skipped_stage_blocks_its_dependents_transitively():
+    log, events = [], []
+
+    def skip(got):
+        raise StageSkipped("budget")
+
+    stages = [
+        _stage("open", ["segments"], ["open_codes"], log),
+        Stage("codebook", ("open_codes",), ("codebook",), skip),
+        _stage("axial", ["codebook"], ["axial"], log),
+        _stage("theory", ["axial"], ["theory"], log),
+        _stage("saturation", ["open_codes"], ["saturation"], log),
+    ]
+    schedule = run_stages(stages, {"segments": 1}, on_event=lambda s, status: events.append((s.name, status)))
+    statuses = {name: t["status"] for name, t in schedule["stages"].items()}
+    assert statuses == {
+        "open": "done",
+        "codebook": "skipped: budget",
+        "axial": "blocked",
+        "theory": "blocked",
+        "saturation": "done",
+    }
+    assert ("axial", "blocked") in events and ("theory", "blocked") in events
+    assert not any(entry[1] in ("axial", "theory") for entry in log)
+
+
+def test_incomplete_stage_blocks_the_consumers_of_the_missing_output():
+    stages = [
+        Stage("index", ("segments",), ("index", "stats"), lambda got: {"stats": 1}),
+        Stage("evidence", ("index",), ("evidence",), lambda got: {"evidence": 1}),
+        Stage("summary", ("stats",), ("summary",), lambda got: {"summary": 1}),
+    ]
+    statuses = {name: t["status"] for name, t in run_stages(stages, {"segments": 1})["stages"].items()}
+    assert statuses == {"index": "incomplete", "evidence": "blocked", "summary": "done"}
+
+
+def test_failure_lets_running_stages_finish_then_reraises():
+    log, events = [], []
+    stages = [
+        _stage("open", ["segments"], ["open_codes"], log, fail=RuntimeError("provider down")),
+        _stage("index", ["segments"], ["index"], log, sleep=0.05),
+        _stage("codebook", ["open_codes"], ["codebook"], log),
+    ]
+    artifacts = {"segments": 1}
+    with pytest.raises(RuntimeError, match="provider down"):
+        run_stages(stages, artifacts, max_parallel=2, on_event=lambda s, status: events.append((s.name, status)))
+    assert ("open", "failed") in events
+    # the stage already running finished and kept its output; the dependent never ran
+    assert ("index", "done") in events and artifacts["index"] == "index:index"
+    assert not any(entry[1] == "codebook" for entry in log)
+
+
+def test_cached_stage_skips_run():
+    ran = []
+    stages = [
+        Stage("open", ("segments",), ("open_codes",), lambda got: ran.append("open") or {"open_codes": 2},
+              load=lambda: {"open_codes": 1}),
+        Stage("codebook", ("open_codes",), ("codebook",), lambda got: {"codebook": got["open_codes"]}),
+    ]
+    artifacts = {"segments": 1}
+    schedule = run_stages(stages, artifacts)
+    assert ran == [] and artifacts["codebook"] == 1
+    assert schedule["stages"]["open"]["status"] == "cached"
+
+
+def test_critical_path_follows_the_latest_finishing_dependency():
+    deps = {"open": set(), "codebook": {"open"}, "saturation": {"open"}, "index": set(),
+            "report": {"codebook", "saturation", "index"}}
+    timings = {
+        "open": {"end": 1.0},
+        "codebook": {"end": 3.0},
+        "saturation": {"end": 2.0},
+        "index": {"end": 0.5},
+        "report": {"end": 3.5},
+    }
+    assert critical_path(deps, timings) == ["open", "codebook", "report"]
+    # stages that never ran are ignored
+    timings["report"] = {"status": "blocked"}
+    assert critical_path(deps, timings) == ["open", "codebook"]
+    assert critical_path(deps, {}) == []
+
+
+def test_run_stages_reports_the_critical_path():
+    log = []
+    stages = [
+        _stage("open", ["segments"], ["open_codes"], log, sleep=0.02),
+        _stage("codebook", ["open_codes"], ["codebook"], log, sleep=0.08),
+        _stage("saturation", ["open_codes"], ["saturation"], log, sleep=0.01),
+        _stage("report", ["codebook", "saturation"], ["report"], log),
+    ]
+    schedule = run_stages(stages, {"segments": 1})
+    assert schedule["critical_path"] == ["open", "codebook", "report"]
+    assert schedule["critical_path_sec"] <= schedule["wall_sec"] + 0.01
+
+
+def test_graph_errors():
+    noop = lambda got: {}
+    with pytest.raises(ValueError, match="produced by both"):
+        run_stages([Stage("a", (), ("x",), noop), Stage("b", (), ("x",), noop)])
+    with pytest.raises(ValueError, match="which no stage produces"):
+        run_stages([Stage("a", ("missing",), ("x",), noop)])
+    with pytest.raises(ValueError, match="cycle"):
+        run_stages([Stage("a", ("y",), ("x",), noop), Stage("b", ("x",), ("y",), noop)])
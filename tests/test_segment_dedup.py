@@ -0,0 +1,78 @@
+from gtflow.config import ProviderConfig
+from gtflow.models.schemas import OpenCodingItem
+from gtflow.pipeline.open_coder import run_open_coding
+from gtflow.pipeline.segment_dedup import fan_out, normalize_text, plan_dedup
+from gtflow.providers.mock import MockProvider
+
+SEGMENTS = [
+    {"seg_id": "s1", "text": "Can you tell me about your week?"},
+    {"seg_id": "s2", "text": "We waited three hours for the doctor."},
+    {"seg_id": "s3", "text": "嗯"},
+    {"seg_id": "s4", "text": "can you tell me   about your WEEK"},
+    {"seg_id": "s5", "text": "OK."},
+    {"seg_id": "s6", "text": "Can you tell me about your week？"},
+    {"seg_id": "s7", "text": "...!"},
+    {"seg_id": "s8", "text": "We waited three hours for the doctor!"},
+]
+
+
+class CountingCoder(MockProvider):
+    def __init__(self):
+        super().__init__(ProviderConfig(name="mock", max_tokens=16000, mock_latency_sec=0.0, mock_tokens_per_sec=1e6))
+        self.prompts = []
+
+    def generate_text(self, messages, response_format=None, **kwargs):
+        self.prompts.append(messages[-1]["content"])
+        return super().generate_text(messages, response_format=response_format, **kwargs)
+
+
+def test_normalize_text():
+    assert normalize_text("  Can you tell me, about   your WEEK？ ") == "can you tell me about your week"
+    assert normalize_text("ＡＢＣ１２３") == "abc123"  # NFKC folds full-width forms
+    assert normalize_text("...!") == ""
+
+
+def test_plan_groups_repeats_and_skips_trivial_segments():
+    plan = plan_dedup(SEGMENTS, trivial_max_chars=1, trivial_patterns=["ok(ay)?"])
+    assert [s["seg_id"] for s in plan.unique] == ["s1", "s2"]
+    assert plan.copies == {"s1": ["s4", "s6"], "s2": ["s8"]}
+    assert plan.trivial == ["s3", "s5", "s7"]
+    assert plan.stats(len(SEGMENTS)) == {
+        "segments": 8, "unique_segments": 2, "duplicate_segments": 3, "trivial_segments": 3, "saved_share": 0.75,
+    }
+
+
+def test_plan_without_dedupe_keeps_every_non_trivial_segment():
+    plan = plan_dedup(SEGMENTS, dedupe=False)
+    assert [s["seg_id"] for s in plan.unique] == ["s1", "s2", "s3", "s4", "s5", "s6", "s8"]
+    assert plan.copies == {} and plan.trivial == ["s7"]
+
+
+def test_fan_out_copies_results_to_every_repeat_in_order():
+    plan = plan_dedup(SEGMENTS, trivial_max_chars=1, trivial_patterns=["ok(ay)?"])
+    coded = [
+        OpenCodingItem(seg_id="s2", initial_codes=[{"code": "waiting"}]),
+        OpenCodingItem(seg_id="s1", initial_codes=[{"code": "opening question"}]),
+        OpenCodingItem(seg_id="extra", initial_codes=[{"code": "kept at the end"}]),
+    ]
+    out = fan_out(coded, plan, SEGMENTS)
+    assert [item.seg_id for item in out] == ["s1", "s2", "s4", "s6", "s8", "extra"]
+    assert [item.initial_codes[0].code for item in out] == [
+        "opening question", "waiting", "opening question", "opening question", "waiting", "kept at the end",
+    ]
+    # copies are independent of the item they were made from
+    out[2].initial_codes[0].code = "changed"
+    assert out[0].initial_codes[0].code == "opening question"
+
+
+def test_each_distinct_text_is_sent_to_the_provider_once():
+    plan = plan_dedup(SEGMENTS, trivial_max_chars=1, trivial_patterns=["ok(ay)?"])
+    provider = CountingCoder()
+    items = run_open_coding(provider, plan.unique, batch_size=10)
+    assert len(provider.prompts) == 1
+    prompt = provider.prompts[0]
+    assert "seg_id=s1:" in prompt and "seg_id=s2:" in prompt
+    assert not any(f"seg_id={s}:" in prompt for s in ("s3", "s4", "s5", "s6", "s7", "s8"))
+    out = fan_out(items, plan, SEGMENTS)
+    assert [item.seg_id for item in out] == ["s1", "s2", "s4", "s6", "s8"]
+    assert out[2].initial_codes == out[0].initial_codes
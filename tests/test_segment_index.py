@@ -0,0 +1,97 @@
+import os
+
+from gtflow.models.schemas import AxialTriple
+from gtflow.pipeline import segment_index
+from gtflow.pipeline.segment_index import INDEX_FILE, SegmentIndex, ground_evidence, load_or_build_index
+
+SEGMENTS = [
+    {"seg_id": "s1", "text": "We waited for the doctor for three hours in the clinic."},
+    {"seg_id": "s2", "text": "The nurses were kind but clearly overworked."},
+    {"seg_id": "s3", "text": "Waiting, waiting, waiting: the waiting room was full and the waiting never ended."},
+    {"seg_id": "s4", "text": "My medication plan was explained clearly at discharge."},
+    {"seg_id": "s5", "text": "医生说要等很久，候诊室里人很多。"},
+]
+
+
+def test_bm25_ranks_by_term_frequency_rarity_and_length():
+    index = SegmentIndex.build(SEGMENTS)
+    # s3 repeats "waiting" four times, s1 has "doctor" once; tf saturates, but not that fast
+    assert [seg_id for seg_id, _ in index.query("waiting doctor")] == ["s3", "s1"]
+    # terms found in most segments weigh less
+    assert index.idf("the") < index.idf("doctor")
+    assert index.query("waiting")[0][0] == "s3"
+    assert index.query("doctor")[0][0] == "s1"
+    assert [seg_id for seg_id, _ in index.query("medication discharge nurses")] == ["s4", "s2"]
+    # scores are sorted best first and k caps the hits
+    values = [score for _, score in index.query("the waiting nurses clinic", k=10)]
+    assert values == sorted(values, reverse=True)
+    assert len(index.query("the", k=2)) == 2
+
+
+def test_query_cjk_and_restrict():
+    index = SegmentIndex.build(SEGMENTS)
+    assert index.query("候诊室")[0][0] == "s5"
+    assert [seg_id for seg_id, _ in index.query("waiting doctor", restrict=["s3", "s4", "missing"])] == ["s3"]
+    assert index.query("nothing matches zebra") == []
+
+
+def test_round_trip_through_dict():
+    index = SegmentIndex.build(SEGMENTS)
+    loaded = SegmentIndex.from_dict(index.to_dict())
+    assert loaded.fingerprint == index.fingerprint
+    assert loaded.query("waiting doctor") == index.query("waiting doctor")
+
+
+def test_index_is_reused_until_the_segments_change(tmp_path, monkeypatch):
+    builds = []
+    real_build = SegmentIndex.build.__func__
+
+    def counting_build(cls, segments, *args, **kwargs):
+        builds.append(len(segments))
+        return real_build(cls, segments, *args, **kwargs)
+
+    monkeypatch.setattr(SegmentIndex, "build", classmethod(counting_build))
+    out = str(tmp_path)
+    first = load_or_build_index(out, SEGMENTS)
+    assert builds == [len(SEGMENTS)] and os.path.exists(os.path.join(out, INDEX_FILE))
+
+    again = load_or_build_index(out, [dict(s) for s in SEGMENTS])
+    assert builds == [len(SEGMENTS)]
+    assert again.fingerprint == first.fingerprint and again.query("doctor") == first.query("doctor")
+
+    edited = [dict(s) for s in SEGMENTS]
+    edited[1]["text"] = "The doctor apologised for the delay."
+    rebuilt = load_or_build_index(out, edited)
+    assert builds == [len(SEGMENTS), len(SEGMENTS)]
+    assert rebuilt.fingerprint != first.fingerprint
+    assert {seg_id for seg_id, _ in rebuilt.query("doctor")} == {"s1", "s2"}
+    # the rebuilt index replaced the file, so the next load reuses it
+    load_or_build_index(out, edited)
+    assert len(builds) == 2
+
+
+def test_unreadable_or_old_index_is_rebuilt(tmp_path):
+    path = os.path.join(str(tmp_path), INDEX_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    assert len(load_or_build_index(str(tmp_path), SEGMENTS)) == len(SEGMENTS)
+    data = segment_index.read_json(path)
+    data["version"] = 0
+    segment_index.write_json(path, data)
+    assert load_or_build_index(str(tmp_path), SEGMENTS).query("doctor")[0][0] == "s1"
+    assert segment_index.read_json(path)["version"] == segment_index._FORMAT_VERSION
+
+
+def test_ground_evidence_fills_missing_and_drops_unknown_seg_ids():
+    index = SegmentIndex.build(SEGMENTS)
+    triples = [
+        AxialTriple(condition="long waiting", action="patients wait for the doctor", result="frustration", evidence=[]),
+        AxialTriple(condition="overworked nurses", action="rushed care", result="kind but tired staff", evidence=["s2", "s99"]),
+        AxialTriple(condition="clear discharge", action="follow the medication plan", result="fewer readmissions", evidence=["s4"]),
+        AxialTriple(condition="zebra", action="quux", result="xyzzy", evidence=["gone"]),
+    ]
+    assert ground_evidence(triples, index, k=2) == 2
+    assert triples[0].evidence == ["s1", "s3"]
+    assert triples[1].evidence == ["s2"]  # unknown ids dropped, known ones kept
+    assert triples[2].evidence == ["s4"]  # untouched
+    assert triples[3].evidence == ["gone"]  # nothing to ground it on
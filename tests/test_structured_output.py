@@ -0,0 +1,124 @@
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter
+
+from gtflow.config import ProviderConfig
+from gtflow.models.json_schema import response_format_for, strict_schema
+from gtflow.models.schemas import AxialTriple, Codebook, GroupSummary, OpenCodingItem, Theory
+from gtflow.pipeline.open_coder import _parse_items, expand_compact
+from gtflow.pipeline.selective_coder import build_theory_hierarchical
+from gtflow.providers.mock import MockProvider
+
+ITEMS = TypeAdapter(List[OpenCodingItem])
+
+
+def test_expand_compact_short_keys():
+    entry = {"i": 7, "v": "it was fine", "c": [{"c": "coping", "d": "dealing", "e": "fine"}, "relief", {"d": "no code"}], "m": "memo"}
+    assert expand_compact(entry) == {
+        "seg_id": "7",
+        "in_vivo_phrases": ["it was fine"],
+        "initial_codes": [
+            {"code": "coping", "definition": "dealing", "evidence_span": "fine"},
+            {"code": "relief", "definition": None, "evidence_span": None},
+        ],
+        "quick_memo": "memo",
+    }
+
+
+def test_expand_compact_positional_list():
+    entry = ["s1", ["we waited"], [["waiting", "time spent idle", "we waited"], ["delay"]], None]
+    item = OpenCodingItem.model_validate(expand_compact(entry))
+    assert item.seg_id == "s1"
+    assert item.in_vivo_phrases == ["we waited"]
+    assert [(c.code, c.definition, c.evidence_span) for c in item.initial_codes] == [
+        ("waiting", "time spent idle", "we waited"),
+        ("delay", None, None),
+    ]
+    assert item.quick_memo is None
+
+
+def test_expand_compact_passes_verbose_items_through():
+    verbose = {"seg_id": "s1", "in_vivo_phrases": [], "initial_codes": [{"code": "x"}], "quick_memo": None}
+    assert expand_compact(verbose) is verbose
+    # an item carrying both layouts is treated as verbose
+    mixed = {"seg_id": "s1", "i": "s2"}
+    assert expand_compact(mixed) is mixed
+    assert expand_compact("text") == "text"
+
+
+def test_parse_items_accepts_both_layouts_in_one_reply():
+    raw = '{"items": [{"i": "s1", "c": [{"c": "coping"}]}, {"seg_id": "s2", "initial_codes": [{"code": "delay"}]}]}'
+    items = _parse_items(raw, ITEMS)
+    assert [(i.seg_id, i.initial_codes[0].code) for i in items] == [("s1", "coping"), ("s2", "delay")]
+
+
+def _objects(node):
+    if isinstance(node, dict):
+        if node.get("type") == "object":
+            yield node
+        for value in node.values():
+            yield from _objects(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _objects(value)
+
+
+def test_strict_schema_requires_every_property_and_forbids_extras():
+    schema = strict_schema(List[OpenCodingItem], wrap_key="items")
+    assert schema["required"] == ["items"]
+    assert schema["properties"]["items"]["type"] == "array"
+    objects = list(_objects(schema))
+    assert len(objects) == 3  # wrapper, OpenCodingItem, InitialCode
+    for obj in objects:
+        assert obj["additionalProperties"] is False
+        assert obj["required"] == list(obj["properties"])
+    assert "title" not in str(schema) and "default" not in schema["$defs"]["OpenCodingItem"]["properties"]["in_vivo_phrases"]
+    # optional fields stay nullable
+    memo = schema["$defs"]["OpenCodingItem"]["properties"]["quick_memo"]
+    assert {"type": "null"} in memo["anyOf"]
+
+
+def test_strict_schema_object_root_and_errors():
+    schema = strict_schema(Theory)
+    assert schema["type"] == "object"
+    assert schema["required"] == ["core_category", "rationale", "storyline"]
+    with pytest.raises(ValueError, match="wrap_key"):
+        strict_schema(List[OpenCodingItem])
+    with pytest.raises(ValueError, match="free-form"):
+        strict_schema(Codebook)
+
+
+def test_response_format_for_follows_the_provider_config():
+    strict = response_format_for(ProviderConfig(json_schema=True), Theory, name="theory")
+    assert strict["type"] == "json_schema"
+    assert strict["json_schema"]["name"] == "theory"
+    assert strict["json_schema"]["strict"] is True
+    assert strict["json_schema"]["schema"] == strict_schema(Theory)
+    # without a type (the codebook stage) or without json_schema: JSON mode
+    assert response_format_for(ProviderConfig(json_schema=True)) == {"type": "json_object"}
+    assert response_format_for(ProviderConfig(), Theory) == {"type": "json_object"}
+    assert response_format_for(ProviderConfig(structured=False), Theory) is None
+
+
+def test_hierarchical_theory_sends_a_schema_for_group_summaries():
+    class Recording(MockProvider):
+        def __init__(self, conf):
+            super().__init__(conf)
+            self.formats = []
+
+        def generate_text(self, messages, response_format=None, **kwargs):
+            self.formats.append(response_format)
+            return super().generate_text(messages, response_format=response_format, **kwargs)
+
+    triples = [AxialTriple(condition=f"condition {i}", action="act", result=f"result {i}", theme=f"theme {i % 3}") for i in range(9)]
+    provider = Recording(ProviderConfig(name="mock", json_schema=True, max_tokens=16000, mock_latency_sec=0.0))
+    theory = build_theory_hierarchical(provider, triples, group_size=3)
+    assert theory.core_category
+    names = [f["json_schema"]["name"] for f in provider.formats]
+    assert names == ["group_summary"] * 3 + ["theory"]
+    assert provider.formats[0]["json_schema"]["schema"] == strict_schema(GroupSummary)
+
+    provider = Recording(ProviderConfig(name="mock", max_tokens=16000, mock_latency_sec=0.0))
+    build_theory_hierarchical(provider, triples, group_size=3)
+    assert provider.formats == [{"type": "json_object"}] * 4
@@ -0,0 +1,73 @@
+import random
+import re
+
+import pytest
+
+from gtflow.utils import text_utils
+from gtflow.utils.text_utils import chunk_split, estimate_tokens, split_dialog
+
+WORDS = ["我们", "等待", "医生", "很久", "然后", "终于", "we", "waited", "for", "the", "doctor", "a", "long", "time"]
+BREAKS = ["，", "、", ",", " ", "：", ""]
+TERMINALS = ["。", "！", "？", "……", ". ", "! ", "? ", "」。", "\"."]
+
+
+def _text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(1, 30)):
+        for _ in range(rng.randint(1, 12)):
+            parts.append(rng.choice(WORDS) + rng.choice(BREAKS))
+        parts.append(rng.choice(TERMINALS))
+    return "".join(parts).strip()
+
+
+def _squash(s: str) -> str:
+    return re.sub(r"\s+", "", s)
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_chunks_fit_keep_the_text_and_end_at_sentence_ends(seed):
+    rng = random.Random(seed)
+    text = _text(rng)
+    max_chars = rng.randint(8, 120)
+    max_tokens = rng.choice([None, rng.randint(4, 40)])
+    chunks = chunk_split(text, max_chars, max_tokens)
+
+    assert all(chunks)
+    assert _squash("".join(chunks)) == _squash(text)
+    sentence_ends = {m.end() for m in text_utils._SENTENCE_END.finditer(text)}
+    pos = 0
+    for i, chunk in enumerate(chunks):
+        assert len(chunk) <= max_chars
+        if max_tokens is not None:
+            assert estimate_tokens(chunk) <= max_tokens
+        start = text.index(chunk, pos)
+        pos = start + len(chunk)
+        if i < len(chunks) - 1 and pos not in sentence_ends:
+            # cut at a clause break or hard: only when no sentence end fit in the window
+            assert not any(start < end < pos for end in sentence_ends), chunk
+
+
+def test_prefers_the_last_sentence_end_that_fits():
+    text = "我们等了很久。医生终于来了！然后呢？We waited, and waited. It was fine."
+    assert chunk_split(text, 12) == ["我们等了很久。", "医生终于来了！然后呢？", "We waited,", "and waited.", "It was fine."]
+    assert chunk_split(text, 500) == [text]
+
+
+def test_token_cap_counts_cjk_per_character():
+    assert chunk_split("我们等了很久医生终于来了然后呢", 100, max_tokens=5) == ["我们等了很", "久医生终于", "来了然后呢"]
+    # twenty Latin characters estimate to five tokens
+    assert chunk_split("abcd " * 4, 100, max_tokens=5) == ["abcd abcd abcd abcd"]
+
+
+def test_token_cap_goes_through_estimate_tokens(monkeypatch):
+    class OneTokenPerWord:
+        def encode(self, s, disallowed_special=()):
+            return s.split()
+
+    monkeypatch.setattr(text_utils, "_ENCODING", OneTokenPerWord())
+    assert chunk_split("one two three four five six", 100, max_tokens=2) == ["one two", "three four", "five six"]
+
+
+def test_split_dialog_keeps_speakers_per_chunk():
+    pairs = split_dialog("I: 你好。最近怎么样？\nP: 还行。\n就是有点累。", max_chars=6)
+    assert pairs == [("I", "你好。"), ("I", "最近怎么样？"), ("P", "还行。"), ("P", "就是有点累。")]
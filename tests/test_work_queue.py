@@ -0,0 +1,120 @@
+import time
+
+from gtflow.config import AppConfig, ProviderConfig, RunConfig
+from gtflow.work_queue import WorkQueue, collect_open_coding, run_worker
+
+
+def _queue(tmp_path):
+    return WorkQueue(str(tmp_path / "queue" / "jobs.db"))
+
+
+def _batch(*seg_ids):
+    return [{"seg_id": s, "text": f"text of {s}"} for s in seg_ids]
+
+
+def _result(worker, *seg_ids, tokens=10, skipped=()):
+    return {
+        "items": [{"seg_id": s, "initial_codes": [{"code": f"code {s}"}]} for s in seg_ids],
+        "usage": {"input_tokens": tokens, "output_tokens": tokens, "estimated_cost": 0.001},
+        "escalated": 0,
+        "worker": worker,
+        "skipped_seg_ids": list(skipped),
+    }
+
+
+def test_enqueue_is_idempotent_per_key(tmp_path):
+    queue = _queue(tmp_path)
+    assert queue.enqueue("run", "open_coding", [_batch("s1"), _batch("s2")]) == 2
+    assert queue.enqueue("run", "open_coding", [_batch("s1"), _batch("s2"), _batch("s3")]) == 1
+    assert queue.counts("run") == {"pending": 3, "leased": 0, "done": 0, "failed": 0}
+    # a second handle on the same file sees the same jobs
+    assert WorkQueue(queue.path).counts("run", "open_coding")["pending"] == 3
+
+
+def test_expired_lease_is_reclaimed_and_the_stale_holder_loses_its_result(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("run", "open_coding", [_batch("s1")])
+    first = queue.claim("w1", lease_sec=0.05)
+    assert first.attempts == 1
+    assert queue.claim("w2", lease_sec=60) is None  # leased and not expired yet
+    time.sleep(0.1)
+    second = queue.claim("w2", lease_sec=60)
+    assert (second.id, second.attempts) == (first.id, 2)
+    assert not queue.extend(first, "w1", 60)
+    assert not queue.complete(first, "w1", _result("w1", "s1"))
+    assert queue.complete(second, "w2", _result("w2", "s1"))
+    assert queue.results("run", "open_coding")[0]["result"]["worker"] == "w2"
+
+
+def test_lease_that_expires_max_attempts_times_fails_the_job(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("run", "open_coding", [_batch("s1"), _batch("s2")])
+    for _ in range(2):
+        job = queue.claim("crashing", lease_sec=0.01, max_attempts=2)
+        assert job.job_key == 0
+        time.sleep(0.03)
+    # the third claim gives up on batch 0 and moves on to batch 1
+    job = queue.claim("w", lease_sec=60, max_attempts=2)
+    assert job.job_key == 1
+    first = queue.results("run", "open_coding")[0]
+    assert (first["status"], first["attempts"]) == ("failed", 2)
+    assert first["error"] == "lease expired 2 times (worker lost)"
+
+
+def test_fail_retries_until_max_attempts(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("run", "open_coding", [_batch("s1")])
+    job = queue.claim("w1", lease_sec=60)
+    assert queue.fail(job, "w1", "RuntimeError: bad json", max_attempts=3)
+    assert queue.counts("run")["pending"] == 1
+    # only the lease holder may fail a job
+    job = queue.claim("w2", lease_sec=60)
+    assert not queue.fail(job, "w1", "late", max_attempts=3)
+    assert queue.fail(job, "w2", "RuntimeError: timeout", max_attempts=3)
+    job = queue.claim("w3", lease_sec=60)
+    assert job.attempts == 3
+    assert queue.fail(job, "w3", "RuntimeError: timeout again", max_attempts=3)
+    assert queue.counts("run") == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+    assert queue.claim("w4", lease_sec=60) is None
+    assert queue.results("run", "open_coding")[0]["error"] == "RuntimeError: timeout again"
+
+
+def test_claim_is_scoped_by_run_and_kind(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("a", "open_coding", [_batch("s1")])
+    queue.enqueue("b", "other", [_batch("s2")])
+    assert queue.claim("w", 60, kinds=["open_coding"], run_id="b") is None
+    assert queue.claim("w", 60, kinds=["open_coding"]).run_id == "a"
+    assert queue.claim("w", 60, run_id="b").kind == "other"
+
+
+def test_collect_open_coding_merges_in_batch_order(tmp_path):
+    queue = _queue(tmp_path)
+    queue.enqueue("run", "open_coding", [_batch("s1", "s2"), _batch("s3"), _batch("s4", "s5"), _batch("s6")])
+    jobs = [queue.claim(f"w{i % 2}", lease_sec=60) for i in range(4)]
+    # finish out of order: batch 3, then 2 (budget skipped s5), then 0; batch 1 fails for good
+    queue.complete(jobs[3], "w1", _result("w1", "s6"))
+    queue.complete(jobs[2], "w0", _result("w0", "s4", skipped=["s5"]))
+    queue.fail(jobs[1], "w1", "RuntimeError: boom", max_attempts=1)
+    queue.complete(jobs[0], "w0", _result("w0", "s1", "s2", tokens=5))
+
+    merged = collect_open_coding(queue, "run")
+    assert [item["seg_id"] for item in merged["items"]] == ["s1", "s2", "s4", "s6"]
+    assert merged["skipped_seg_ids"] == ["s3", "s5"]
+    assert merged["errors"] == ["batch 1: RuntimeError: boom"]
+    assert merged["usage"] == {"input_tokens": 25, "output_tokens": 25, "total_tokens": 50, "estimated_cost": 0.003}
+    assert merged["workers"] == ["w0", "w1"]
+    assert merged["batches"] == 4
+
+
+def test_run_worker_drains_the_queue_with_the_mock_provider(tmp_path):
+    conf = AppConfig(provider=ProviderConfig(name="mock", max_tokens=4000, mock_latency_sec=0.0), run=RunConfig(rate_limit_rps=100))
+    queue = _queue(tmp_path)
+    queue.enqueue("run", "open_coding", [_batch("s1", "s2"), _batch("s3")])
+    logs = []
+    stats = run_worker(queue, conf, worker_id="w", run_id="run", idle_exit_sec=0, poll_sec=0.01, log=logs.append)
+    assert stats == {"done": 2, "failed": 0}
+    merged = collect_open_coding(queue, "run")
+    assert [item["seg_id"] for item in merged["items"]] == ["s1", "s2", "s3"]
+    assert merged["workers"] == ["w"] and merged["usage"]["total_tokens"] > 0
+    assert len(logs) == 2